@@ -20,10 +20,30 @@ export default function BirthChart() {
   const [loading, setLoading] = useState(false);
   const chartRef = useRef(null);
   const [chartType, setChartType] = useState('south'); // 'south' or 'north'
+  const [placeSuggestions, setPlaceSuggestions] = useState([]);
 
   const handleChange = (e) => {
     setFormData({ ...formData, [e.target.name]: e.target.value });
   };
+
+  // Offline place autocomplete; picking a suggestion fills in its coordinates
+  const handlePlaceChange = async (e) => {
+    const place = e.target.value;
+    const picked = placeSuggestions.find((p) => p.label === place);
+    if (picked) {
+      setFormData({ ...formData, place, lat: String(picked.lat), lon: String(picked.lon) });
+      return;
+    }
+    setFormData({ ...formData, place });
+    if (place.trim().length < 2) return;
+    try {
+      const baseUrl = import.meta.env.VITE_API_URL || 'http://localhost:8000/api';
+      const res = await axios.get(`${baseUrl}/astronomy/places`, { params: { q: place, limit: 8 } });
+      setPlaceSuggestions(res.data.results);
+    } catch (err) {
+      console.error(err);
+    }
+  };
   
 // ... (keep generateChart same)
 
@@ -32,10 +52,17 @@ export default function BirthChart() {
     setLoading(true);
     try {
       const baseUrl = import.meta.env.VITE_API_URL || 'http://localhost:8000/api';
-      const res = await axios.post(`${baseUrl}/astronomy/chart`, {
-        ...formData,
-        lat: parseFloat(formData.lat),
-        lon: parseFloat(formData.lon)
+      // Canonical GET form (fixed param order, 4-decimal coordinates) so repeat
+      // views of the same chart are served from the HTTP cache
+      const res = await axios.get(`${baseUrl}/astronomy/chart`, {
+        params: {
+          dob: formData.dob,
+          time: formData.time,
+          lat: parseFloat(formData.lat).toFixed(4),
+          lon: parseFloat(formData.lon).toFixed(4),
+          ayanamsa: 'lahiri',
+          house_system: 'W'
+        }
       });
       setChartData(res.data);
     } catch (err) {
@@ -110,6 +137,23 @@ export default function BirthChart() {
                   </div>
                 </div>
 
+                <div>
+                  <label className="block text-xs font-medium text-slate-400 uppercase tracking-wider mb-1">Place of Birth</label>
+                  <div className="relative">
+                    <MapPin className="absolute left-3 top-3 text-slate-500" size={16} />
+                    <input 
+                      type="text" name="place" list="place-suggestions" autoComplete="off"
+                      value={formData.place} onChange={handlePlaceChange}
+                      className="w-full bg-slate-800 border-slate-700 rounded-lg pl-10 py-2.5 text-white focus:ring-purple-500 focus:border-purple-500"
+                    />
+                    <datalist id="place-suggestions">
+                      {placeSuggestions.map((p) => (
+                        <option key={p.label} value={p.label} />
+                      ))}
+                    </datalist>
+                  </div>
+                </div>
+
                 <div className="grid grid-cols-2 gap-3">
                   <div>
                     <label className="block text-xs font-medium text-slate-400 uppercase tracking-wider mb-1">Latitude</label>
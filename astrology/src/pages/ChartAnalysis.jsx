@@ -1,5 +1,4 @@
 import { useState } from 'react';
-import axios from 'axios';
 import { motion } from 'framer-motion';
 import { Calendar, Clock, MapPin, Sparkles, BookOpen, Heart, Briefcase, Activity } from 'lucide-react';
 import bgImage from '../assets/birthchart_bg.png'; // Reusing the background
@@ -24,18 +23,45 @@ export default function ChartAnalysis() {
   const generateAnalysis = async (e) => {
     e.preventDefault();
     setLoading(true);
+    setAnalysis(null);
     try {
       const baseUrl = import.meta.env.VITE_API_URL || 'http://localhost:8000/api';
-      const res = await axios.post(`${baseUrl}/astrology/analyze_chart`, {
-        ...formData,
-        lat: parseFloat(formData.lat),
-        lon: parseFloat(formData.lon)
+      // Sections are streamed as Server-Sent Events and rendered as soon as each one arrives
+      const res = await fetch(`${baseUrl}/astrology/analyze_chart/stream`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+          ...formData,
+          lat: parseFloat(formData.lat),
+          lon: parseFloat(formData.lon)
+        })
       });
-      setAnalysis(res.data);
+      if (!res.ok) {
+        const body = await res.json().catch(() => ({}));
+        throw new Error(body.detail || "Error generating analysis. Please try again.");
+      }
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      for (;;) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        for (const raw of events) {
+          const name = raw.match(/^event: (.*)$/m)?.[1];
+          const data = raw.match(/^data: (.*)$/m)?.[1];
+          if (name === 'section' && data) {
+            const { key, value: section } = JSON.parse(data);
+            setAnalysis((prev) => ({ ...prev, [key]: section }));
+            setLoading(false);
+          }
+        }
+      }
     } catch (err) {
       console.error(err);
-      const msg = err.response?.data?.detail || "Error generating analysis. Please try again.";
-      alert(msg);
+      alert(err.message || "Error generating analysis. Please try again.");
     } finally {
       setLoading(false);
     }
@@ -156,7 +182,7 @@ export default function ChartAnalysis() {
                             <div className="bg-slate-900/80 border border-slate-700 rounded-xl p-6">
                                 <h3 className="text-xl font-bold text-blue-300 mb-4">Planetary Positions</h3>
                                 <div className="space-y-3">
-                                    {analysis.planetary_details.map((p, idx) => (
+                                    {analysis.planetary_details?.map((p, idx) => (
                                         <div key={idx} className="flex flex-col md:flex-row md:items-center justify-between bg-slate-800/30 p-3 rounded-lg border border-slate-700/50">
                                             <div className="mb-2 md:mb-0">
                                                 <span className="font-bold text-white block">{p.planet}</span>
@@ -173,13 +199,13 @@ export default function ChartAnalysis() {
                                 <div className="bg-slate-900/80 border border-green-900/30 rounded-xl p-6">
                                     <h3 className="text-lg font-bold text-green-400 mb-3">Strengths</h3>
                                     <ul className="list-disc list-inside space-y-2 text-slate-300 text-sm">
-                                        {analysis.strengths.map((s, i) => <li key={i}>{s}</li>)}
+                                        {analysis.strengths?.map((s, i) => <li key={i}>{s}</li>)}
                                     </ul>
                                 </div>
                                 <div className="bg-slate-900/80 border border-red-900/30 rounded-xl p-6">
                                     <h3 className="text-lg font-bold text-red-400 mb-3">Challenges</h3>
                                     <ul className="list-disc list-inside space-y-2 text-slate-300 text-sm">
-                                        {analysis.challenges.map((s, i) => <li key={i}>{s}</li>)}
+                                        {analysis.challenges?.map((s, i) => <li key={i}>{s}</li>)}
                                     </ul>
                                 </div>
                             </div>
@@ -192,19 +218,19 @@ export default function ChartAnalysis() {
                                         <div className="flex items-center gap-2 mb-2 text-indigo-200 font-semibold">
                                             <Briefcase size={16} /> Career
                                         </div>
-                                        <p className="text-sm text-slate-300 leading-relaxed">{analysis.life_predictions.career}</p>
+                                        <p className="text-sm text-slate-300 leading-relaxed">{analysis.life_predictions?.career}</p>
                                     </div>
                                     <div>
                                         <div className="flex items-center gap-2 mb-2 text-pink-200 font-semibold">
                                             <Heart size={16} /> Relationships
                                         </div>
-                                        <p className="text-sm text-slate-300 leading-relaxed">{analysis.life_predictions.relationships}</p>
+                                        <p className="text-sm text-slate-300 leading-relaxed">{analysis.life_predictions?.relationships}</p>
                                     </div>
                                     <div>
                                         <div className="flex items-center gap-2 mb-2 text-green-200 font-semibold">
                                             <Activity size={16} /> Health
                                         </div>
-                                        <p className="text-sm text-slate-300 leading-relaxed">{analysis.life_predictions.health}</p>
+                                        <p className="text-sm text-slate-300 leading-relaxed">{analysis.life_predictions?.health}</p>
                                     </div>
                                 </div>
                             </div>
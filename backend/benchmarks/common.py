@@ -0,0 +1,113 @@
+"""
+Timing summaries and baseline comparison shared by the benchmark scripts.
+
+Baselines live in benchmarks/baselines.json, one section per script. A run
+fails the check when p50 or p95 latency grows, or throughput drops, by more
+than the threshold relative to the stored baseline; p99 and max are reported
+but too noisy to gate on. Baselines are machine specific: record them with
+--save on the machine the checks run on.
+"""
+import datetime
+import json
+import os
+import platform
+
+import numpy as np
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+DEFAULT_THRESHOLD = 0.25
+
+# metric -> True when a larger value is worse
+GATED_METRICS = {"p50_ms": True, "p95_ms": True, "rps": False}
+
+
+def summarize(samples, elapsed):
+    """Latency percentiles (ms) and throughput for per-call durations in seconds over elapsed seconds"""
+    ms = np.asarray(samples, dtype=float) * 1000.0
+    return {
+        "n": int(ms.size),
+        "mean_ms": round(float(ms.mean()), 4),
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p95_ms": round(float(np.percentile(ms, 95)), 4),
+        "p99_ms": round(float(np.percentile(ms, 99)), 4),
+        "max_ms": round(float(ms.max()), 4),
+        "rps": round(ms.size / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+
+
+def format_row(name, summary, extra=""):
+    return (f"{name:<24} n={summary['n']:<6} p50={summary['p50_ms']:>10.3f}ms p95={summary['p95_ms']:>10.3f}ms "
+            f"p99={summary['p99_ms']:>10.3f}ms {summary['rps']:>10.1f}/s{extra}")
+
+
+def load_baselines(path=BASELINES_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baselines(section, results, config, path=BASELINES_PATH):
+    """
+    Record results in one section (e.g. "functions") of the baselines file.
+    Entries not in results are kept if they were recorded with the same config.
+    """
+    baselines = load_baselines(path)
+    previous = baselines.get(section)
+    if previous is not None and previous.get("config") == config:
+        results = {**previous["results"], **results}
+    baselines[section] = {
+        "recorded": datetime.datetime.now().isoformat(timespec="seconds"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": config,
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def check_regressions(section, results, config, threshold=DEFAULT_THRESHOLD, path=BASELINES_PATH):
+    """List of human-readable regressions against the stored baseline (empty when none or no baseline)"""
+    baseline = load_baselines(path).get(section)
+    if baseline is None:
+        print(f"No '{section}' baseline in {path}; run with --save to record one")
+        return []
+    if baseline.get("config") != config:
+        print(f"Warning: '{section}' baseline was recorded with {baseline.get('config')}, this run uses {config}")
+
+    failures = []
+    for name, summary in results.items():
+        reference = baseline["results"].get(name)
+        if reference is None:
+            continue
+        for metric, larger_is_worse in GATED_METRICS.items():
+            old, new = reference.get(metric), summary.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old if larger_is_worse else (old - new) / old
+            if change > threshold:
+                failures.append(f"{name}: {metric} {old:g} -> {new:g} ({change:+.0%} worse, limit {threshold:.0%})")
+    return failures
+
+
+def add_baseline_arguments(parser):
+    parser.add_argument("--save", action="store_true", help="record this run as the baseline")
+    parser.add_argument("--check", action="store_true", help="exit 1 if a metric regressed past --threshold")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"allowed relative regression (default {DEFAULT_THRESHOLD})")
+
+
+def finish(args, section, results, config):
+    """Apply --save / --check; returns the process exit code"""
+    if args.save:
+        save_baselines(section, results, config)
+        print(f"Saved '{section}' baseline to {BASELINES_PATH}")
+    if args.check:
+        failures = check_regressions(section, results, config, args.threshold)
+        for failure in failures:
+            print(f"REGRESSION {failure}")
+        if failures:
+            return 1
+        print("No regressions")
+    return 0
@@ -0,0 +1,98 @@
+"""
+Function-level benchmarks for the chart, analysis, prediction and match paths.
+
+Run from backend/:
+
+    python -m benchmarks.functions                  # print timings
+    python -m benchmarks.functions --check          # exit 1 on a regression against baselines.json
+    python -m benchmarks.functions --save           # record this run as the baseline
+
+Charts are computed in the benchmark process with the chart cache disabled
+and every iteration uses a different birth, so the timings are the cost of
+the computation rather than of a cache hit.
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("CHART_WORKERS", "0")
+os.environ.setdefault("CHART_CACHE_SIZE", "0")
+
+from benchmarks.common import add_baseline_arguments, finish, format_row, summarize
+from routers import astrology, astronomy
+from services.vedic import ZODIAC_SIGNS
+
+
+def birth_details(rng, model):
+    start = datetime.date(1950, 1, 1)
+    dob = start + datetime.timedelta(days=rng.randrange(365 * 60))
+    return model(
+        dob=dob.isoformat(), time=f"{rng.randrange(24):02d}:{rng.randrange(60):02d}", place="Bench",
+        lat=round(rng.uniform(8.0, 32.0), 4), lon=round(rng.uniform(70.0, 90.0), 4),
+    )
+
+
+def match_profile(rng, name, gender):
+    details = birth_details(rng, astrology.BirthDetails)
+    return astronomy.MatchProfile(name=name, dob=details.dob, time=details.time, gender=gender)
+
+
+def cases(rng, iterations):
+    """name -> list of argument tuples, one per iteration"""
+    pairs = [(match_profile(rng, f"Boy{i}", "male"), match_profile(rng, f"Girl{i}", "female")) for i in range(iterations)]
+    dates = [(datetime.date(2026, 1, 1) + datetime.timedelta(days=i)).isoformat() for i in range(iterations)]
+    return {
+        "calculate_positions": (astrology.calculate_positions,
+                                [(birth_details(rng, astrology.BirthDetails),) for _ in range(iterations)]),
+        "calculate_chart": (astronomy.calculate_chart,
+                            [(birth_details(rng, astronomy.BirthDetails),) for _ in range(iterations)]),
+        "get_local_analysis": (astrology.get_local_analysis,
+                               [(birth_details(rng, astrology.BirthDetails),) for _ in range(iterations)]),
+        "get_local_prediction": (astrology.get_local_prediction,
+                                 [(rng.choice(ZODIAC_SIGNS), date) for date in dates]),
+        "compute_guna_milan": (astronomy.compute_guna_milan, pairs),
+        "get_local_match": (astronomy.get_local_match,
+                            [(boy.name, girl.name, astronomy.compute_guna_milan(boy, girl)) for boy, girl in pairs]),
+    }
+
+
+def run(fn, calls, warmup):
+    for args in calls[:warmup]:
+        fn(*args)
+    samples = []
+    started = time.perf_counter()
+    for args in calls:
+        t0 = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - t0)
+    return summarize(samples, time.perf_counter() - started)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the chart, analysis, prediction and match functions")
+    parser.add_argument("--iterations", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--only", help="comma-separated benchmark names")
+    parser.add_argument("--seed", type=int, default=1)
+    add_baseline_arguments(parser)
+    args = parser.parse_args(argv)
+
+    selected = cases(random.Random(args.seed), args.iterations)
+    if args.only:
+        selected = {name: selected[name] for name in args.only.split(",")}
+
+    results = {}
+    for name, (fn, calls) in selected.items():
+        results[name] = run(fn, calls, args.warmup)
+        print(format_row(name, results[name]))
+
+    config = {"iterations": args.iterations, "chart_workers": os.environ["CHART_WORKERS"],
+              "chart_cache_size": os.environ["CHART_CACHE_SIZE"]}
+    return finish(args, "functions", results, config)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+"""
+End-to-end load test: concurrent clients against the FastAPI app, with the
+Gemini upstream replaced by benchmarks.stub.
+
+Run from backend/:
+
+    python -m benchmarks.load                                   # all scenarios
+    python -m benchmarks.load --scenarios analysis,match --latency 0.5 --error-rate 0.1
+    python -m benchmarks.load --check                           # exit 1 on a regression
+    python -m benchmarks.load --save                            # record this run as the baseline
+
+The stub and the app (uvicorn main:app) are started as subprocesses on free
+ports; the app gets a throwaway prediction cache and no pre-generation, so
+every run starts cold. Each scenario sends --requests requests from
+--concurrency clients and reports latency percentiles, requests/sec, the
+number of failed requests (non-2xx or transport error) and the upstream
+calls and upstream errors it caused (the app answers those from its local
+fallbacks, so they are not failed requests).
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.common import add_baseline_arguments, finish, format_row, summarize
+from services.vedic import ZODIAC_SIGNS
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def birth(rng):
+    dob = datetime.date(1950, 1, 1) + datetime.timedelta(days=rng.randrange(365 * 60))
+    return {"dob": dob.isoformat(), "time": f"{rng.randrange(24):02d}:{rng.randrange(60):02d}", "place": "Bench",
+            "lat": round(rng.uniform(8.0, 32.0), 4), "lon": round(rng.uniform(70.0, 90.0), 4)}
+
+
+def chart_request(rng):
+    return "/api/astronomy/chart", birth(rng)
+
+
+def analysis_request(rng):
+    return "/api/astrology/analyze_chart", birth(rng)
+
+
+def prediction_request(rng):
+    # A week of dates: the first request per date misses and batches all twelve signs
+    date = (datetime.date.today() + datetime.timedelta(days=rng.randrange(7))).isoformat()
+    return "/api/astrology/predict", {"rasi": rng.choice(ZODIAC_SIGNS), "nakshatra": "Ashwini", "date": date}
+
+
+def match_request(rng):
+    boy, girl = birth(rng), birth(rng)
+    return "/api/astronomy/match", {
+        "boy": {"name": f"Boy{rng.randrange(10**6)}", "dob": boy["dob"], "time": boy["time"], "gender": "male"},
+        "girl": {"name": f"Girl{rng.randrange(10**6)}", "dob": girl["dob"], "time": girl["time"], "gender": "female"},
+    }
+
+
+SCENARIOS = {
+    "chart": chart_request,
+    "analysis": analysis_request,
+    "prediction": prediction_request,
+    "match": match_request,
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_process(args, env, url, timeout=60.0):
+    """Start a server subprocess and wait until url answers"""
+    process = subprocess.Popen([sys.executable, *args], cwd=BACKEND_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{' '.join(args)} exited: {process.stderr.read().decode(errors='replace')[-2000:]}")
+        try:
+            httpx.get(url, timeout=1.0)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{' '.join(args)} did not start within {timeout}s")
+
+
+def stop_process(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+async def run_scenario(base_url, make_request, requests, concurrency, seed):
+    rng = random.Random(seed)
+    calls = [make_request(rng) for _ in range(requests)]
+    samples = []
+    failures = 0
+    next_call = iter(calls)
+
+    async def client(http):
+        nonlocal failures
+        for path, body in next_call:
+            t0 = time.perf_counter()
+            try:
+                response = await http.post(path, json=body)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            samples.append(time.perf_counter() - t0)
+            failures += not ok
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as http:
+        started = time.perf_counter()
+        await asyncio.gather(*(client(http) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    summary = summarize(samples, elapsed)
+    summary["failed"] = failures
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the API against a local Gemini stub")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated: " + ", ".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.2, help="stub reply latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of stub calls failing with 503")
+    parser.add_argument("--seed", type=int, default=1)
+    add_baseline_arguments(parser)
+    args = parser.parse_args(argv)
+    scenarios = args.scenarios.split(",")
+
+    stub_port, app_port = free_port(), free_port()
+    stub_url, app_url = f"http://127.0.0.1:{stub_port}", f"http://127.0.0.1:{app_port}"
+    cache_dir = tempfile.TemporaryDirectory(prefix="astro-load-")
+    env = dict(os.environ)
+    env.update(
+        GEMINI_API_KEY=env.get("GEMINI_API_KEY") or "bench-key",
+        GEMINI_BASE_URL=stub_url,
+        PREDICTION_CACHE_PATH=os.path.join(cache_dir.name, "predictions.sqlite3"),
+        PREDICTION_PREFETCH="0",
+        PYTHONPATH=BACKEND_DIR,
+    )
+
+    stub = start_process(["-m", "benchmarks.stub", "--port", str(stub_port), "--latency", str(args.latency),
+                          "--error-rate", str(args.error_rate)], env, f"{stub_url}/stub/state")
+    app = None
+    results = {}
+    try:
+        app = start_process(["-m", "uvicorn", "main:app", "--port", str(app_port), "--log-level", "warning"],
+                            env, f"{app_url}/")
+        for name in scenarios:
+            before = httpx.get(f"{stub_url}/stub/state").json()
+            summary = asyncio.run(run_scenario(app_url, SCENARIOS[name], args.requests, args.concurrency,
+                                               args.seed + list(SCENARIOS).index(name)))
+            after = httpx.get(f"{stub_url}/stub/state").json()
+            summary["upstream_calls"] = after["calls"] - before["calls"]
+            summary["upstream_errors"] = after["errors"] - before["errors"]
+            results[name] = summary
+            print(format_row(name, summary, f" failed={summary['failed']} upstream={summary['upstream_calls']}"
+                                            f" upstream_errors={summary['upstream_errors']}"))
+    finally:
+        if app is not None:
+            stop_process(app)
+        stop_process(stub)
+        cache_dir.cleanup()
+
+    config = {"requests": args.requests, "concurrency": args.concurrency, "latency": args.latency,
+              "error_rate": args.error_rate}
+    return finish(args, "load", results, config)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+Local stand-in for the Gemini API, for load tests and offline development.
+
+    python -m benchmarks.stub --port 8765 --latency 0.2 --error-rate 0.05
+
+Serves generateContent and streamGenerateContent?alt=sse with well-formed
+replies for each prompt the backend sends (chart analysis, batched daily
+predictions, matchmaking), after `latency` seconds and failing a fraction
+`error_rate` of calls with 503. Point the backend at it with
+GEMINI_BASE_URL=http://127.0.0.1:8765. Settings can be changed while it runs
+with POST /stub/state and call counts are read from GET /stub/state.
+"""
+import argparse
+import asyncio
+import json
+import random
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Gemini stub")
+
+state = {"latency": 0.2, "error_rate": 0.0, "calls": 0, "errors": 0, "streams": 0}
+
+ANALYSIS_REPLY = {
+    "ascendant": "A composed, purposeful presence shaped by the rising sign.",
+    "moon_sign": "An emotional core that seeks steadiness and quiet reflection.",
+    "planetary_details": [
+        {"planet": planet, "sign": "Aries", "house": str(house), "significance": "Influence"}
+        for house, planet in enumerate(["Sun", "Moon", "Mars", "Mercury", "Jupiter", "Venus", "Saturn", "Rahu", "Ketu"], 1)
+    ],
+    "strengths": ["Resilience", "Clear judgement", "Loyalty"],
+    "challenges": ["Impatience", "Overwork"],
+    "life_predictions": {"career": "Steady growth.", "relationships": "Deep bonds.", "health": "Keep a routine."},
+}
+
+
+def reply_for(prompt):
+    """Reply text for a prompt, recognised by the output format it asks for"""
+    if "SIGNS:" in prompt:
+        signs = [sign.strip() for sign in prompt.split("SIGNS:", 1)[1].splitlines()[0].split(",")]
+        return json.dumps({
+            sign: {"rasi_prediction": f"A day of steady progress for {sign}.",
+                   "nakshatra_guidance": "Trust your intuition.", "daily_focus": "Career"}
+            for sign in signs
+        })
+    if "planetary_details" in prompt:
+        return json.dumps(ANALYSIS_REPLY)
+    if '"score"' in prompt:
+        return json.dumps({"score": 24, "verdict": "Good Match", "analysis": "A balanced union."})
+    return "A day of steady progress.|Trust your intuition.|Career"
+
+
+async def answer(request):
+    """(reply text, None) after the configured latency, or (None, error response)"""
+    state["calls"] += 1
+    await asyncio.sleep(state["latency"])
+    if random.random() < state["error_rate"]:
+        state["errors"] += 1
+        return None, JSONResponse({"error": {"code": 503, "message": "stub overload"}}, status_code=503)
+    body = await request.json()
+    return reply_for(body["contents"][0]["parts"][0]["text"]), None
+
+
+@app.post("/v1beta/models/{model}:generateContent")
+async def generate(model: str, request: Request):
+    text, error = await answer(request)
+    if error is not None:
+        return error
+    return {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+
+
+@app.post("/v1beta/models/{model}:streamGenerateContent")
+async def stream_generate(model: str, request: Request):
+    state["streams"] += 1
+    text, error = await answer(request)
+    if error is not None:
+        return error
+
+    async def events():
+        # Roughly token-sized chunks
+        for start in range(0, len(text), 40):
+            chunk = {"candidates": [{"content": {"parts": [{"text": text[start:start + 40]}]}}]}
+            yield f"data: {json.dumps(chunk)}\r\n\r\n"
+            await asyncio.sleep(0.005)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/stub/state")
+def get_state():
+    return state
+
+
+@app.post("/stub/state")
+async def set_state(request: Request):
+    state.update(await request.json())
+    return state
+
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve a local Gemini stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before each reply")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with 503")
+    args = parser.parse_args(argv)
+    state.update(latency=args.latency, error_rate=args.error_rate)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,49 @@
+from contextlib import asynccontextmanager
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
+from starlette.concurrency import run_in_threadpool
 from routers import astrology, astronomy
+from services.chart_engine import get_chart_engine, shutdown_chart_engine
+from services.current_sky import start_current_sky, stop_current_sky
+from services.events import start_catalog_build
+from services.gazetteer import get_gazetteer
+from services.gemini_client import close_gemini_client
+from services.logging_setup import setup_logging, stop_logging
+from services.metrics import CONTENT_TYPE, ServerTimingMiddleware, render_metrics
+from services.panchang import precompute_panchang
+from services.prediction_cache import get_prediction_cache
+from services.prediction_scheduler import start_prediction_scheduler, stop_prediction_scheduler
+import os
 
-app = FastAPI(title="Astronomy & Astrology API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Structured logs through a background writer; LOG_LEVEL=DEBUG for per-chart dumps
+    setup_logging()
+    # Spawn the chart worker processes before the first request needs them
+    await run_in_threadpool(get_chart_engine().start)
+    # Map the place index (building it from the bundled cities file on first run)
+    await run_in_threadpool(get_gazetteer)
+    # Pre-generate daily predictions so /predict is served from the cache
+    if astrology.GEMINI_API_KEY and os.getenv("PREDICTION_PREFETCH", "1") != "0":
+        start_prediction_scheduler(get_prediction_cache(), astrology.get_prediction_loader().fill, astrology.ZODIAC_SIGNS)
+    # Fill a year of Panchang for the PANCHANG_PRECOMPUTE cities without delaying startup
+    panchang_precompute = asyncio.ensure_future(run_in_threadpool(precompute_panchang))
+    # The eclipse/conjunction catalog is prebuilt; a missing one is reported (or, if enabled, built in another process)
+    start_catalog_build()
+    # Compute the live "current sky" once per minute for every connected client
+    start_current_sky()
+    yield
+    await stop_current_sky()
+    panchang_precompute.cancel()
+    await stop_prediction_scheduler()
+    # Release pooled keep-alive connections to the LLM upstream
+    await close_gemini_client()
+    shutdown_chart_engine()
+    stop_logging()
+
+app = FastAPI(title="Astronomy & Astrology API", lifespan=lifespan)
 
 # Allow CORS for Frontend
 app.add_middleware(
@@ -11,7 +52,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
+# Per-request latency histograms and the Server-Timing header
+app.add_middleware(ServerTimingMiddleware)
 
 app.include_router(astrology.router)
 app.include_router(astronomy.router)
@@ -20,6 +64,11 @@ app.include_router(astronomy.router)
 def read_root():
     return {"message": "Welcome to the Astrology & Astronomy API"}
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus scrape endpoint: stage, request, LLM latency histograms and fallback counters"""
+    return Response(render_metrics(), media_type=CONTENT_TYPE)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
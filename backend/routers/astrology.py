@@ -1,214 +1,125 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from typing import List, Optional
+from starlette.concurrency import run_in_threadpool
 import os
-import requests
 import json
+import logging
 import random
-import swisseph as swe
+import time
 import datetime
 import pytz
 from dotenv import load_dotenv
+from services import dasha
+from services.chart_core import bodies_by_name, birth_time_utc, chart_job, compute_chart
+from services.gazetteer import resolve_coordinates
+from services.gemini_client import extract_json, get_gemini_client
+from services.interpretation import house_of, interpret_chart
+from services.json_stream import ObjectStreamParser
+from services.metrics import fallback_counts, record_fallback, timed
+from services.prediction_batch import DayBatchLoader
+from services.prediction_cache import get_prediction_cache
+from services.prediction_scheduler import get_prediction_scheduler
+from services.transits import describe_transits
+from services.vedic import ZODIAC_SIGNS, datetime_to_jd, jd_to_iso
 
 load_dotenv()
 
 router = APIRouter(prefix="/api/astrology", tags=["Astrology"])
 
+logger = logging.getLogger(__name__)
+
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GEMINI_ANALYSIS_KEY = os.getenv("GEMINI_ANALYSIS_KEY") or GEMINI_API_KEY
 
+# Per-endpoint upstream deadlines (seconds), including time queued for a connection slot
+PREDICTION_DEADLINE = float(os.getenv("GEMINI_PREDICTION_DEADLINE", 8))
+ANALYSIS_DEADLINE = float(os.getenv("GEMINI_ANALYSIS_DEADLINE", 15))
+
 class BirthDetails(BaseModel):
     dob: str
     time: str
     place: str
-    lat: float
-    lon: float
+    lat: Optional[float] = None  # looked up from place when lat/lon are omitted
+    lon: Optional[float] = None
+    timezone: Optional[str] = None  # IANA zone of the birth time; resolved from the place/coordinates when omitted
+
+# Grahas reported to the interpretation layer, in display order
+GRAHA_NAMES = ["Sun", "Moon", "Mars", "Mercury", "Jupiter", "Venus", "Saturn", "Rahu"]
 
-# Utility to Calculate Exact Positions (Reused logic from Astronomy)
 def calculate_positions(data: BirthDetails):
     try:
         # Parse Input
         try:
-            year, month, day = map(int, data.dob.split('-'))
-            hour, minute = map(int, data.time.split(':'))
+            with timed("parse"):
+                lat, lon, place = resolve_coordinates(data.place, data.lat, data.lon)
+                dt_utc, _ = birth_time_utc(data.dob, data.time, lat, lon, data.timezone, place)
         except ValueError:
             return None # Fail gracefully
 
-        # Handle Timezone: Assuming Input is Indian Standard Time (IST) -> UTC
-        dt_ist = datetime.datetime(year, month, day, hour, minute)
-        dt_utc = dt_ist - datetime.timedelta(hours=5, minutes=30)
-        
-        jd = swe.julday(dt_utc.year, dt_utc.month, dt_utc.day, dt_utc.hour + dt_utc.minute/60.0 + dt_utc.second/3600.0)
-
-        swe.set_sid_mode(swe.SIDM_LAHIRI) # Lahiri Ayanamsa
-        swe.set_ephe_path('') 
-        flags = swe.FLG_MOSEPH | swe.FLG_SIDEREAL | swe.FLG_SPEED 
+        # Same chart (Lahiri, Whole Sign) as /api/astronomy/chart, so it is shared through the chart cache
+        job = chart_job(dt_utc, lat, lon)
+        raw = compute_chart(job)
+        bodies = bodies_by_name(raw)
 
-        planets_map = {
-            swe.SUN: "Sun", swe.MOON: "Moon", swe.MARS: "Mars", swe.MERCURY: "Mercury",
-            swe.JUPITER: "Jupiter", swe.VENUS: "Venus", swe.SATURN: "Saturn", swe.MEAN_NODE: "Rahu"
-        }
+        # Ascendant
+        asc_lon = raw["ascmc"][0]
+        asc_idx = int(asc_lon // 30)
+        ascendant = ZODIAC_SIGNS[asc_idx]
 
         positions = []
         rahu_lon = 0
-        
-        # Calculate Signs (0=Aries, 1=Taurus...)
-        zodiac_signs = ["Aries", "Taurus", "Gemini", "Cancer", "Leo", "Virgo", "Libra", "Scorpio", "Sagittarius", "Capricorn", "Aquarius", "Pisces"]
 
-        for pid, name in planets_map.items():
-            res = swe.calc_ut(jd, pid, flags)
-            lon = res[0][0]
+        # Calculate Signs (0=Aries, 1=Taurus...) and whole-sign houses from the ascendant
+        for name in GRAHA_NAMES:
+            lon, _ = bodies[name]
             sign_idx = int(lon // 30)
-            sign_name = zodiac_signs[sign_idx]
-            positions.append({"name": name, "sign": sign_name, "lon": lon})
+            positions.append({"name": name, "sign": ZODIAC_SIGNS[sign_idx], "lon": lon,
+                              "house": house_of(sign_idx, asc_idx)})
             if name == "Rahu":
                 rahu_lon = lon
 
         # Ketu
         ketu_lon = (rahu_lon + 180.0) % 360.0
         ketu_idx = int(ketu_lon // 30)
-        positions.append({"name": "Ketu", "sign": zodiac_signs[ketu_idx], "lon": ketu_lon})
-
-        # Ascendant
-        houses_res, ascmc = swe.houses_ex(jd, data.lat, data.lon, b'W', flags)
-        asc_lon = ascmc[0]
-        asc_idx = int(asc_lon // 30)
-        ascendant = zodiac_signs[asc_idx]
+        positions.append({"name": "Ketu", "sign": ZODIAC_SIGNS[ketu_idx], "lon": ketu_lon,
+                          "house": house_of(ketu_idx, asc_idx)})
 
         return {
             "ascendant": ascendant,
-            "planets": positions
+            "planets": positions,
+            "julian_day": job.jd
         }
     except Exception as e:
-        print(f"Calculation Error: {e}")
+        logger.warning("Calculation Error: %s", e)
         return None
 
 
-def get_local_analysis(data: BirthDetails):
-    """Fallback deterministic analysis generator"""
+def get_local_analysis(data: BirthDetails, calculated=None):
+    """Deterministic local analysis (pass the positions if the caller already has them)"""
     # Try accurate calculation first
-    calculated = calculate_positions(data)
-    
+    if calculated is None:
+        calculated = calculate_positions(data)
+    seed = f"{data.dob}|{data.time}|{data.place}|{data.lat}|{data.lon}"
+
     if calculated:
-        ascendant = calculated['ascendant']
-        # Convert planets list to formatted dictionary for templates
-        # We need to map planets to signs for the "random" text generation parts if needed, 
-        # or just use the raw data (which is better).
-        
-        # Determine Moon Sign
-        moon_sign = next((p['sign'] for p in calculated['planets'] if p['name'] == 'Moon'), "Unknown")
-        # Determine Sun Sign
-        sun_sign = next((p['sign'] for p in calculated['planets'] if p['name'] == 'Sun'), "Unknown")
-        
-        # Format planetary_details list in the expected structure
-        planetary_details = []
-        significances = {
-            "Sun": "Soul & Life Path", "Moon": "Mind & Emotions", "Mars": "Action & Energy",
-            "Mercury": "Intellect", "Jupiter": "Growth & Wisdom", "Venus": "Love & Art",
-            "Saturn": "Karma & Structure", "Rahu": "Ambition & Chaos", "Ketu": "Spirituality & Letting Go"
-        }
-        
-        for p in calculated['planets']:
-            planetary_details.append({
-                "planet": p['name'], 
-                "sign": p['sign'], 
-                "house": "Derived later", # House calc is complex to map to "1,2..12" without house system logic fully exposed, but we can mock or enhance. 
-                # Actually calculate_positions doesn't return house numbers for planets yet, just the Asc. 
-                # Ideally Swisseph gives houses. For now, random House is fine for fallback 
-                # as long as Sign is accurate.
-                "house": str(random.randint(1, 12)), 
-                "significance": significances.get(p['name'], "Influence")
-            })
+        return interpret_chart(calculated['ascendant'], calculated['planets'], seed)
 
-    else:
-        # Fallback to approximation if calculation fails completely
-        # (Original Logic)
+    # Fallback to approximation if calculation fails completely:
+    # Sun sign from the date, ascendant shifted from it by the hour
+    try:
         month = int(data.dob.split('-')[1])
         day = int(data.dob.split('-')[2])
-        
-        # Simple Sun Sign Lookup
-        cutoff_dates = [20, 19, 21, 20, 21, 21, 23, 23, 23, 23, 22, 22]
-        if day >= cutoff_dates[month-1]:
-            sun_idx = (month) % 12
-        else:
-            sun_idx = (month - 1) % 12
-        
-        sun_sign = ascendants[sun_idx]
-        
-        # Refine Ascendant (Approximate)
         hour = int(data.time.split(':')[0])
-        asc_shift = int((hour - 6) / 2)
-        asc_idx = (sun_idx + asc_shift) % 12
-        ascendant = ascendants[asc_idx]
-        
-        moon_sign = random.choice(moon_signs)
-        
-        # Generate random planetary details for fallback
-        planetary_details = [
-            {"planet": "Sun", "sign": sun_sign, "house": str(random.randint(1, 10)), "significance": "Soul & Life Path"},
-            {"planet": "Moon", "sign": moon_sign, "house": str(random.randint(1, 12)), "significance": "Mind & Emotions"},
-            {"planet": "Mars", "sign": random.choice(ascendants), "house": str(random.randint(1, 12)), "significance": "Action & Energy"},
-            {"planet": "Mercury", "sign": random.choice(ascendants), "house": str(random.randint(1, 12)), "significance": "Intellect"},
-            {"planet": "Jupiter", "sign": random.choice(ascendants), "house": str(random.randint(1, 12)), "significance": "Growth & Wisdom"},
-            {"planet": "Venus", "sign": random.choice(ascendants), "house": str(random.randint(1, 12)), "significance": "Love & Art"},
-            {"planet": "Saturn", "sign": random.choice(ascendants), "house": str(random.randint(1, 12)), "significance": "Karma & Structure"},
-        ]
-
-    moon = moon_sign # Alias for template usage
-    
-    # Dynamic Templates
-    career_templates = [
-        "A path involving leadership and innovation is highly favored. Success comes through taking calculated risks.",
-        "Your analytical skills point towards success in research or technology. Patience is your greatest asset.",
-        "Creative expression is vital for your career fulfillment. Look for roles that allow autonomy.",
-        "Service to others brings you the most professional satisfaction. Consider fields in healthcare or counseling.",
-        "A structured environment suits you best, where your organizational skills can shine.",
-        "Entrepreneurship is indicated. You have the drive to build something of your own."
-    ]
-    
-    relationship_templates = [
-        "You seek a deep, transformative connection. Superficial bonds do not interest you.",
-        "Intellectual compatibility is your top priority in a partner. Communication is key.",
-        "You value stability and loyalty above all else in relationships.",
-        "Independence is important to you; you need a partner who respects your space.",
-        "You pour your heart into relationships, sometimes forgetting your own needs. Balance is essential."
-    ]
-    
-    health_templates = [
-        "Focus on maintaining high energy levels through a protein-rich diet.",
-        "Nervous tension may be an issue. Meditation or yoga is highly recommended.",
-        "Your vitality is generally strong, but watch out for burnout.",
-        "Stay hydrated and ensure you get enough sleep to recharge your active mind.",
-        "Outdoor activities will greatly benefit your physical and mental well-being."
-    ]
-    
-    return {
-        "ascendant": f"Your Ascendant is **{ascendant}**. This creates a personality that is outwardly {random.choice(['dynamic', 'calm', 'intense', 'charming', 'mysterious'])}. People often perceive you as {random.choice(['reliable', 'energetic', 'thoughtful', 'authoritative'])} upon first meeting.",
-        "moon_sign": f"Your Moon Sign is **{moon}**. This suggests your emotional core is {random.choice(['sensitive', 'grounded', 'fiery', 'adaptable'])}. You find comfort in {random.choice(['solitude', 'social gatherings', 'nature', 'creative pursuits'])}.",
-        "planetary_details": planetary_details,
-        "strengths": random.sample([
-            "Resilience in facing challenges", 
-            "Natural leadership ability",
-            "Creative problem solving",
-            "Deep emotional intelligence",
-            "Unwavering determination",
-            "Sharp analytical mind",
-            "Empathy and compassion",
-            "Strong intuitive sense"
-        ], 4),
-        "challenges": random.sample([
-            "Tendency to overthink decisions",
-            "Need to balance work and rest",
-            "Learning to trust intuition more",
-            "Difficulty in letting go of the past",
-            "Impatience with delays",
-            "Struggling with perfectionism"
-        ], 3),
-        "life_predictions": {
-            "career": random.choice(career_templates),
-            "relationships": random.choice(relationship_templates),
-            "health": random.choice(health_templates)
-        }
-    }
+    except (ValueError, IndexError):
+        return interpret_chart(ZODIAC_SIGNS[0], [], seed)
+
+    cutoff_dates = [20, 19, 21, 20, 21, 21, 23, 23, 23, 23, 22, 22]
+    # ZODIAC_SIGNS starts at Aries: January is Capricorn until the 20th, then Aquarius
+    sun_idx = (month + 9) % 12 if day >= cutoff_dates[(month - 1) % 12] else (month + 8) % 12
+    asc_idx = (sun_idx + int((hour - 6) / 2)) % 12
+    return interpret_chart(ZODIAC_SIGNS[asc_idx], [{"name": "Sun", "sign": ZODIAC_SIGNS[sun_idx]}], seed)
 
 class PredictionRequest(BaseModel):
     rasi: str
@@ -228,19 +139,18 @@ def get_local_prediction(rasi, date):
         "A good day for health and wellness. Listen to your body's needs."
     ]
     
-    # Create a deterministic seed
-    seed_str = f"{rasi}-{date}"
-    random.seed(seed_str)
-    
-    prediction = random.choice(templates).format(rasi=rasi, date=date)
-    guidance = random.choice([
+    # Deterministic per sign and date, without touching the shared global RNG
+    rng = random.Random(f"{rasi}-{date}")
+
+    prediction = rng.choice(templates).format(rasi=rasi, date=date)
+    guidance = rng.choice([
         "Trust your intuition.", 
         "Avoid making hasty decisions.",
         "Seek counsel from a friend.",
         "Take a moment to breathe.",
         "Focus on the present moment."
     ])
-    focus = random.choice(["Health", "Career", "Family", "Creativity", "Finance", "Love"])
+    focus = rng.choice(["Health", "Career", "Family", "Creativity", "Finance", "Love"])
     
     return {
         "rasi_prediction": prediction,
@@ -248,100 +158,135 @@ def get_local_prediction(rasi, date):
         "daily_focus": focus
     }
 
-@router.post("/predict")
-def get_prediction(request: PredictionRequest):
-    # 1. Validation
-    if not GEMINI_API_KEY:
-        print("Using Local Fallback: No API Key")
-        return get_local_prediction(request.rasi, request.date)
+PREDICTION_FIELDS = ("rasi_prediction", "nakshatra_guidance", "daily_focus")
 
-    # 2. Try API (gemini-pro)
+async def fetch_ai_predictions(date, rasis):
+    """Ask Gemini for the daily horoscopes of several rasis in one call; returns {rasi: raw entry}"""
     try:
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent?key={GEMINI_API_KEY}"
-        
-        prompt = f"""
+        transit_facts = await run_in_threadpool(describe_transits, datetime.date.fromisoformat(date))
+    except ValueError:
+        transit_facts = "Not available for this date."
+
+    prompt = f"""
         Act as an expert Vedic Astrologer. 
-        Generate a strictly personalized daily horoscope for the Zodiac sign '{request.rasi}' specifically for the date '{request.date}'.
+        Generate strictly personalized daily horoscopes for each of these Zodiac signs specifically for the date '{date}':
+        SIGNS: {", ".join(rasis)}
         
-        To ensure this is dynamic and unique:
-        1. Consider the planetary transits (Gochar) applicable on {request.date}.
+        To ensure each one is dynamic and unique:
+        **TRANSIT DATA FOR {date} (USE THIS AS FACT):**
+        {transit_facts}
+
+        1. Consider the planetary transits (Gochar) applicable on {date}, as given above, from each sign's point of view.
         2. Mention specific planetary influences (e.g., "Since Moon is in [Sign]...", "Sun is transiting...").
-        3. Avoid generic advice that could apply to any day.
+        3. Avoid generic advice that could apply to any day or any sign.
         
-        Output Format (strict JSON-like structure, do not include markdown blocks):
-        1. Rasi Prediction: A mystical yet practical 2-sentence prediction specific to this date.
-        2. Nakshatra Guidance: One sentence of specific advice.
-        3. Daily Focus: 1-2 words (e.g., "Health", "Career").
-
-        Separate them with a '|' character like this:
-        PREDICTION|GUIDANCE|FOCUS
+        Output Format: a JSON object with one key per sign, exactly as spelled above:
+        {{
+            "<Sign>": {{
+                "rasi_prediction": "A mystical yet practical 2-sentence prediction specific to this date.",
+                "nakshatra_guidance": "One sentence of specific advice.",
+                "daily_focus": "1-2 words (e.g. Health, Career)"
+            }},
+            ...
+        }}
+        Do not include markdown code blocks. Just the raw JSON.
         """
 
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent?key={GEMINI_API_KEY}"
-        payload = {
-            "contents": [{
-                "parts": [{"text": prompt}]
-            }]
-        }
-        
-        headers = {'Content-Type': 'application/json'}
-        print(f"Fetching AI Prediction for {request.rasi} on {request.date}...")
-        response = requests.post(url, headers=headers, data=json.dumps(payload), timeout=8)
-        
-        if response.status_code != 200:
-            print(f"Gemini API Error {response.status_code}: {response.text} -> Switching to Local Fallback")
-            return get_local_prediction(request.rasi, request.date)
-
-        data = response.json()
-        text = data['candidates'][0]['content']['parts'][0]['text'].strip()
-        
-        print(f"AI Response: {text[:50]}...") # Log first 50 chars
-        
-        parts = text.split('|')
-        
-        if len(parts) >= 3:
-            prediction = parts[0].strip()
-            guidance = parts[1].strip()
-            focus = parts[2].strip()
-        else:
-            prediction = text
-            guidance = "Trust the universal flow."
-            focus = "Balance"
+    logger.info("Fetching AI Predictions for %d signs on %s", len(rasis), date)
+    text = await get_gemini_client().generate("gemini-pro", prompt, GEMINI_API_KEY, timeout=PREDICTION_DEADLINE)
+    data = extract_json(text)
+    if not isinstance(data, dict):
+        raise ValueError("Prediction batch is not a JSON object")
 
-        return {
-            "rasi_prediction": prediction,
-            "nakshatra_guidance": guidance,
-            "daily_focus": focus
-        }
+    # Match the reply's keys to the requested spelling
+    wanted = {rasi.lower(): rasi for rasi in rasis}
+    return {wanted[key.strip().lower()]: value for key, value in data.items() if key.strip().lower() in wanted}
 
-    except Exception as e:
-        print(f"Backend Exception: {e} -> Switching to Local Fallback")
-        return get_local_prediction(request.rasi, request.date)
+def validate_prediction(entry):
+    """The prediction dict for one sign of a batch reply, or None if a field is missing or empty"""
+    if not isinstance(entry, dict):
+        return None
+    prediction = {}
+    for field in PREDICTION_FIELDS:
+        value = entry.get(field)
+        if not isinstance(value, str) or not value.strip():
+            return None
+        prediction[field] = value.strip()
+    return prediction
+
+_prediction_loader = None
+
+def get_prediction_loader():
+    global _prediction_loader
+    if _prediction_loader is None:
+        _prediction_loader = DayBatchLoader(
+            get_prediction_cache(), fetch_ai_predictions, validate_prediction, ZODIAC_SIGNS,
+            max_retries=int(os.getenv("PREDICTION_BATCH_RETRIES", 2)),
+        )
+    return _prediction_loader
 
-@router.post("/analyze_chart")
-def analyze_chart(data: BirthDetails):
-    # Use fallback immediately if no key logic will be handled in try/except or explicit check
-    pass 
+@router.post("/predict")
+async def get_prediction(request: PredictionRequest):
+    date = request.date or datetime.date.today().isoformat()
 
+    # 1. Validation
+    if not GEMINI_API_KEY:
+        record_fallback("predict", "no_api_key")
+        with timed("fallback"):
+            return get_local_prediction(request.rasi, date)
+
+    loader = get_prediction_loader()
+    rasi = loader.canonical(request.rasi)
+    if rasi is None:
+        record_fallback("predict", "unknown_rasi")
+        with timed("fallback"):
+            return get_local_prediction(request.rasi, date)
+
+    # 2. Cached / coalesced API call (gemini-pro); a miss generates every sign of the date in one call
+    cache = get_prediction_cache()
     try:
-        active_key = GEMINI_ANALYSIS_KEY
-        if not active_key:
-             print("No API Key found for Analysis -> Switching to Local Fallback")
-             return get_local_analysis(data)
+        return await cache.get_or_load(cache.make_key(rasi, date), lambda: loader.load(rasi, date))
+    except Exception as e:
+        record_fallback("predict", "llm_error", e)
+        with timed("fallback"):
+            return get_local_prediction(request.rasi, date)
+
+@router.get("/predict/stats")
+def get_prediction_stats():
+    # A load is one cache key filled; upstream_calls counts the batched Gemini requests behind them
+    batch = get_prediction_loader().stats()
+    return {
+        **get_prediction_cache().stats(),
+        "upstream_calls": batch["upstream_calls"],
+        "upstream_errors": batch["upstream_errors"],
+        "batch": batch,
+    }
 
-        # Calculate Precise Chart Data
-        chart_data = calculate_positions(data)
-        
-        chart_summary = "Could not calculate exact positions."
-        if chart_data:
-            c_str = []
-            c_str.append(f"Ascendant: {chart_data['ascendant']}")
-            for p in chart_data['planets']:
-                c_str.append(f"{p['name']} in {p['sign']} ({p['lon']:.2f}°)")
-            chart_summary = ", ".join(c_str)
-
-        # Prompt Engineering for Comprehensive Analysis
-        prompt = f"""
+@router.get("/predict/scheduler")
+def get_prediction_scheduler_stats():
+    scheduler = get_prediction_scheduler()
+    if scheduler is None:
+        return {"running": False, "enabled": False}
+    return {"enabled": True, **scheduler.stats()}
+
+@router.get("/llm/stats")
+async def get_llm_stats():
+    return {**get_gemini_client().stats(), "fallbacks": fallback_counts()}
+
+# Top-level sections of a chart analysis, in the order the prompt asks for them
+ANALYSIS_SECTIONS = ("ascendant", "moon_sign", "planetary_details", "strengths", "challenges", "life_predictions")
+
+def build_analysis_prompt(data: BirthDetails, chart_data):
+    chart_summary = "Could not calculate exact positions."
+    if chart_data:
+        c_str = []
+        c_str.append(f"Ascendant: {chart_data['ascendant']}")
+        for p in chart_data['planets']:
+            c_str.append(f"{p['name']} in {p['sign']} ({p['lon']:.2f}°, house {p['house']})")
+        chart_summary = ", ".join(c_str)
+
+    # Prompt Engineering for Comprehensive Analysis
+    return f"""
         Act as an expert Vedic Astrologer. A user has provided their birth details:
         Date: {data.dob}
         Time: {data.time}
@@ -350,6 +295,7 @@ def analyze_chart(data: BirthDetails):
         **ASTRONOMICAL DATA (USE THIS AS FACT):**
         {chart_summary}
 
+        Houses are Whole Sign houses counted from the Ascendant.
         Based on these EXACT planetary positions, provide a detailed breakdown of their birth chart.
         Do NOT recalculate positions yourself. INTERPRET the provided data.
         
@@ -379,25 +325,177 @@ def analyze_chart(data: BirthDetails):
         Do not include markdown code blocks. Just the raw JSON.
         """
 
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent?key={active_key}"
-        payload = {"contents": [{"parts": [{"text": prompt}]}]}
-        headers = {'Content-Type': 'application/json'}
-        
-        response = requests.post(url, headers=headers, data=json.dumps(payload), timeout=15)
-        response.raise_for_status()
-        
-        data = response.json()
-        raw_text = data['candidates'][0]['content']['parts'][0]['text']
-        
+@router.post("/analyze_chart")
+async def analyze_chart(data: BirthDetails):
+    # Chart math and the local fallback are CPU work; keep them off the event loop
+    chart_data = None
+    try:
+        active_key = GEMINI_ANALYSIS_KEY
+        if not active_key:
+            record_fallback("analyze_chart", "no_api_key")
+            with timed("fallback"):
+                return await run_in_threadpool(get_local_analysis, data)
+
+        # Calculate Precise Chart Data
+        chart_data = await run_in_threadpool(calculate_positions, data)
+        prompt = build_analysis_prompt(data, chart_data)
+
+        raw_text = await get_gemini_client().generate("gemini-pro", prompt, active_key, timeout=ANALYSIS_DEADLINE)
+
         # Clean potential markdown
-        if "```json" in raw_text:
-            raw_text = raw_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in raw_text:
-            raw_text = raw_text.split("```")[1].split("```")[0].strip()
-            
-        return json.loads(raw_text)
+        return extract_json(raw_text)
 
     except Exception as e:
-        print(f"Chart Analysis Error: {e} -> Switching to Local Fallback")
-        return get_local_analysis(data)
+        record_fallback("analyze_chart", "llm_error", e)
+        # Reuse the positions computed for the prompt instead of computing the chart again
+        with timed("fallback"):
+            return await run_in_threadpool(get_local_analysis, data, chart_data)
+
+def sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+async def stream_analysis(data: BirthDetails):
+    """
+    Server-Sent Events for /analyze_chart/stream:
+
+      chart    the locally computed positions, sent before any upstream call
+      section  one top-level analysis section ({"key", "value", "source"}),
+               relayed from the LLM as soon as its JSON value is complete;
+               sections it did not deliver come from the local fallback
+      done     {"sections", "fallback", "error"}
+
+    Every payload carries t_ms, milliseconds since the request started.
+    """
+    started = time.perf_counter()
+
+    def event(name, **payload):
+        payload["t_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return sse_event(name, payload)
+
+    chart_data = await run_in_threadpool(calculate_positions, data)
+    yield event("chart", chart=chart_data)
+
+    sent = set()
+    error = None
+    reason = "incomplete_reply"
+    if not GEMINI_ANALYSIS_KEY:
+        error = "No API Key found for Analysis"
+        reason = "no_api_key"
+    else:
+        parser = ObjectStreamParser()
+        chunks = get_gemini_client().stream(
+            "gemini-pro", build_analysis_prompt(data, chart_data), GEMINI_ANALYSIS_KEY, timeout=ANALYSIS_DEADLINE,
+        )
+        try:
+            async for text in chunks:
+                for key, value in parser.feed(text):
+                    if key in ANALYSIS_SECTIONS and key not in sent:
+                        sent.add(key)
+                        yield event("section", key=key, value=value, source="llm")
+        except Exception as e:
+            error = str(e)
+            reason = "llm_error"
+        finally:
+            await chunks.aclose()
+
+    missing = [key for key in ANALYSIS_SECTIONS if key not in sent]
+    if missing:
+        record_fallback("analyze_chart_stream", reason, error)
+        with timed("fallback"):
+            local = await run_in_threadpool(get_local_analysis, data, chart_data)
+        for key in missing:
+            yield event("section", key=key, value=local[key], source="local")
+    yield event("done", sections=len(ANALYSIS_SECTIONS), fallback=len(missing), error=error)
+
+@router.post("/analyze_chart/stream")
+async def analyze_chart_stream(data: BirthDetails):
+    return StreamingResponse(
+        stream_analysis(data),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+class DashaRequest(BirthDetails):
+    at: Optional[str] = None     # ISO date/datetime (UTC) for the running periods; defaults to now
+    start: Optional[str] = None  # timeline window; defaults to birth .. birth + 120 years
+    end: Optional[str] = None
+    depth: int = 3               # 1 = Mahadasha, 2 = + Antardasha, 3 = + Pratyantardasha (max 5)
+
+class StoredDashaChart(BaseModel):
+    id: str
+    moon_lon: float     # sidereal Moon longitude (planets[Moon].lon of /chart)
+    julian_day: float   # UT birth Julian day (meta.julian_day of /chart)
+
+class DashaBulkRequest(BaseModel):
+    charts: List[StoredDashaChart]
+    at: Optional[str] = None
+    depth: int = 2
+
+def parse_dasha_date(value, default=None):
+    """UT Julian day of an ISO date or datetime (naive means UTC); default when value is empty"""
+    if not value:
+        return default
+    try:
+        dt = datetime.datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {value}")
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(pytz.utc)
+    return datetime_to_jd(dt)
+
+def check_dasha_depth(depth):
+    if not 1 <= depth <= len(dasha.LEVELS):
+        raise HTTPException(status_code=400, detail=f"depth must be between 1 and {len(dasha.LEVELS)}")
+
+@router.post("/dasha")
+async def get_dasha(data: DashaRequest):
+    """
+    Vimshottari dasha from the chart's Moon: the periods running at `at` and
+    the timeline between `start` and `end`, expanded only inside that window.
+    """
+    check_dasha_depth(data.depth)
+    positions = await run_in_threadpool(calculate_positions, data)
+    if positions is None:
+        raise HTTPException(status_code=400, detail="Could not calculate the chart for these birth details")
+    moon_lon = next(p["lon"] for p in positions["planets"] if p["name"] == "Moon")
+    birth_jd = positions["julian_day"]
+
+    now_jd = datetime_to_jd(datetime.datetime.now(pytz.utc))
+    at_jd = max(parse_dasha_date(data.at, now_jd), birth_jd)
+    start_jd = parse_dasha_date(data.start, birth_jd)
+    end_jd = parse_dasha_date(data.end, birth_jd + dasha.CYCLE_DAYS)
+    if end_jd < start_jd:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+
+    return {
+        "birth": dasha.birth_summary(moon_lon, birth_jd),
+        "at": jd_to_iso(at_jd),
+        "current": [dasha.period_dict(p) for p in dasha.period_at(moon_lon, birth_jd, at_jd, data.depth)],
+        "window": {"start": jd_to_iso(start_jd), "end": jd_to_iso(end_jd)},
+        "periods": dasha.timeline(moon_lon, birth_jd, start_jd, end_jd, data.depth),
+    }
 
+@router.post("/dasha/bulk")
+def get_dasha_bulk(req: DashaBulkRequest):
+    """
+    Running periods at one date for many stored charts (Moon longitude and
+    birth Julian day as returned by /api/astronomy/chart), computed in one
+    vectorised pass. Charts born after `at` get "current": null.
+    """
+    check_dasha_depth(req.depth)
+    at_jd = parse_dasha_date(req.at, datetime_to_jd(datetime.datetime.now(pytz.utc)))
+    lords, starts, ends = dasha.periods_at_bulk([c.moon_lon for c in req.charts],
+                                                [c.julian_day for c in req.charts], at_jd, req.depth)
+
+    results = []
+    for chart, row_lords, row_starts, row_ends in zip(req.charts, lords.tolist(), starts.tolist(), ends.tolist()):
+        current = None
+        if row_lords[0] >= 0:
+            current = [
+                {"level": dasha.LEVELS[level], "lord": dasha.DASHA_LORDS[lord],
+                 "start": jd_to_iso(start), "end": jd_to_iso(end)}
+                for level, (lord, start, end) in enumerate(zip(row_lords, row_starts, row_ends))
+            ]
+        results.append({"id": chart.id, "current": current})
+    return {"at": jd_to_iso(at_jd), "depth": req.depth, "charts": results}
@@ -1,133 +1,752 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-import swisseph as swe
+from fastapi import APIRouter, HTTPException, Request, WebSocket
+from fastapi.responses import JSONResponse, RedirectResponse, Response, StreamingResponse
+from pydantic import BaseModel, ValidationError
+from typing import List, Optional
+import asyncio
 import datetime
-import pytz
 import os
-import requests
 import json
+import hashlib
+import itertools
+import logging
+import random
+import numpy as np
+from urllib.parse import urlencode
 from dotenv import load_dotenv
+from services.aspects import (
+    ASPECT_BODIES, ASPECT_NAMES, aspect_list, harmony, classify, parse_orbs, scan_partners, scan_transits,
+    separation_matrix, transit_longitudes,
+)
+from services.chart_core import (
+    AYANAMSAS, HOUSE_SYSTEMS, PLANETS_MAP, birth_chart_job, compute_chart, compute_charts, get_chart_cache,
+)
+from services.chart_engine import ChartJob, get_chart_engine
+from services.current_sky import get_current_sky
+from services.ephemeris import get_table
+from services.events import EVENT_KINDS as CATALOG_KINDS, MAX_EVENTS, CatalogNotReady, catalog_stats, find_events
+from services.gazetteer import gazetteer_stats, get_gazetteer, resolve_coordinates
+from services.gemini_client import GeminiError, extract_json, get_gemini_client
+from services.metrics import record_fallback, timed
+from services.panchang import get_panchang, get_panchang_cache
+from services.sky import MAX_SAMPLES, check_grid, parse_bodies, sky_chunks, sky_header, sky_view, sky_window
+from services.guna_milan import KOOTA_MAX, KOOTAS, ist_julian_day, moon_longitude, rank_candidates, score_pair, verdict_for
+from services.timezones import cache_stats as timezone_cache_stats, resolve_zone
+from services.transits import EVENT_KINDS, find_transit_events
+from services.vargas import parse_vargas, varga_charts
+from services.vedic import date_to_jd, datetime_to_jd, jd_to_iso, nakshatra_of, sign_of
 
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "").strip()
 
+logger = logging.getLogger(__name__)
+
+# Upstream deadline (seconds) for the matchmaking LLM call
+MATCH_DEADLINE = float(os.getenv("GEMINI_MATCH_DEADLINE", 8))
+
 router = APIRouter(prefix="/api/astronomy", tags=["Astronomy"])
 
 class BirthDetails(BaseModel):
     dob: str  # YYYY-MM-DD
     time: str # HH:MM
     place: str
-    lat: float
-    lon: float
+    lat: Optional[float] = None  # looked up from place when lat/lon are omitted
+    lon: Optional[float] = None
+    timezone: Optional[str] = None  # IANA zone of the birth time; resolved from the place/coordinates when omitted
+    ayanamsa: str = "lahiri"  # key of AYANAMSAS
+    house_system: str = "W"   # key of HOUSE_SYSTEMS
+    vargas: Optional[str] = None  # divisional charts to add, e.g. "D9,D10" or "all"
+
+# Bump whenever chart output changes for the same inputs; part of every chart ETag
+ENGINE_VERSION = "chart-3"
+# GET /chart rounds lat/lon to this many decimals (~11 m) so nearby requests share a cache entry
+COORD_PRECISION = 4
+CHART_CACHE_CONTROL = "public, max-age=31536000, immutable"
+PLACE_REDIRECT_CACHE_CONTROL = "public, max-age=86400"
+
+def chart_job(data: BirthDetails):
+    """Validate a birth record and turn it into a ChartJob for the chart core.
+
+    Raises ValueError for malformed input so callers can decide how to surface
+    it (HTTP 400 for /chart, a per-record error for /chart/batch).
+    """
+    job, dt_utc, tz_meta = birth_chart_job(data.dob, data.time, data.place, data.lat, data.lon, data.timezone,
+                                           data.ayanamsa, data.house_system)
+    with timed("parse"):
+        parse_vargas(data.vargas)
+    return job, dt_utc, tz_meta
+
+
+# Columns of the varga longitude matrix; the ascendant is appended as the last column
+VARGA_BODIES = list(PLANETS_MAP.values()) + ["Ketu"]
+RAHU_INDEX = VARGA_BODIES.index("Rahu")
+
+
+def chart_vargas(raws, codes):
+    """Divisional charts for many raw engine results in one vectorised pass"""
+    bodies = np.array([raw["bodies"] for raw in raws], dtype=float)[:, :, 0]
+    ketu = (bodies[:, RAHU_INDEX] + 180.0) % 360.0
+    ascendant = np.array([raw["ascmc"][0] for raw in raws], dtype=float)
+    lons = np.column_stack([bodies, ketu, ascendant])
+    return varga_charts(lons, VARGA_BODIES, codes)
+
+
+ASPECT_COLUMNS = [VARGA_BODIES.index(name) for name in ASPECT_BODIES]
+
+
+def aspect_longitudes(raws):
+    """(charts, len(ASPECT_BODIES)) longitudes of the grahas from raw engine results"""
+    bodies = np.array([raw["bodies"] for raw in raws], dtype=float)[:, :, 0]
+    ketu = (bodies[:, RAHU_INDEX] + 180.0) % 360.0
+    return np.column_stack([bodies, ketu])[:, ASPECT_COLUMNS]
+
+
+def batch_vargas(details, raws):
+    """
+    Per record, its requested divisional charts (None when it asked for none).
+    The union of all requested vargas is computed once for the whole chunk.
+    """
+    wanted = [parse_vargas(d.vargas) if not isinstance(raw, Exception) else () for d, raw in zip(details, raws)]
+    union = set().union(*wanted) if wanted else set()
+    rows = [i for i, codes in enumerate(wanted) if codes]
+    results = [None] * len(raws)
+    if rows:
+        computed = chart_vargas([raws[i] for i in rows], parse_vargas(sorted(union)))
+        for i, chart in zip(rows, computed):
+            results[i] = {code: chart[code] for code in wanted[i]}
+    return results
+
+
+def format_chart(data: BirthDetails, job: ChartJob, dt_utc: datetime.datetime, tz_meta: dict, raw: dict, debug: bool = True,
+                 vargas: Optional[dict] = None) -> dict:
+    """Shape the engine's raw longitudes/speeds and cusps into the /chart response"""
+    chart_data = []
+    rahu_data = None
+
+    for (pid, name), (lon, speed_lon) in zip(PLANETS_MAP.items(), raw["bodies"]):
+        is_retro = speed_lon < 0
+
+        # Special logic for Nodes if needed, but usually Mean Node speed is negative
+
+        planet_info = {
+            "name": name,
+            "lon": lon,
+            "is_retrograde": is_retro,
+            "speed": speed_lon
+        }
+        chart_data.append(planet_info)
+
+        if name == "Rahu":
+            rahu_data = planet_info
+
+    # Calculate Ketu (Opposite to Rahu)
+    if rahu_data:
+        ketu_lon = (rahu_data["lon"] + 180.0) % 360.0
+        chart_data.append({
+            "name": "Ketu",
+            "lon": ketu_lon,
+            "is_retrograde": True # Nodes are always retrograde (Mean)
+        })
+
+    ascendant = raw["ascmc"][0]
+
+    houses = []
+    for i, cusp in enumerate(raw["cusps"]):
+        houses.append({
+            "house": i + 1,
+            "degree": cusp
+        })
+
+    # Debug dump, only built when DEBUG logging is on
+    if debug and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Chart Calc: %s %s (UTC: %s) %s", data.dob, data.time, dt_utc, "; ".join(
+            f"{p['name']}: {p['lon']:.2f} Speed: {p.get('speed', 0):.6f} Retro: {p['is_retrograde']}" for p in chart_data
+        ))
+
+    chart = {
+        "ascendant": ascendant,
+        "planets": chart_data,
+        "houses": houses,
+        "meta": {
+            "julian_day": job.jd,
+            "lat": job.lat,
+            "lon": job.lon,
+            "ayanamsa": AYANAMSAS[data.ayanamsa][1],
+            **tz_meta,
+            "house_system": HOUSE_SYSTEMS[data.house_system]
+        }
+    }
+    if vargas:
+        chart["vargas"] = vargas
+    return chart
+
+
+def build_chart(data: BirthDetails, debug: bool = True) -> dict:
+    """Compute the sidereal chart for one birth record (raises ValueError on bad input)"""
+    job, dt_utc, tz_meta = chart_job(data)
+    raw = compute_chart(job)
+    codes = parse_vargas(data.vargas)
+    vargas = chart_vargas([raw], codes)[0] if codes else None
+    return format_chart(data, job, dt_utc, tz_meta, raw, debug, vargas)
 
-def get_julian_day(dt_utc: datetime.datetime) -> float:
-    return swe.julday(dt_utc.year, dt_utc.month, dt_utc.day, dt_utc.hour + dt_utc.minute/60.0 + dt_utc.second/3600.0)
 
 @router.post("/chart")
 def calculate_chart(data: BirthDetails):
     try:
-        # Parse Input
-        try:
-            year, month, day = map(int, data.dob.split('-'))
-            hour, minute = map(int, data.time.split(':'))
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Invalid date/time format")
-
-        # Handle Timezone: Assuming Input is Indian Standard Time (IST) -> UTC
-        # IST is UTC + 5:30. So UTC = IST - 5:30.
-        dt_ist = datetime.datetime(year, month, day, hour, minute)
-        dt_utc = dt_ist - datetime.timedelta(hours=5, minutes=30)
-        
-        jd = get_julian_day(dt_utc)
-
-        # Set Sidereal Mode (Lahiri Ayanamsa for Vedic Astrology)
-        swe.set_sid_mode(swe.SIDM_LAHIRI)
-
-        # Planets to calculate
-        planets_map = {
-            swe.SUN: "Sun",
-            swe.MOON: "Moon",
-            swe.MERCURY: "Mercury",
-            swe.VENUS: "Venus",
-            swe.MARS: "Mars",
-            swe.JUPITER: "Jupiter",
-            swe.SATURN: "Saturn",
-            swe.URANUS: "Uranus",
-            swe.NEPTUNE: "Neptune",
-            swe.PLUTO: "Pluto",
-            swe.MEAN_NODE: "Rahu", # North Node
-        }
+        return build_chart(data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=_bad_input_detail(e))
+    except Exception as e:
+        logger.exception("Chart calculation failed")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        swe.set_ephe_path('') 
-        flags = swe.FLG_MOSEPH | swe.FLG_SIDEREAL | swe.FLG_SPEED 
 
-        chart_data = []
-        rahu_data = None
+def _bad_input_detail(e: ValueError) -> str:
+    message = str(e)
+    return message if message.startswith("Unknown") else "Invalid date/time format"
 
-        for pid, name in planets_map.items():
-            res = swe.calc_ut(jd, pid, flags)
-            coords = res[0]
-            lon = coords[0]
-            speed_lon = coords[3]
-            
-            is_retro = speed_lon < 0
-            
-            # Special logic for Nodes if needed, but usually Mean Node speed is negative
-            
-            planet_info = {
-                "name": name,
-                "lon": lon,
-                "is_retrograde": is_retro,
-                "speed": speed_lon
-            }
-            chart_data.append(planet_info)
-            
-            if name == "Rahu":
-                rahu_data = planet_info
-
-        # Calculate Ketu (Opposite to Rahu)
-        if rahu_data:
-            ketu_lon = (rahu_data["lon"] + 180.0) % 360.0
-            chart_data.append({
-                "name": "Ketu",
-                "lon": ketu_lon,
-                "is_retrograde": True # Nodes are always retrograde (Mean)
-            })
-
-        # Calculate Houses (Sidereal)
-        # Use Whole Sign (W) for Vedic Rasi Chart compatibility
-        h_sys = b'W'
-        houses_res, ascmc = swe.houses_ex(jd, data.lat, data.lon, h_sys, flags)
-        ascendant = ascmc[0]
-        
-        houses = []
-        for i, cusp in enumerate(houses_res):
-            houses.append({
-                "house": i + 1,
-                "degree": cusp
-            })
-            
-        # Debugging Print
-        print(f"Chart Calc: {data.dob} {data.time} (UTC: {dt_utc})")
-        for p in chart_data:
-            print(f"{p['name']}: {p['lon']:.2f} Speed: {p.get('speed', 0):.6f} Retro: {p['is_retrograde']}")
-
-        return {
-            "ascendant": ascendant,
-            "planets": chart_data,
-            "houses": houses,
-            "meta": {
-                "julian_day": jd,
-                "ayanamsa": "Lahiri (Sidereal)",
-                "timezone": "IST assumed (-5:30)",
-                "house_system": "Whole Sign"
-            }
-        }
 
+def canonical_chart_params(dob: str, time: str, lat: float, lon: float, ayanamsa: str, house_system: str,
+                           timezone: Optional[str] = None, vargas: Optional[str] = None) -> dict:
+    """Normalised GET /chart query: zero-padded date/time, rounded coordinates, explicit defaults"""
+    year, month, day = map(int, dob.split('-'))
+    hour, minute = map(int, time.split(':'))
+    datetime.datetime(year, month, day, hour, minute)  # validate ranges
+    ayanamsa = ayanamsa.strip().lower()
+    house_system = house_system.strip().upper()
+    if ayanamsa not in AYANAMSAS:
+        raise ValueError(f"Unknown ayanamsa '{ayanamsa}'")
+    if house_system not in HOUSE_SYSTEMS:
+        raise ValueError(f"Unknown house system '{house_system}'")
+    # "+ 0.0" folds -0.0 into 0.0 so both spell the same key
+    lat = round(lat, COORD_PRECISION) + 0.0
+    lon = round(lon, COORD_PRECISION) + 0.0
+    params = {
+        "dob": f"{year:04d}-{month:02d}-{day:02d}",
+        "time": f"{hour:02d}:{minute:02d}",
+        "lat": f"{lat:.{COORD_PRECISION}f}",
+        "lon": f"{lon:.{COORD_PRECISION}f}",
+        "ayanamsa": ayanamsa,
+        "house_system": house_system,
+    }
+    # Only an explicit zone is part of the URL; otherwise it follows from the coordinates
+    if timezone:
+        params["timezone"], _ = resolve_zone(lat, lon, timezone)
+    codes = parse_vargas(vargas)
+    if codes:
+        params["vargas"] = ",".join(codes)
+    return params
+
+
+def chart_etag(params: dict) -> str:
+    # The optional ephemeris table changes output in the sub-arcsecond digits, so it is part of the version
+    engine = ENGINE_VERSION + ("+table" if get_table() is not None else "")
+    fields = [params.get(k, "") for k in ("dob", "time", "lat", "lon", "ayanamsa", "house_system", "timezone")]
+    if "vargas" in params:
+        fields.append(params["vargas"])
+    key = "|".join([engine] + fields)
+    return '"' + hashlib.sha256(key.encode()).hexdigest()[:32] + '"'
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so W/ prefixes are ignored
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    candidates = [tag[2:] if tag.startswith("W/") else tag for tag in candidates]
+    return etag in candidates
+
+
+@router.get("/chart")
+def get_chart(request: Request, dob: str, time: str, lat: Optional[float] = None, lon: Optional[float] = None,
+              place: Optional[str] = None, timezone: Optional[str] = None,
+              ayanamsa: str = "lahiri", house_system: str = "W", vargas: Optional[str] = None):
+    """
+    Cacheable form of POST /chart. A chart is a pure function of its inputs, so
+    responses carry a strong ETag and a one-year immutable Cache-Control.
+    Non-canonical queries are redirected to the canonical URL so browsers and
+    CDNs keep a single entry per chart. A place given instead of lat/lon is
+    resolved and redirected to its coordinates.
+    """
+    try:
+        lat, lon, resolved = resolve_coordinates(place, lat, lon)
+        params = canonical_chart_params(dob, time, lat, lon, ayanamsa, house_system, timezone, vargas)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=_bad_input_detail(e))
+
+    canonical_query = urlencode(params, safe=":/,")
+    if request.url.query != canonical_query:
+        # A place lookup may change with the gazetteer, so only its redirect is short-lived
+        cache_control = PLACE_REDIRECT_CACHE_CONTROL if resolved else CHART_CACHE_CONTROL
+        return RedirectResponse(f"{request.url.path}?{canonical_query}", status_code=308,
+                                headers={"Cache-Control": cache_control})
+
+    etag = chart_etag(params)
+    headers = {"ETag": etag, "Cache-Control": CHART_CACHE_CONTROL}
+    if _etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+
+    data = BirthDetails(place="", dob=params["dob"], time=params["time"], lat=float(params["lat"]),
+                        lon=float(params["lon"]), timezone=params.get("timezone"), ayanamsa=params["ayanamsa"],
+                        house_system=params["house_system"], vargas=params.get("vargas"))
+    try:
+        chart = build_chart(data, debug=False)
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Chart calculation failed")
         raise HTTPException(status_code=500, detail=str(e))
+    return JSONResponse(chart, headers=headers)
+
+
+# Bulk Chart Computation
+# Accepts either a JSON array of BirthDetails or an NDJSON upload
+# (Content-Type: application/x-ndjson, one record per line) and streams
+# one NDJSON result line per record, in input order.
+BATCH_CHUNK_SIZE = 512
+NDJSON_MEDIA_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/x-jsonlines")
+
+
+def _format_validation_error(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in e.errors())
+
+
+def _iter_batch_records(body: bytes, content_type: str):
+    """Yield raw records (or the JSON error for an unparseable line) from a batch body"""
+    if any(media in content_type for media in NDJSON_MEDIA_TYPES):
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield e
+        return
+
+    try:
+        records = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+    if isinstance(records, dict):
+        records = records.get("records")
+    if not isinstance(records, list):
+        raise HTTPException(status_code=400, detail="Body must be a JSON array of birth details")
+    yield from records
+
+
+def _prepare_record(record):
+    """(details, job, dt_utc, tz_meta) for a valid record, or the error message for a bad one"""
+    try:
+        if isinstance(record, Exception):
+            raise ValueError(f"Invalid JSON: {record}")
+        if not isinstance(record, dict):
+            raise ValueError("Record must be a JSON object")
+        details = BirthDetails(**record)
+        return (details,) + chart_job(details)
+    except ValidationError as e:
+        return _format_validation_error(e)
+    except ValueError as e:
+        return str(e) or "Invalid date/time format"
+
+
+def _stream_batch(records):
+    # Records are validated and dispatched to the chart core a chunk at a time, so
+    # memory stays bounded while every worker gets a full batch
+    index = 0
+    while True:
+        chunk = list(itertools.islice(records, BATCH_CHUNK_SIZE))
+        if not chunk:
+            return
+        prepared = [_prepare_record(record) for record in chunk]
+        jobs = [p[1] for p in prepared if not isinstance(p, str)]
+        results = compute_charts(jobs)
+        vargas = iter(batch_vargas([p[0] for p in prepared if not isinstance(p, str)], results))
+        results = iter(results)
+        for p in prepared:
+            if isinstance(p, str):
+                line = {"index": index, "error": p}
+            else:
+                raw, record_vargas = next(results), next(vargas)
+                if isinstance(raw, Exception):
+                    line = {"index": index, "error": f"Calculation failed: {raw}"}
+                else:
+                    details, job, dt_utc, tz_meta = p
+                    line = {"index": index, "chart": format_chart(details, job, dt_utc, tz_meta, raw, debug=False,
+                                                                     vargas=record_vargas)}
+            index += 1
+            yield json.dumps(line) + "\n"
+
+
+@router.post("/chart/batch")
+async def calculate_chart_batch(request: Request):
+    body = await request.body()
+    content_type = request.headers.get("content-type", "").lower()
+    records = _iter_batch_records(body, content_type)
+
+    # Prime the generator so body-level errors surface as HTTP 400 instead of a broken stream
+    try:
+        first = next(records)
+    except StopIteration:
+        return StreamingResponse(iter(()), media_type="application/x-ndjson")
+
+    def all_records():
+        yield first
+        yield from records
+
+    # StreamingResponse runs sync iterators in the threadpool, so the swisseph loop never blocks the event loop
+    return StreamingResponse(_stream_batch(all_records()), media_type="application/x-ndjson")
+
+
+@router.get("/chart/stats")
+def chart_cache_stats():
+    return {**get_chart_cache().stats(), "timezones": timezone_cache_stats(),
+            "worker_pool_restarts": get_chart_engine().pool_restarts}
+
+
+# Place Search (offline gazetteer)
+@router.get("/places")
+def search_places(q: str, limit: int = 10, country: Optional[str] = None):
+    """Autocomplete for the birth place field, most populous matches first"""
+    return {"query": q, "results": get_gazetteer().search(q, limit, country)}
+
+
+@router.get("/places/stats")
+def place_index_stats():
+    return gazetteer_stats()
+
+
+# Transit (Gochar) Events
+@router.get("/transits")
+def get_transits(start: str, end: str, planets: Optional[str] = None, kinds: Optional[str] = None):
+    """
+    Exact times of sign ingresses, nakshatra ingresses and retrograde/direct
+    stations in [start, end). Dates are YYYY-MM-DD (00:00 UTC); planets and
+    kinds are optional comma-separated filters (kinds: sign, nakshatra, station).
+    """
+    try:
+        start_date = datetime.date.fromisoformat(start)
+        end_date = datetime.date.fromisoformat(end)
+        bodies = [p.strip().title() for p in planets.split(',') if p.strip()] if planets else None
+        kind_list = [k.strip().lower() for k in kinds.split(',') if k.strip()] if kinds else EVENT_KINDS
+        events = find_transit_events(start_date, end_date, bodies, kind_list)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        "start": start,
+        "end": end,
+        "ayanamsa": "Lahiri (Sidereal)",
+        "events": events
+    }
+
+
+# Panchang
+@router.get("/panchang")
+def get_panchang_days(lat: Optional[float] = None, lon: Optional[float] = None, place: Optional[str] = None,
+                      timezone: Optional[str] = None, month: Optional[str] = None, year: Optional[int] = None,
+                      start: Optional[str] = None, end: Optional[str] = None):
+    """
+    Sunrise, sunset, vara, tithi, nakshatra, yoga and karana for every local
+    date of a month (month=YYYY-MM, the default is the current month), a year
+    (year=YYYY) or start..end (YYYY-MM-DD, inclusive, up to 366 days). Each
+    element lists the periods running between sunrise and the next sunrise
+    with their exact start and end times.
+    """
+    try:
+        lat, lon, resolved = resolve_coordinates(place, lat, lon)
+        if start or end:
+            start_date = datetime.date.fromisoformat(start or end)
+            end_date = datetime.date.fromisoformat(end or start)
+        elif year is not None:
+            start_date, end_date = datetime.date(year, 1, 1), datetime.date(year, 12, 31)
+        else:
+            first = datetime.date.fromisoformat(f"{month}-01") if month else datetime.date.today().replace(day=1)
+            start_date = first
+            end_date = (first + datetime.timedelta(days=32)).replace(day=1) - datetime.timedelta(days=1)
+        location, days = get_panchang(lat, lon, start_date, end_date, timezone, resolved)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        "location": location,
+        "start": start_date.isoformat(),
+        "end": end_date.isoformat(),
+        "ayanamsa": "Lahiri (Sidereal)",
+        "days": days
+    }
+
+
+@router.get("/panchang/stats")
+def panchang_cache_stats():
+    return get_panchang_cache().stats()
+
+
+# Eclipses and Conjunctions
+# Seconds a client should wait while the catalog is still being built
+CATALOG_RETRY_AFTER = "30"
+
+
+@router.get("/events")
+def get_events(start: Optional[str] = None, end: Optional[str] = None, kinds: Optional[str] = None,
+               planets: Optional[str] = None, lat: Optional[float] = None, lon: Optional[float] = None,
+               place: Optional[str] = None, limit: int = 20):
+    """
+    Solar eclipses, lunar eclipses and planetary conjunctions in [start, end)
+    from the precomputed catalog (1900-2100). Dates are YYYY-MM-DD (00:00 UTC);
+    start defaults to today and end to the end of the catalog, so the default
+    is the next limit events. kinds (solar_eclipse, lunar_eclipse, conjunction)
+    and planets (conjunctions involving them) are comma-separated filters.
+    With lat/lon or place, each event gets its local circumstances there.
+    """
+    try:
+        start_date = datetime.date.fromisoformat(start) if start else datetime.date.today()
+        end_date = datetime.date.fromisoformat(end) if end else datetime.date(2101, 1, 1)
+        kind_list = [k.strip().lower() for k in kinds.split(',') if k.strip()] if kinds else CATALOG_KINDS
+        bodies = [p.strip().title() for p in planets.split(',') if p.strip()] if planets else None
+        location = None
+        if place or (lat is not None and lon is not None):
+            lat, lon, resolved = resolve_coordinates(place, lat, lon)
+            location = {"lat": lat, "lon": lon, "place": resolved["label"] if resolved else None}
+        events = find_events(start_date, end_date, kind_list, bodies, lat, lon, limit)
+    except CatalogNotReady as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": CATALOG_RETRY_AFTER})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        "start": start_date.isoformat(),
+        "end": end_date.isoformat(),
+        "location": location,
+        "ayanamsa": "Lahiri (Sidereal)",
+        "max_events": MAX_EVENTS,
+        "events": events
+    }
+
+
+@router.get("/events/stats")
+def event_catalog_stats():
+    try:
+        return catalog_stats()
+    except CatalogNotReady as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": CATALOG_RETRY_AFTER})
+
+
+# Observer Sky View
+@router.get("/sky")
+def get_sky(lat: Optional[float] = None, lon: Optional[float] = None, place: Optional[str] = None,
+            timezone: Optional[str] = None, night: Optional[str] = None, start: Optional[str] = None,
+            end: Optional[str] = None, hours: Optional[float] = None, step: int = 5, bodies: Optional[str] = None,
+            format: str = "json"):
+    """
+    Altitude/azimuth tracks, visibility and rise/transit/set times of the Sun,
+    Moon and planets seen from a place. The window is one night (night=YYYY-MM-DD,
+    local sunset to sunrise; tonight by default) or start..end / start + hours
+    (ISO date-times, local to the place unless they carry an offset), sampled
+    every step minutes. format=ndjson streams a header line and then one line
+    per day of samples, for ranges of up to a year.
+    """
+    if format not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be json or ndjson")
+    try:
+        lat, lon, resolved = resolve_coordinates(place, lat, lon)
+        names = parse_bodies(bodies)
+        window_start, window_end, zone, source = sky_window(lat, lon, start, end, night, hours, timezone, resolved)
+        if format == "json":
+            return sky_view(lat, lon, window_start, window_end, step, names, zone, source)
+        check_grid(window_start, window_end, step, MAX_SAMPLES)
+        header = sky_header(lat, lon, window_start, window_end, step, names, zone, source)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def lines():
+        yield json.dumps(header) + "\n"
+        for chunk in sky_chunks(lat, lon, window_start, window_end, step, names):
+            yield json.dumps(chunk) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+
+# Current Sky (live feed)
+@router.get("/sky/now")
+async def get_sky_now(request: Request):
+    """
+    Latest current-sky snapshot: sidereal positions of the grahas and the
+    Panchang elements, recomputed once per bucket for all clients. Cacheable
+    until the next bucket starts.
+    """
+    sky = get_current_sky()
+    frame = await sky.refresh()
+    headers = {"ETag": frame.etag, "Cache-Control": f"public, max-age={int(sky.seconds_left())}"}
+    if _etag_matches(request.headers.get("if-none-match", ""), frame.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(frame.payload, media_type="application/json", headers=headers)
+
+
+@router.get("/sky/now/stream")
+async def stream_sky_now():
+    """Server-Sent Events: a "sky" event with the current snapshot, then one per new bucket"""
+    async def frames():
+        async for frame in get_current_sky().updates():
+            yield frame.sse
+
+    return StreamingResponse(
+        frames(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/sky/now/ws")
+async def sky_now_socket(websocket: WebSocket):
+    """WebSocket feed of the same snapshots; messages from the client are ignored"""
+    await websocket.accept()
+
+    async def push():
+        async for frame in get_current_sky().updates():
+            await websocket.send_text(frame.text)
+
+    pusher = asyncio.ensure_future(push())
+    try:
+        # Reading is what notices a closed connection between updates
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    finally:
+        pusher.cancel()
+
+
+@router.get("/sky/now/stats")
+def sky_now_stats():
+    return get_current_sky().stats()
+
+
+# Aspects, Synastry and Transits
+class AspectRequest(BaseModel):
+    chart: BirthDetails
+    partner: Optional[BirthDetails] = None  # adds synastry cross-aspects
+    transit: Optional[str] = None  # "now" or an ISO UTC date-time; adds transit-to-natal aspects
+    orbs: Optional[str] = None  # e.g. "trine:6,square:5"; other aspects keep their default orb
+    drishti: bool = True
+
+class AspectBulkRequest(BaseModel):
+    chart: BirthDetails
+    partners: Optional[List[BirthDetails]] = None  # synastry scan against every partner
+    transit_start: Optional[str] = None  # YYYY-MM-DD, transit scan from 00:00 UTC
+    transit_end: Optional[str] = None
+    step_hours: float = 24.0
+    orbs: Optional[str] = None
+    top_k: Optional[int] = None
+
+MAX_ASPECT_PARTNERS = 10000
+MAX_TRANSIT_SAMPLES = 20000
+# Tightest cross-aspects included with /match
+MATCH_SYNASTRY_ASPECTS = 5
+
+
+def parse_transit_time(value: str) -> float:
+    if value.strip().lower() == "now":
+        dt = datetime.datetime.utcnow()
+    else:
+        dt = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+        if dt.tzinfo is not None:
+            dt = dt.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return datetime_to_jd(dt)
+
+
+def natal_longitudes(details: BirthDetails):
+    job, _, _ = chart_job(details)
+    return aspect_longitudes([compute_chart(job)])[0], job.jd
+
+
+@router.post("/aspects")
+def calculate_aspects(req: AspectRequest):
+    """
+    Classic aspects (within orb) and Vedic drishti of a chart's grahas, plus
+    synastry with a partner chart and transits at a given time when asked.
+    """
+    names = list(ASPECT_BODIES)
+    try:
+        orbs = parse_orbs(req.orbs)
+        lons, _ = natal_longitudes(req.chart)
+        result = {"bodies": names, "orbs": dict(zip(ASPECT_NAMES, orbs.tolist())),
+                  "natal": aspect_list(names, lons, orbs=orbs, drishti=req.drishti)}
+        if req.partner is not None:
+            partner, _ = natal_longitudes(req.partner)
+            synastry = aspect_list(names, lons, names, partner, orbs, req.drishti)
+            index, deviation = classify(separation_matrix(lons, partner), orbs)
+            synastry["harmony"] = round(float(harmony(index, deviation, orbs)), 4)
+            result["synastry"] = synastry
+        if req.transit:
+            jd = parse_transit_time(req.transit)
+            transit = transit_longitudes([jd])[0]
+            result["transits"] = {"at": jd_to_iso(jd), **aspect_list(names, transit, names, lons, orbs, req.drishti)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return result
+
+
+@router.post("/aspects/bulk")
+def calculate_aspects_bulk(req: AspectBulkRequest):
+    """
+    One chart against many partner charts (synastry harmony and aspect counts
+    per partner, best first) and/or against a transit time series (periods in
+    orb with their tightest time), each computed in one vectorised pass.
+    """
+    names = list(ASPECT_BODIES)
+    try:
+        orbs = parse_orbs(req.orbs)
+        lons, _ = natal_longitudes(req.chart)
+        result = {"bodies": names, "orbs": dict(zip(ASPECT_NAMES, orbs.tolist()))}
+        if req.partners:
+            if len(req.partners) > MAX_ASPECT_PARTNERS:
+                raise ValueError(f"At most {MAX_ASPECT_PARTNERS} partners per request")
+            result["partners"] = scan_partner_charts(lons, req.partners, orbs, req.top_k)
+        if req.transit_start or req.transit_end:
+            result["transits"] = scan_transit_range(names, lons, req.transit_start, req.transit_end, req.step_hours, orbs)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return result
+
+
+def scan_partner_charts(lons, partners, orbs, top_k=None):
+    """Partner entries ranked by synastry harmony; partners whose chart fails are listed after with an error"""
+    jobs, rows, errors = [], [], []
+    for index, partner in enumerate(partners):
+        try:
+            jobs.append(chart_job(partner)[0])
+            rows.append(index)
+        except ValueError as e:
+            errors.append({"index": index, "error": str(e) or "Invalid date/time format"})
+    raws = compute_charts(jobs)
+    valid = [(index, raw) for index, raw in zip(rows, raws) if not isinstance(raw, Exception)]
+    errors += [{"index": index, "error": f"Calculation failed: {raw}"} for index, raw in zip(rows, raws)
+               if isinstance(raw, Exception)]
+    ranked = []
+    if valid:
+        scores, counts, tightest = scan_partners(lons, aspect_longitudes([raw for _, raw in valid]), orbs)
+        for (index, _), score, count, tight in zip(valid, scores.tolist(), counts.tolist(), tightest.tolist()):
+            ranked.append({"index": index, "harmony": round(score, 4), "aspects": dict(zip(ASPECT_NAMES, count)),
+                           "tightest_orb": round(tight, 4) if tight != float("inf") else None})
+        ranked.sort(key=lambda e: -e["harmony"])
+    return (ranked[:top_k] if top_k else ranked) + sorted(errors, key=lambda e: e["index"])
+
+
+def scan_transit_range(names, lons, start, end, step_hours, orbs):
+    start_jd = date_to_jd(datetime.date.fromisoformat(start or end))
+    end_jd = date_to_jd(datetime.date.fromisoformat(end or start))
+    if end_jd <= start_jd:
+        raise ValueError("transit_end must be after transit_start")
+    if step_hours <= 0:
+        raise ValueError("step_hours must be positive")
+    step = step_hours / 24.0
+    count = int((end_jd - start_jd) / step) + 1
+    if count > MAX_TRANSIT_SAMPLES:
+        raise ValueError(f"{count} transit samples requested; the limit is {MAX_TRANSIT_SAMPLES} (use a larger step_hours)")
+    jds = start_jd + np.arange(count) * step
+    periods = scan_transits(names, lons, jds, transit_longitudes(jds), names, orbs)
+    for period in periods:
+        for key in ("start", "end", "exact"):
+            period[key] = jd_to_iso(period.pop(f"{key}_jd"))
+    return {"start": jd_to_iso(start_jd), "end": jd_to_iso(jds[-1]), "step_hours": step_hours, "periods": periods}
 
 
 # Matchmaking Request Model
@@ -142,19 +761,44 @@ class MatchRequest(BaseModel):
     girl: MatchProfile
 
 
-def get_local_match(boy_name, girl_name):
-    """Deterministic fallback matching based on names"""
-    import random
-    seed = f"{boy_name}-{girl_name}".lower()
-    random.seed(seed)
-    
-    score = random.randint(18, 32)
-    
-    verdicts = ["Good Match", "Average Compatiblity", "Excellent Match", "Challenging but Workable"]
-    if score > 28: verdict = "Excellent Match"
-    elif score > 24: verdict = "Very Good Match"
-    elif score > 18: verdict = "Average Compatibility"
-    else: verdict = "Challenging"
+class RankCandidate(BaseModel):
+    id: str
+    moon_lon: Optional[float] = None  # cached sidereal Moon longitude; computed from dob/time when absent
+    dob: Optional[str] = None
+    time: Optional[str] = None
+
+class RankRequest(BaseModel):
+    profile: MatchProfile
+    candidates: List[RankCandidate]
+    top_k: int = 10
+
+
+def compute_guna_milan(boy: MatchProfile, girl: MatchProfile):
+    """Ashta Koota result from both Moon positions, or None if a birth date/time cannot be parsed"""
+    try:
+        return score_pair(moon_longitude(boy.dob, boy.time), moon_longitude(girl.dob, girl.time))
+    except ValueError:
+        return None
+
+
+def compute_synastry(boy: MatchProfile, girl: MatchProfile):
+    """Cross-aspects between both charts (IST birth times), or None if a birth date/time cannot be parsed"""
+    try:
+        boy_lons, girl_lons = transit_longitudes([ist_julian_day(boy.dob, boy.time), ist_julian_day(girl.dob, girl.time)])
+    except ValueError:
+        return None
+    names = list(ASPECT_BODIES)
+    index, deviation = classify(separation_matrix(boy_lons, girl_lons))
+    aspects = aspect_list(names, boy_lons, names, girl_lons, drishti=False)["aspects"]
+    return {"harmony": round(float(harmony(index, deviation)), 4), "aspects": aspects[:MATCH_SYNASTRY_ASPECTS]}
+
+
+def get_local_match(boy_name, girl_name, guna=None, synastry=None):
+    """Deterministic fallback: Guna Milan score when available, templated analysis seeded by names"""
+    rng = random.Random(f"{boy_name}-{girl_name}".lower())
+
+    score = guna["score"] if guna else rng.randint(18, 32)
+    verdict = verdict_for(score)
     
     analysis_templates = [
         "The relationship shows strong promise. Emotional understanding is deep.",
@@ -164,19 +808,42 @@ def get_local_match(boy_name, girl_name):
         "Attraction is high. Values regarding family are consistent."
     ]
     
-    analysis = f"Based on astrological compatibility, this union scores {score}/36. " + " ".join(random.sample(analysis_templates, 3))
+    analysis = f"Based on astrological compatibility, this union scores {score:g}/36. " + " ".join(rng.sample(analysis_templates, 3))
     
-    return {
+    result = {
         "score": score,
         "verdict": verdict,
         "analysis": analysis
     }
+    if guna:
+        result["guna_milan"] = guna
+    if synastry:
+        result["synastry"] = synastry
+    return result
 
 @router.post("/match")
-def match_profiles(req: MatchRequest):
+async def match_profiles(req: MatchRequest):
+    # Guna Milan is computed locally; the LLM only writes the narrative around it
+    guna = compute_guna_milan(req.boy, req.girl)
+    synastry = compute_synastry(req.boy, req.girl)
     try:
         if not GEMINI_API_KEY:
-            return get_local_match(req.boy.name, req.girl.name)
+            record_fallback("match", "no_api_key")
+            with timed("fallback"):
+                return get_local_match(req.boy.name, req.girl.name, guna, synastry)
+
+        if guna:
+            koota_lines = ", ".join(f"{name} {guna['kootas'][name]:g}/{KOOTA_MAX[name]}" for name in KOOTAS)
+            facts = (
+                f"Boy's Moon: {guna['boy_moon']['sign']} ({guna['boy_moon']['nakshatra']}). "
+                f"Girl's Moon: {guna['girl_moon']['sign']} ({guna['girl_moon']['nakshatra']}). "
+                f"Koota scores: {koota_lines}. Total: {guna['score']:g}/36."
+            )
+        else:
+            facts = "Not available; estimate Moon Signs and Nakshatras from the date/time."
+        if synastry and synastry["aspects"]:
+            facts += " Tightest planetary cross-aspects (boy -> girl): " + ", ".join(
+                f"{a['from']} {a['aspect']} {a['to']} (orb {a['orb']:.1f}°)" for a in synastry["aspects"]) + "."
             
         # Construct Prompt for Gemini
         prompt = f"""
@@ -184,8 +851,10 @@ def match_profiles(req: MatchRequest):
         Boy: {req.boy.name}, DOB: {req.boy.dob}, Time: {req.boy.time}
         Girl: {req.girl.name}, DOB: {req.girl.dob}, Time: {req.girl.time}
         
-        Calculate the planetary positions roughly based on date/time to determine Moon Signs and Nakshatras.
-        Then provide a compatibility analysis.
+        **GUNA MILAN DATA (USE THIS AS FACT, DO NOT RECALCULATE):**
+        {facts}
+        
+        Interpret these scores and provide a compatibility analysis.
         
         Output strictly valid, parseable JSON format:
         {{
@@ -195,35 +864,65 @@ def match_profiles(req: MatchRequest):
         }}
         """
         
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent?key={GEMINI_API_KEY}"
-        payload = {
-            "contents": [{"parts": [{"text": prompt}]}]
-        }
-        
-        headers = {'Content-Type': 'application/json'}
         try:
-            response = requests.post(url, headers=headers, data=json.dumps(payload), timeout=8)
-            response.raise_for_status()
-            data = response.json()
-            
+            raw_text = await get_gemini_client().generate("gemini-1.5-flash", prompt, GEMINI_API_KEY, timeout=MATCH_DEADLINE)
+
             # Parse Gemini Response
-            raw_text = data['candidates'][0]['content']['parts'][0]['text']
-            if "```json" in raw_text:
-                raw_text = raw_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in raw_text:
-                raw_text = raw_text.split("```")[1].split("```")[0].strip()
-                
-            result = json.loads(raw_text)
+            result = extract_json(raw_text)
+            if guna:
+                result["score"] = guna["score"]
+                result["guna_milan"] = guna
+            if synastry:
+                result["synastry"] = synastry
             return result
-            
-        except requests.exceptions.HTTPError as e:
-            print(f"Gemini API HTTP Error: {e} -> Switching to Local Fallback")
-            return get_local_match(req.boy.name, req.girl.name)
+
+        except GeminiError as e:
+            record_fallback("match", "llm_error", e)
+            with timed("fallback"):
+                return get_local_match(req.boy.name, req.girl.name, guna, synastry)
         except Exception as e:
-            print(f"Gemini Processing Error: {e} -> Switching to Local Fallback")
-            return get_local_match(req.boy.name, req.girl.name)
+            record_fallback("match", "llm_parse_error", e)
+            with timed("fallback"):
+                return get_local_match(req.boy.name, req.girl.name, guna, synastry)
 
     except Exception as e:
-        print(f"Match Error: {e} -> Switching to Local Fallback")
-        return get_local_match(req.boy.name, req.girl.name)
+        record_fallback("match", "error", e)
+        with timed("fallback"):
+            return get_local_match(req.boy.name, req.girl.name, guna, synastry)
+
+
+@router.post("/match/rank")
+def rank_matches(req: RankRequest):
+    """
+    Rank one profile against many candidates by Guna Milan score and return
+    the top_k. Candidates should carry a cached moon_lon; dob/time is used
+    (IST assumed) only for those that do not.
+    """
+    try:
+        profile_lon = moon_longitude(req.profile.dob, req.profile.time)
+        candidate_lons = [
+            c.moon_lon if c.moon_lon is not None else moon_longitude(c.dob, c.time)
+            for c in req.candidates
+        ]
+    except (ValueError, AttributeError):
+        raise HTTPException(status_code=400, detail="Each candidate needs moon_lon or a valid dob/time")
+
+    profile_is_boy = req.profile.gender.strip().lower() in ("boy", "male", "m", "man")
+    indices, scores = rank_candidates(profile_lon, candidate_lons, profile_is_boy, req.top_k)
+
+    matches = []
+    for idx, score in zip(indices.tolist(), scores.tolist()):
+        candidate_lon = candidate_lons[idx]
+        guna = score_pair(profile_lon, candidate_lon) if profile_is_boy else score_pair(candidate_lon, profile_lon)
+        matches.append({
+            "id": req.candidates[idx].id,
+            "score": score,
+            "verdict": verdict_for(score),
+            "guna_milan": guna
+        })
 
+    return {
+        "profile_moon": {"lon": profile_lon, "sign": sign_of(profile_lon), "nakshatra": nakshatra_of(profile_lon)},
+        "candidates_scored": len(candidate_lons),
+        "matches": matches
+    }
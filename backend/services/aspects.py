@@ -0,0 +1,241 @@
+"""
+Aspects between sets of sidereal longitudes: natal, synastry and transits.
+
+Every comparison is one numpy expression over a pairwise separation matrix:
+for longitudes a (..., n) and b (..., m) the angular separations form an
+(..., n, m) array, and classifying it against all aspect angles at once adds
+a trailing axis. Leading axes are free, so the same code scans one natal
+chart against a transit time series (T, m) or many partner charts (C, m)
+with no Python loop over pairs.
+
+Two kinds of aspect are reported:
+
+  * the classic (Ptolemaic) aspects by exact angle within an orb, which can
+    be configured per aspect;
+  * Vedic graha drishti, counted by whole signs: every graha aspects the 7th
+    sign from itself, Mars also the 4th and 8th, Jupiter the 5th and 9th,
+    Saturn the 3rd and 10th, and Rahu/Ketu (as is common) the 5th and 9th.
+    Drishti is one-way, so it is reported as from -> to.
+"""
+import numpy as np
+
+from services.chart_engine import FLAGS, ensure_configured
+from services.ephemeris import calc_lon_speed, get_table
+from services.vedic import GRAHAS, SIGN_SPAN
+
+ASPECT_BODIES = ("Sun", "Moon", "Mars", "Mercury", "Jupiter", "Venus", "Saturn", "Rahu", "Ketu")
+
+# name -> (angle, default orb in degrees, nature: 1 harmonious, -1 challenging, 0 depends on the planets)
+ASPECTS = {
+    "conjunction": (0.0, 8.0, 0),
+    "sextile": (60.0, 5.0, 1),
+    "square": (90.0, 7.0, -1),
+    "trine": (120.0, 8.0, 1),
+    "opposition": (180.0, 8.0, -1),
+}
+ASPECT_NAMES = tuple(ASPECTS)
+ASPECT_ANGLES = np.array([angle for angle, _, _ in ASPECTS.values()])
+DEFAULT_ORBS = np.array([orb for _, orb, _ in ASPECTS.values()])
+ASPECT_NATURE = np.array([nature for _, _, nature in ASPECTS.values()], dtype=float)
+MAX_ORB = 15.0
+
+# Signs counted from the graha (1 = its own sign) that it aspects
+DRISHTI = {
+    "Sun": (7,), "Moon": (7,), "Mercury": (7,), "Venus": (7,),
+    "Mars": (4, 7, 8), "Jupiter": (5, 7, 9), "Saturn": (3, 7, 10), "Rahu": (5, 7, 9), "Ketu": (5, 7, 9),
+}
+
+
+def parse_orbs(spec):
+    """
+    Orb per aspect (array in ASPECT_NAMES order) from "trine:6,square:5" or a
+    dict; aspects not mentioned keep their default. ValueError for an unknown
+    aspect or an orb outside 0..MAX_ORB.
+    """
+    orbs = DEFAULT_ORBS.copy()
+    if not spec:
+        return orbs
+    if isinstance(spec, dict):
+        items = spec.items()
+    else:
+        items = []
+        for item in str(spec).split(","):
+            if not item.strip():
+                continue
+            name, sep, value = item.partition(":")
+            if not sep:
+                raise ValueError(f"Orb '{item}' must be written as aspect:degrees")
+            items.append((name, value))
+    for name, value in items:
+        name = str(name).strip().lower()
+        if name not in ASPECTS:
+            raise ValueError(f"Unknown aspect '{name}'. Supported: {', '.join(ASPECT_NAMES)}")
+        orb = float(value)
+        if not 0.0 <= orb <= MAX_ORB:
+            raise ValueError(f"Orb for {name} must be between 0 and {MAX_ORB:g} degrees")
+        orbs[ASPECT_NAMES.index(name)] = orb
+    return orbs
+
+
+def separation_matrix(a, b):
+    """Angular separations in [0, 180] of every a (..., n) against every b (..., m): (..., n, m)"""
+    diff = np.asarray(a, dtype=float)[..., :, None] - np.asarray(b, dtype=float)[..., None, :]
+    return np.abs((diff + 180.0) % 360.0 - 180.0)
+
+
+def classify(separations, orbs=DEFAULT_ORBS):
+    """
+    (aspect index into ASPECT_NAMES or -1, deviation from exact in degrees)
+    for an array of separations; the tightest aspect relative to its orb wins.
+    """
+    deviation = np.abs(separations[..., None] - ASPECT_ANGLES)
+    relative = np.where(deviation <= orbs, deviation / np.maximum(orbs, 1e-9), np.inf)
+    index = relative.argmin(axis=-1)
+    hit = np.isfinite(np.take_along_axis(relative, index[..., None], axis=-1)[..., 0])
+    return np.where(hit, index, -1), np.take_along_axis(deviation, index[..., None], axis=-1)[..., 0]
+
+
+def _drishti_table(names):
+    """(n, 13) bool: row i says which sign counts (1..12) names[i] aspects"""
+    table = np.zeros((len(names), 13), dtype=bool)
+    for row, name in enumerate(names):
+        table[row, list(DRISHTI.get(name, ()))] = True
+    return table
+
+
+def drishti_matrix(names_a, lons_a, lons_b):
+    """(..., n, m) bool: graha a[i] casts drishti on the sign holding b[j]"""
+    signs_a = (np.asarray(lons_a, dtype=float) // SIGN_SPAN).astype(int) % 12
+    signs_b = (np.asarray(lons_b, dtype=float) // SIGN_SPAN).astype(int) % 12
+    count = (signs_b[..., None, :] - signs_a[..., :, None]) % 12 + 1
+    table = _drishti_table(names_a)
+    return table[np.arange(len(names_a))[:, None], count]
+
+
+def _pairs(names_a, names_b, natal):
+    """(n, m) mask of the pairs to report: for a natal chart each unordered pair once, without Rahu-Ketu"""
+    if not natal:
+        return np.ones((len(names_a), len(names_b)), dtype=bool)
+    mask = np.triu(np.ones((len(names_a), len(names_a)), dtype=bool), k=1)
+    if "Rahu" in names_a and "Ketu" in names_a:
+        rahu, ketu = names_a.index("Rahu"), names_a.index("Ketu")
+        mask[min(rahu, ketu), max(rahu, ketu)] = False
+    return mask
+
+
+def aspect_list(names_a, lons_a, names_b=None, lons_b=None, orbs=DEFAULT_ORBS, drishti=True):
+    """
+    {"aspects": [...], "drishti": [...]} between two sets of longitudes, or
+    within one set (natal) when names_b is None. Aspects are sorted by orb;
+    "from" is in the first set and "to" in the second, while drishti between
+    two sets goes both ways and says which set ("chart"/"partner") casts it.
+    """
+    natal = names_b is None
+    if natal:
+        names_b, lons_b = names_a, lons_a
+    names_a, names_b = list(names_a), list(names_b)
+    separations = separation_matrix(lons_a, lons_b)
+    index, deviation = classify(separations, orbs)
+    pairs = _pairs(names_a, names_b, natal)
+    rows, cols = np.nonzero((index >= 0) & pairs)
+    aspects = [
+        {"from": names_a[i], "to": names_b[j], "aspect": ASPECT_NAMES[k], "angle": ASPECTS[ASPECT_NAMES[k]][0],
+         "separation": round(sep, 4), "orb": round(dev, 4)}
+        for i, j, k, sep, dev in zip(rows.tolist(), cols.tolist(), index[rows, cols].tolist(),
+                                     separations[rows, cols].tolist(), deviation[rows, cols].tolist())
+    ]
+    aspects.sort(key=lambda a: a["orb"])
+    result = {"aspects": aspects}
+    if drishti:
+        result["drishti"] = _drishti_list(names_a, lons_a, names_b, lons_b, natal)
+    return result
+
+
+def _drishti_list(names_a, lons_a, names_b, lons_b, natal):
+    found = []
+    directions = [(names_a, lons_a, names_b, lons_b, None if natal else "chart")]
+    if not natal:
+        directions.append((names_b, lons_b, names_a, lons_a, "partner"))
+    for from_names, from_lons, to_names, to_lons, side in directions:
+        cast = drishti_matrix(from_names, from_lons, to_lons)
+        if natal:
+            np.fill_diagonal(cast, False)
+        counts = (np.asarray(to_lons) // SIGN_SPAN - np.asarray(from_lons)[:, None] // SIGN_SPAN) % 12 + 1
+        rows, cols = np.nonzero(cast)
+        for i, j in zip(rows.tolist(), cols.tolist()):
+            entry = {"from": from_names[i], "to": to_names[j], "house": int(counts[i, j])}
+            if side:
+                entry["from_chart"] = side
+            found.append(entry)
+    return found
+
+
+def harmony(index, deviation, orbs=DEFAULT_ORBS):
+    """
+    Tightness-weighted balance of harmonious minus challenging aspects over
+    the last two axes (each aspect counts 1 at exact, 0 at the edge of its orb).
+    """
+    weight = np.where(index >= 0, 1.0 - deviation / np.maximum(orbs[np.maximum(index, 0)], 1e-9), 0.0)
+    return (weight * ASPECT_NATURE[np.maximum(index, 0)]).sum(axis=(-2, -1))
+
+
+def scan_partners(lons, partner_lons, orbs=DEFAULT_ORBS):
+    """
+    Synastry of one chart (n,) against many (C, m) in one pass. Returns
+    (harmony (C,), aspect counts (C, len(ASPECT_NAMES)), tightest orb (C,)).
+    """
+    index, deviation = classify(separation_matrix(lons, partner_lons), orbs)
+    counts = np.stack([(index == k).sum(axis=(-2, -1)) for k in range(len(ASPECT_NAMES))], axis=-1)
+    tightest = np.where(index >= 0, deviation, np.inf).min(axis=(-2, -1))
+    return harmony(index, deviation, orbs), counts, tightest
+
+
+def transit_longitudes(jds, names=ASPECT_BODIES):
+    """
+    (T, len(names)) sidereal longitudes at UT Julian days, vectorised through
+    the ephemeris table when it covers them (swisseph otherwise).
+    """
+    ensure_configured()
+    jds = np.asarray(jds, dtype=float)
+    table = get_table()
+    lons = np.empty((jds.size, len(names)))
+    for col, name in enumerate(names):
+        pid = GRAHAS["Rahu"] if name == "Ketu" else GRAHAS[name]
+        if table is not None and table.flags == FLAGS and table.covers(jds.min(), pid) and table.covers(jds.max(), pid):
+            values = table.lookup_many(jds, pid)[0]
+        else:
+            values = np.array([calc_lon_speed(jd, pid, FLAGS)[0] for jd in jds.tolist()])
+        lons[:, col] = (values + 180.0) % 360.0 if name == "Ketu" else values
+    return lons
+
+
+def scan_transits(natal_names, natal_lons, jds, transit_lons, transit_names=ASPECT_BODIES, orbs=DEFAULT_ORBS):
+    """
+    Periods in which a transiting body is within orb of an aspect to a natal
+    one over a time series: transit_lons (T, m) at jds (T,). Each period has
+    the grid times it starts and ends and the time and orb of its tightest
+    sample, oldest first.
+    """
+    index, deviation = classify(separation_matrix(transit_lons, natal_lons), orbs)  # (T, m, n)
+    jds = np.asarray(jds, dtype=float)
+    periods = []
+    for k, aspect in enumerate(ASPECT_NAMES):
+        active = index == k
+        # Run boundaries along time for every (transit, natal) pair at once
+        padded = np.zeros((1,) + active.shape[1:], dtype=bool)
+        edges = np.diff(np.concatenate([padded, active, padded]).astype(np.int8), axis=0)
+        # Starts and ends alternate per pair, so sorting both by (pair, time) lines them up
+        starts_t, starts_i, starts_j = np.nonzero(edges == 1)
+        ends_t, ends_i, ends_j = np.nonzero(edges == -1)
+        order_start = np.lexsort((starts_t, starts_j, starts_i))
+        order_end = np.lexsort((ends_t, ends_j, ends_i))
+        for s, e, i, j in zip(starts_t[order_start].tolist(), ends_t[order_end].tolist(),
+                              starts_i[order_start].tolist(), starts_j[order_start].tolist()):
+            peak = s + int(deviation[s:e, i, j].argmin())
+            periods.append({
+                "transit": transit_names[i], "natal": natal_names[j], "aspect": aspect,
+                "start_jd": float(jds[s]), "end_jd": float(jds[e - 1]), "exact_jd": float(jds[peak]),
+                "orb": round(float(deviation[peak, i, j]), 4),
+            })
+    periods.sort(key=lambda p: (p["start_jd"], p["orb"]))
+    return periods
@@ -0,0 +1,232 @@
+"""
+Single entry point for sidereal chart computation.
+
+Both routers turn birth details into a ChartJob (Julian day, location, house
+system, body set, ayanamsa) here and get the raw longitudes, speeds and cusps
+back through a bounded in-memory LRU in front of the chart engine. The job
+tuple is the cache key, so a chart is computed at most once per request and
+repeated charts (the same person on /chart, /analyze_chart and /chart/batch)
+are served from memory.
+
+Cached results are shared between callers and must be treated as read-only.
+CHART_CACHE_SIZE sets the number of charts kept (default 4096, 0 disables).
+"""
+import collections
+import datetime
+import os
+import sys
+import threading
+
+import swisseph as swe
+
+from services.chart_engine import DEFAULT_SID_MODE, ChartJob, get_chart_engine
+from services.gazetteer import resolve_coordinates
+from services.metrics import timed
+from services.timezones import format_offset, local_to_utc, resolve_zone
+
+# Every body a chart is computed for; callers pick the ones they need by name
+PLANETS_MAP = {
+    swe.SUN: "Sun",
+    swe.MOON: "Moon",
+    swe.MERCURY: "Mercury",
+    swe.VENUS: "Venus",
+    swe.MARS: "Mars",
+    swe.JUPITER: "Jupiter",
+    swe.SATURN: "Saturn",
+    swe.URANUS: "Uranus",
+    swe.NEPTUNE: "Neptune",
+    swe.PLUTO: "Pluto",
+    swe.MEAN_NODE: "Rahu", # North Node
+}
+CHART_BODIES = tuple(PLANETS_MAP)
+
+# Supported sidereal modes and house systems
+AYANAMSAS = {
+    "lahiri": (swe.SIDM_LAHIRI, "Lahiri (Sidereal)"),
+    "raman": (swe.SIDM_RAMAN, "Raman (Sidereal)"),
+    "krishnamurti": (swe.SIDM_KRISHNAMURTI, "Krishnamurti (Sidereal)"),
+}
+HOUSE_SYSTEMS = {
+    "W": "Whole Sign",
+    "E": "Equal",
+    "P": "Placidus",
+    "K": "Koch",
+    "O": "Porphyry",
+}
+
+
+def get_julian_day(dt_utc: datetime.datetime) -> float:
+    with timed("julday"):
+        return swe.julday(dt_utc.year, dt_utc.month, dt_utc.day, dt_utc.hour + dt_utc.minute/60.0 + dt_utc.second/3600.0)
+
+
+def birth_time_utc(dob: str, time: str, lat: float, lon: float, timezone: str = None, place: dict = None):
+    """
+    Parse 'YYYY-MM-DD' and 'HH:MM' local birth time into a UTC datetime.
+
+    The zone is timezone if given, else the zone of a gazetteer place, else
+    the one resolved from lat/lon. Returns (dt_utc, meta) where meta reports
+    the zone, the offset applied and where the zone came from. Raises
+    ValueError on bad input.
+    """
+    year, month, day = map(int, dob.split('-'))
+    hour, minute = map(int, time.split(':'))
+    local = datetime.datetime(year, month, day, hour, minute)
+
+    zone, source = resolve_zone(lat, lon, timezone, place)
+    dt_utc, offset, note = local_to_utc(local, zone)
+    meta = {"timezone": zone, "utc_offset": format_offset(offset), "timezone_source": source}
+    if note:
+        meta["timezone_note"] = note
+    return dt_utc, meta
+
+
+def chart_job(dt_utc: datetime.datetime, lat: float, lon: float, house_system: str = 'W', sid_mode: int = DEFAULT_SID_MODE) -> ChartJob:
+    return ChartJob(get_julian_day(dt_utc), lat, lon, house_system, CHART_BODIES, sid_mode)
+
+
+def birth_chart_job(dob: str, time: str, place: str = None, lat: float = None, lon: float = None, timezone: str = None,
+                    ayanamsa: str = "lahiri", house_system: str = "W"):
+    """
+    (ChartJob, dt_utc, tz meta) for a birth record: coordinates come from the
+    place when lat/lon are omitted and the local time is read in the zone of
+    the birth place. Raises ValueError on bad input.
+    """
+    with timed("parse"):
+        lat, lon, found = resolve_coordinates(place, lat, lon)
+        dt_utc, tz_meta = birth_time_utc(dob, time, lat, lon, timezone, found)
+
+        if ayanamsa not in AYANAMSAS:
+            raise ValueError(f"Unknown ayanamsa '{ayanamsa}'")
+        if house_system not in HOUSE_SYSTEMS:
+            raise ValueError(f"Unknown house system '{house_system}'")
+    # Sidereal Mode (Lahiri Ayanamsa for Vedic Astrology by default) is fixed per engine worker
+    sid_mode, _ = AYANAMSAS[ayanamsa]
+
+    # Houses: Whole Sign (W) is the default for Vedic Rasi Chart compatibility
+    return chart_job(dt_utc, lat, lon, house_system, sid_mode), dt_utc, tz_meta
+
+
+def bodies_by_name(raw: dict) -> dict:
+    """{name: (lon, speed)} for a computed chart"""
+    return dict(zip(PLANETS_MAP.values(), raw["bodies"]))
+
+
+def _approx_size(obj):
+    """Rough deep size in bytes of the tuples/lists/dicts/floats a chart is made of"""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_approx_size(k) + _approx_size(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(_approx_size(v) for v in obj)
+    return size
+
+
+class ChartCache:
+    def __init__(self, max_entries=4096, engine=None):
+        # None: whatever get_chart_engine() currently returns (it is rebuilt after a shutdown)
+        self.engine = engine
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.evictions = 0
+        self.bytes = 0
+        # job -> (raw chart, approximate size), least recently used first
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _store(self, job, raw):
+        if self.max_entries <= 0:
+            return
+        size = _approx_size(job) + _approx_size(raw)
+        with self._lock:
+            if job in self._entries:
+                return
+            self._entries[job] = (raw, size)
+            self.bytes += size
+            while len(self._entries) > self.max_entries:
+                _, (_, old_size) = self._entries.popitem(last=False)
+                self.bytes -= old_size
+                self.evictions += 1
+
+    def compute_many(self, jobs):
+        """
+        Raw charts for a list of ChartJobs, in order. Misses (each distinct job
+        once) go to the engine in one call; a failed job yields its exception.
+        """
+        jobs = list(jobs)
+        results = [None] * len(jobs)
+        missing = {}
+        with self._lock:
+            for index, job in enumerate(jobs):
+                entry = self._entries.get(job)
+                if entry is not None:
+                    self._entries.move_to_end(job)
+                    results[index] = entry[0]
+                    self.hits += 1
+                else:
+                    missing.setdefault(job, []).append(index)
+                    self.misses += 1
+
+        if missing:
+            engine = self.engine or get_chart_engine()
+            computed = engine.compute_many(list(missing))
+            for (job, indices), raw in zip(missing.items(), computed):
+                if isinstance(raw, Exception):
+                    self.errors += 1
+                else:
+                    self._store(job, raw)
+                for index in indices:
+                    results[index] = raw
+        return results
+
+    def compute(self, job):
+        raw = self.compute_many([job])[0]
+        if isinstance(raw, Exception):
+            raise raw
+        return raw
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        with self._lock:
+            entries = len(self._entries)
+            approx_bytes = self.bytes
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "evictions": self.evictions,
+            "approx_bytes": approx_bytes,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_chart_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ChartCache(max_entries=int(os.getenv("CHART_CACHE_SIZE", 4096)))
+        return _cache
+
+
+def compute_chart(job: ChartJob) -> dict:
+    """Raw chart for one job ({"bodies": [(lon, speed)], "cusps", "ascmc"}); raises on failure"""
+    with timed("chart"):
+        return get_chart_cache().compute(job)
+
+
+def compute_charts(jobs):
+    with timed("chart"):
+        return get_chart_cache().compute_many(jobs)
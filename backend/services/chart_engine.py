@@ -0,0 +1,270 @@
+"""
+Chart calculation backend.
+
+swisseph keeps the sidereal mode and ephemeris path in global C state (one
+copy per thread), and its calls hold the GIL, so computing charts in
+FastAPI's threadpool means re-setting that state on every call and is capped
+at one core. Chart jobs are therefore run in a pool of worker processes
+instead. Each worker sets the ephemeris path and its ayanamsa once at startup
+(one pool per ayanamsa, the Lahiri pool sized to the machine) and never
+touches global state again.
+
+Code that still calls swisseph in the server process (transits, Guna Milan)
+uses ensure_configured(), which only touches the state when the calling
+thread is not already set up for the requested mode.
+
+CHART_WORKERS sets the Lahiri pool size (default: CPU count); 0 computes in
+the calling thread, which gives identical results and is handy for
+debugging. CHART_BATCH_SIZE is how many jobs are sent to a worker at once.
+
+A worker that dies (segfault, OOM kill) breaks its whole pool; the broken
+pool is dropped and recreated, and the batches it was running are retried
+once on the new one. Jobs whose batch breaks the pool again fail with
+ChartWorkerError instead of being computed in the server process, where a
+crash would take the server down.
+
+Each job is timed per body position and for the house cusps wherever it
+runs; worker timings travel back with the results and are recorded into the
+server's metrics (and the current request's Server-Timing) by the parent.
+"""
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from typing import NamedTuple, Tuple
+
+import swisseph as swe
+
+from services.ephemeris import calc_lon_speed
+from services.metrics import BODY_SECONDS, record_stage
+
+logger = logging.getLogger(__name__)
+
+FLAGS = swe.FLG_MOSEPH | swe.FLG_SIDEREAL | swe.FLG_SPEED
+DEFAULT_SID_MODE = swe.SIDM_LAHIRI
+EPHE_PATH = os.getenv("SWISSEPH_PATH", "")
+
+
+class ChartJob(NamedTuple):
+    jd: float
+    lat: float
+    lon: float
+    house_system: str
+    bodies: Tuple[int, ...]
+    sid_mode: int = DEFAULT_SID_MODE
+
+
+_thread_state = threading.local()
+
+
+def ensure_configured(sid_mode=DEFAULT_SID_MODE):
+    """Point the calling thread's swisseph state at EPHE_PATH and sid_mode (no-op if it already is)"""
+    if getattr(_thread_state, "sid_mode", None) != sid_mode:
+        swe.set_ephe_path(EPHE_PATH)
+        swe.set_sid_mode(sid_mode)
+        _thread_state.sid_mode = sid_mode
+
+
+def _compute(job):
+    """
+    (raw chart, timings) where timings is ([seconds per body], houses seconds).
+    Assumes the calling thread is configured for job.sid_mode.
+    """
+    clock = time.perf_counter
+    bodies = []
+    body_seconds = []
+    for pid in job.bodies:
+        started = clock()
+        bodies.append(calc_lon_speed(job.jd, pid, FLAGS, job.sid_mode))
+        body_seconds.append(clock() - started)
+    started = clock()
+    cusps, ascmc = swe.houses_ex(job.jd, job.lat, job.lon, job.house_system.encode(), FLAGS)
+    houses_seconds = clock() - started
+    return {"bodies": bodies, "cusps": list(cusps), "ascmc": list(ascmc)}, (body_seconds, houses_seconds)
+
+
+@lru_cache(maxsize=None)
+def _body_name(pid):
+    return swe.get_planet_name(pid)
+
+
+def _record_timings(job, timings):
+    body_seconds, houses_seconds = timings
+    for pid, seconds in zip(job.bodies, body_seconds):
+        BODY_SECONDS.observe(seconds, _body_name(pid))
+        record_stage("calc_ut", seconds)
+    record_stage("houses_ex", houses_seconds)
+
+
+# --- worker side ---
+_worker_sid_mode = None
+
+
+def _init_worker(sid_mode):
+    global _worker_sid_mode
+    ensure_configured(sid_mode)
+    _worker_sid_mode = sid_mode
+
+
+def _run_batch(jobs):
+    results = []
+    for job in jobs:
+        if job.sid_mode != _worker_sid_mode:
+            raise ValueError(f"worker for sid mode {_worker_sid_mode} got a job for {job.sid_mode}")
+        try:
+            results.append(_compute(job))
+        except Exception as e:
+            # One bad job must not fail the rest of its batch
+            results.append(e)
+    return results
+
+
+def _ping(_=None):
+    return os.getpid()
+
+
+# --- parent side ---
+class ChartWorkerError(Exception):
+    """The worker computing a job died, twice"""
+
+
+class ChartEngine:
+    def __init__(self, workers=None, batch_size=64):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.batch_size = batch_size
+        self._pools = {}
+        self._pools_lock = threading.Lock()
+        self.pool_restarts = 0
+
+    def _pool(self, sid_mode):
+        with self._pools_lock:
+            pool = self._pools.get(sid_mode)
+            if pool is None:
+                # Non-default ayanamsas are rare; give them a small pool of their own
+                size = self.workers if sid_mode == DEFAULT_SID_MODE else max(1, self.workers // 4)
+                pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=size,
+                    # spawn: never fork a process that already runs server threads
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(sid_mode,),
+                )
+                self._pools[sid_mode] = pool
+            return pool
+
+    def _discard_pool(self, sid_mode, pool):
+        """Drop a broken pool so the next _pool() call spawns a fresh one"""
+        with self._pools_lock:
+            if self._pools.get(sid_mode) is pool:
+                del self._pools[sid_mode]
+                self.pool_restarts += 1
+                logger.warning("Chart worker died; restarting the pool for sid mode %s", sid_mode)
+        pool.shutdown(wait=False)
+
+    def _submit(self, sid_mode, batch):
+        pool = self._pool(sid_mode)
+        try:
+            return pool, pool.submit(_run_batch, batch)
+        except BrokenProcessPool:
+            # Broken by an earlier batch; nothing of this one has run yet
+            self._discard_pool(sid_mode, pool)
+            pool = self._pool(sid_mode)
+            return pool, pool.submit(_run_batch, batch)
+
+    def start(self):
+        """Spawn the default pool's workers now instead of on the first request"""
+        if self.workers > 0:
+            pool = self._pool(DEFAULT_SID_MODE)
+            list(pool.map(_ping, range(self.workers)))
+
+    def _compute_inprocess(self, jobs):
+        results = []
+        for job in jobs:
+            try:
+                ensure_configured(job.sid_mode)
+                results.append(_compute(job))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    @staticmethod
+    def _unpack(job, result):
+        if isinstance(result, Exception):
+            return result
+        raw, timings = result
+        _record_timings(job, timings)
+        return raw
+
+    def compute_many(self, jobs):
+        """
+        Compute a list of ChartJobs and return results in the same order.
+        A failed job yields its exception in place of a result.
+        """
+        jobs = list(jobs)
+        if self.workers <= 0:
+            return [self._unpack(job, result) for job, result in zip(jobs, self._compute_inprocess(jobs))]
+
+        results = [None] * len(jobs)
+        futures = []
+        by_mode = {}
+        for index, job in enumerate(jobs):
+            by_mode.setdefault(job.sid_mode, []).append(index)
+        for sid_mode, indices in by_mode.items():
+            for start in range(0, len(indices), self.batch_size):
+                chunk = indices[start:start + self.batch_size]
+                futures.append((sid_mode, chunk) + self._submit(sid_mode, [jobs[i] for i in chunk]))
+        for sid_mode, chunk, pool, future in futures:
+            try:
+                batch = future.result()
+            except BrokenProcessPool:
+                self._discard_pool(sid_mode, pool)
+                pool, future = self._submit(sid_mode, [jobs[i] for i in chunk])
+                try:
+                    batch = future.result()
+                except BrokenProcessPool:
+                    self._discard_pool(sid_mode, pool)
+                    batch = [ChartWorkerError("Chart worker died computing this batch")] * len(chunk)
+            for index, result in zip(chunk, batch):
+                results[index] = self._unpack(jobs[index], result)
+        return results
+
+    def compute(self, job):
+        result = self.compute_many([job])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def shutdown(self):
+        with self._pools_lock:
+            for pool in self._pools.values():
+                # cancel_futures needs Python 3.9; queued batches finish before the workers exit
+                pool.shutdown(wait=False)
+            self._pools.clear()
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_chart_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            workers = os.getenv("CHART_WORKERS")
+            _engine = ChartEngine(
+                workers=int(workers) if workers else None,
+                batch_size=int(os.getenv("CHART_BATCH_SIZE", 64)),
+            )
+        return _engine
+
+
+def shutdown_chart_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.shutdown()
+        _engine = None
@@ -0,0 +1,211 @@
+"""
+Live "current sky": where the grahas are right now, shared by every client.
+
+The sky is the same for everyone, so instead of computing positions per
+request a background task computes one snapshot per time bucket (a minute by
+default, CURRENT_SKY_INTERVAL seconds) and serialises it once, as JSON bytes,
+a WebSocket text message and a Server-Sent Events frame. Subscribers wait on
+a shared asyncio.Event that is set when the next snapshot is published and
+then send the already serialised frame, so an idle connection costs a
+suspended coroutine and a broadcast is a fan-out of the same bytes. A slow
+client never queues anything: when it gets to send again it sends the latest
+frame.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import NamedTuple
+
+import swisseph as swe
+from starlette.concurrency import run_in_threadpool
+
+from services.chart_engine import FLAGS, ensure_configured
+from services.ephemeris import calc_lon_speed
+from services.panchang import element_entry
+from services.vedic import GRAHAS, NAKSHATRA_SPAN, PADA_SPAN, SIGN_SPAN, jd_to_iso, nakshatra_of, sign_of
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 60.0
+MIN_INTERVAL = 1.0
+UNIX_EPOCH_JD = 2440587.5
+TITHI_SPAN = 12.0
+KARANA_SPAN = 6.0
+
+
+def unix_to_jd(seconds):
+    return UNIX_EPOCH_JD + seconds / 86400.0
+
+
+class SkyFrame(NamedTuple):
+    """One published snapshot, serialised once for every transport"""
+    version: int
+    bucket: float   # bucket start, Unix seconds
+    payload: bytes  # JSON body for GET
+    text: str       # WebSocket message
+    sse: bytes      # Server-Sent Events frame
+    etag: str
+
+
+def sky_snapshot(jd):
+    """Sidereal positions of the grahas and the Panchang elements at a UT Julian day"""
+    ensure_configured()
+    planets = {}
+    for name, pid in GRAHAS.items():
+        if pid is None:  # Ketu
+            rahu = planets["Rahu"]
+            lon, speed = (rahu["longitude"] + 180.0) % 360.0, rahu["speed"]
+        else:
+            lon, speed = calc_lon_speed(jd, pid, FLAGS)
+        planets[name] = {
+            "longitude": round(lon, 4),
+            "sign": sign_of(lon),
+            "degree": round(lon % SIGN_SPAN, 4),
+            "nakshatra": nakshatra_of(lon),
+            "pada": int(lon % NAKSHATRA_SPAN // PADA_SPAN) + 1,
+            "speed": round(speed, 4),
+            "retrograde": speed < 0,
+        }
+    sun, moon = planets["Sun"]["longitude"], planets["Moon"]["longitude"]
+    elongation = (moon - sun) % 360.0
+    return {
+        "time": jd_to_iso(jd),
+        "julian_day": jd,
+        "ayanamsa": round(swe.get_ayanamsa_ut(jd), 6),
+        "planets": planets,
+        "panchang": {
+            "tithi": element_entry("tithi", int(elongation // TITHI_SPAN)),
+            "nakshatra": element_entry("nakshatra", int(moon // NAKSHATRA_SPAN) % 27),
+            "yoga": element_entry("yoga", int((sun + moon) % 360.0 // NAKSHATRA_SPAN)),
+            "karana": element_entry("karana", int(elongation // KARANA_SPAN)),
+            "moon_elongation": round(elongation, 4),
+        },
+    }
+
+
+class CurrentSky:
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        self.interval = max(float(interval), MIN_INTERVAL)
+        self.frame = None
+        self.subscribers = 0
+        self.computes = 0
+        self.compute_ms = None
+        self.broadcasts = 0
+        self.errors = 0
+        self._changed = None
+        self._lock = None
+        self._task = None
+
+    def bucket_start(self, now=None):
+        now = time.time() if now is None else now
+        return now // self.interval * self.interval
+
+    def seconds_left(self, now=None):
+        """Until the next bucket starts"""
+        now = time.time() if now is None else now
+        return max(self.bucket_start(now) + self.interval - now, 0.0)
+
+    def _publish(self, bucket, snapshot):
+        version = self.frame.version + 1 if self.frame else 1
+        snapshot["bucket_seconds"] = self.interval
+        snapshot["next_update"] = jd_to_iso(unix_to_jd(bucket + self.interval))
+        text = json.dumps(snapshot)
+        self.frame = SkyFrame(
+            version, bucket, text.encode(), text, f"id: {version}\nevent: sky\ndata: {text}\n\n".encode(),
+            '"' + hashlib.sha256(text.encode()).hexdigest()[:32] + '"',
+        )
+        if self.subscribers:
+            self.broadcasts += 1
+        # Wake every waiting subscriber at once; later waits use a fresh event
+        changed, self._changed = self._changed, asyncio.Event()
+        if changed is not None:
+            changed.set()
+
+    async def refresh(self):
+        """Publish the snapshot of the current bucket unless it already has been; returns the frame"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            bucket = self.bucket_start()
+            if self.frame is None or self.frame.bucket != bucket:
+                t0 = time.perf_counter()
+                snapshot = await run_in_threadpool(sky_snapshot, unix_to_jd(bucket))
+                self.compute_ms = (time.perf_counter() - t0) * 1000.0
+                self.computes += 1
+                self._publish(bucket, snapshot)
+        return self.frame
+
+    async def updates(self):
+        """The current frame, then every newly published one, for as long as the caller iterates"""
+        self.start()
+        frame = await self.refresh()
+        self.subscribers += 1
+        try:
+            while True:
+                yield frame
+                while self.frame.version == frame.version:
+                    await self._changed.wait()
+                frame = self.frame
+        finally:
+            self.subscribers -= 1
+
+    async def run_forever(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                self.errors += 1
+                logger.exception("Current sky update failed: %s", e)
+            # Just past the boundary so bucket_start() has moved on
+            await asyncio.sleep(self.seconds_left() + 0.05)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self.run_forever())
+        return self._task
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        return {
+            "interval_seconds": self.interval,
+            "running": self._task is not None and not self._task.done(),
+            "version": self.frame.version if self.frame else 0,
+            "bucket": jd_to_iso(unix_to_jd(self.frame.bucket)) if self.frame else None,
+            "subscribers": self.subscribers,
+            "computes": self.computes,
+            "compute_ms": round(self.compute_ms, 3) if self.compute_ms is not None else None,
+            "broadcasts": self.broadcasts,
+            "payload_bytes": len(self.frame.payload) if self.frame else 0,
+            "errors": self.errors,
+        }
+
+
+_current_sky = None
+
+
+def get_current_sky():
+    """Shared feed, bucketed every CURRENT_SKY_INTERVAL seconds (default 60)"""
+    global _current_sky
+    if _current_sky is None:
+        _current_sky = CurrentSky(float(os.getenv("CURRENT_SKY_INTERVAL", DEFAULT_INTERVAL)))
+    return _current_sky
+
+
+def start_current_sky():
+    return get_current_sky().start()
+
+
+async def stop_current_sky():
+    if _current_sky is not None:
+        await _current_sky.stop()
@@ -0,0 +1,200 @@
+"""
+Vimshottari dasha engine.
+
+The 120-year cycle of nine lords starts from the lord of the Moon's birth
+nakshatra, with the part of that first Mahadasha the Moon had already
+travelled through removed (the "balance"). Every period of lord L divides
+into nine sub-periods in the same proportions (lord L first, then the
+sequence in order, each lasting years[sub] / 120 of the parent), at any
+depth. So each lord's subdivision is precomputed once as a cumulative
+fraction array, and:
+
+  * period_at() finds the running period at every level by bisecting those
+    arrays, one level at a time; nothing else of the 120-year tree is built.
+  * timeline() expands a level only for the periods that overlap the
+    requested window.
+  * periods_at_bulk() does the period_at() walk for many charts at once with
+    numpy.
+
+Times are UT Julian days; a dasha year is 365.25 days.
+"""
+import bisect
+from typing import NamedTuple, Tuple
+
+import numpy as np
+
+from services.vedic import NAKSHATRA_SPAN, NAKSHATRAS, jd_to_iso
+
+DASHA_LORDS = ("Ketu", "Venus", "Sun", "Moon", "Mars", "Rahu", "Jupiter", "Saturn", "Mercury")
+DASHA_YEARS = (7, 20, 6, 10, 7, 18, 16, 19, 17)
+CYCLE_YEARS = 120
+YEAR_DAYS = 365.25
+CYCLE_DAYS = CYCLE_YEARS * YEAR_DAYS
+LEVELS = ("mahadasha", "antardasha", "pratyantardasha", "sookshma", "prana")
+
+# _FRACTIONS[lord]: where each of the lord's nine sub-periods starts, as a
+# fraction of the lord's period, plus 1.0 for the end
+_FRACTIONS = []
+for _lord in range(9):
+    _years = [DASHA_YEARS[(_lord + i) % 9] for i in range(9)]
+    _FRACTIONS.append([0.0] + list(np.cumsum(_years) / CYCLE_YEARS))
+_FRACTIONS_ARRAY = np.array(_FRACTIONS)
+
+
+class Period(NamedTuple):
+    lords: Tuple[int, ...]  # lord index at each level, Mahadasha first
+    start: float            # UT Julian day
+    end: float
+
+    @property
+    def lord(self):
+        return DASHA_LORDS[self.lords[-1]]
+
+    @property
+    def level(self):
+        return LEVELS[len(self.lords) - 1]
+
+
+def birth_lord(moon_lon):
+    """Index into DASHA_LORDS of the lord of the Moon's nakshatra"""
+    return int((moon_lon % 360.0) // NAKSHATRA_SPAN) % 9
+
+
+def cycle_start(moon_lon, birth_jd):
+    """Julian day on which the birth Mahadasha began (before birth, by the elapsed part)"""
+    elapsed = (moon_lon % NAKSHATRA_SPAN) / NAKSHATRA_SPAN
+    return birth_jd - elapsed * DASHA_YEARS[birth_lord(moon_lon)] * YEAR_DAYS
+
+
+def balance_years(moon_lon):
+    """Years of the birth Mahadasha left at birth"""
+    remaining = 1.0 - (moon_lon % NAKSHATRA_SPAN) / NAKSHATRA_SPAN
+    return remaining * DASHA_YEARS[birth_lord(moon_lon)]
+
+
+def _child(period, index):
+    """The index-th (0..8) sub-period of period"""
+    lord = period.lords[-1]
+    fractions = _FRACTIONS[lord]
+    length = period.end - period.start
+    return Period(period.lords + ((lord + index) % 9,), period.start + fractions[index] * length,
+                  period.start + fractions[index + 1] * length)
+
+
+def sub_periods(period):
+    """The nine sub-periods of a period, computed on demand"""
+    return [_child(period, index) for index in range(9)]
+
+
+def mahadasha_at(moon_lon, birth_jd, jd):
+    """The Mahadasha running at jd (the sequence repeats after 120 years); ValueError before birth"""
+    if jd < birth_jd:
+        raise ValueError("Date is before birth")
+    first = birth_lord(moon_lon)
+    start = cycle_start(moon_lon, birth_jd)
+    cycles, offset = divmod(jd - start, CYCLE_DAYS)
+    cycle = Period((first,), start + cycles * CYCLE_DAYS, start + (cycles + 1) * CYCLE_DAYS)
+    index = min(bisect.bisect_right(_FRACTIONS[first], offset / CYCLE_DAYS) - 1, 8)
+    return _child(cycle, index)._replace(lords=((first + index) % 9,))
+
+
+def period_at(moon_lon, birth_jd, jd, depth=3):
+    """[Mahadasha, Antardasha, ...] running at jd, depth levels deep"""
+    period = mahadasha_at(moon_lon, birth_jd, jd)
+    chain = [period]
+    for _ in range(depth - 1):
+        fraction = (jd - period.start) / (period.end - period.start)
+        index = min(max(bisect.bisect_right(_FRACTIONS[period.lords[-1]], fraction) - 1, 0), 8)
+        period = _child(period, index)
+        chain.append(period)
+    return chain
+
+
+def mahadashas(moon_lon, birth_jd, start_jd, end_jd):
+    """Mahadashas overlapping [start_jd, end_jd], from birth on"""
+    periods = []
+    jd = max(start_jd, birth_jd)
+    while jd <= end_jd:
+        period = mahadasha_at(moon_lon, birth_jd, jd)
+        periods.append(period)
+        jd = period.end + 1e-6
+    return periods
+
+
+def timeline(moon_lon, birth_jd, start_jd, end_jd, depth=3):
+    """
+    Nested period dicts overlapping [start_jd, end_jd]. Sub-periods are only
+    computed for periods inside the window, down to depth levels.
+    """
+    def expand(period):
+        entry = period_dict(period)
+        if len(period.lords) < depth:
+            entry["sub_periods"] = [expand(child) for child in sub_periods(period)
+                                    if child.end > start_jd and child.start <= end_jd]
+        return entry
+
+    return [expand(period) for period in mahadashas(moon_lon, birth_jd, start_jd, end_jd)]
+
+
+def period_dict(period):
+    return {
+        "level": period.level,
+        "lord": period.lord,
+        "start": jd_to_iso(period.start),
+        "end": jd_to_iso(period.end),
+    }
+
+
+def birth_summary(moon_lon, birth_jd):
+    return {
+        "moon_lon": moon_lon,
+        "nakshatra": NAKSHATRAS[int((moon_lon % 360.0) // NAKSHATRA_SPAN)],
+        "birth_lord": DASHA_LORDS[birth_lord(moon_lon)],
+        "balance_years": round(balance_years(moon_lon), 4),
+        "cycle_start": jd_to_iso(cycle_start(moon_lon, birth_jd)),
+    }
+
+
+def periods_at_bulk(moon_lons, birth_jds, jd, depth=3):
+    """
+    Vectorised period_at for many charts at one date.
+
+    Returns (lords, starts, ends): int array (n, depth) of DASHA_LORDS indices
+    (-1 where jd is before birth) and float arrays (n, depth) of Julian days.
+    """
+    moon_lons = np.asarray(moon_lons, dtype=float) % 360.0
+    birth_jds = np.asarray(birth_jds, dtype=float)
+    n = moon_lons.size
+    lords = np.full((n, depth), -1, dtype=np.int64)
+    starts = np.full((n, depth), np.nan)
+    ends = np.full((n, depth), np.nan)
+
+    first = (moon_lons // NAKSHATRA_SPAN).astype(np.int64) % 9
+    elapsed = (moon_lons % NAKSHATRA_SPAN) / NAKSHATRA_SPAN
+    start = birth_jds - elapsed * np.take(DASHA_YEARS, first) * YEAR_DAYS
+    cycles, offset = np.divmod(jd - start, CYCLE_DAYS)
+    parent_lord = first
+    parent_start = start + cycles * CYCLE_DAYS
+    parent_length = np.full(n, CYCLE_DAYS)
+    fraction = offset / CYCLE_DAYS
+    rows = np.arange(n)
+    for level in range(depth):
+        # Row-wise bisect in one searchsorted: shift row i's fractions into [2i, 2i + 1] so the
+        # flattened array stays sorted
+        flat = (_FRACTIONS_ARRAY[parent_lord] + 2.0 * rows[:, None]).ravel()
+        index = np.searchsorted(flat, fraction + 2.0 * rows, side="right") - 1 - rows * 10
+        index = np.clip(index, 0, 8)
+        low = _FRACTIONS_ARRAY[parent_lord, index]
+        high = _FRACTIONS_ARRAY[parent_lord, index + 1]
+        lord = (parent_lord + index) % 9
+        period_start = parent_start + low * parent_length
+        period_length = (high - low) * parent_length
+        lords[:, level], starts[:, level], ends[:, level] = lord, period_start, period_start + period_length
+        fraction = (jd - period_start) / period_length
+        parent_lord, parent_start, parent_length = lord, period_start, period_length
+
+    before_birth = jd < birth_jds
+    lords[before_birth] = -1
+    starts[before_birth] = np.nan
+    ends[before_birth] = np.nan
+    return lords, starts, ends
@@ -0,0 +1,297 @@
+"""
+Precomputed sidereal ephemeris table.
+
+Every chart request calls swe.calc_ut several times with the same flags
+(Moshier + Lahiri sidereal + speed). This module fits Chebyshev segments of
+the sidereal longitude and speed of each body once, stores them in a compact
+binary file and answers lookups by memory-mapping that file and evaluating
+the polynomials, which is roughly an order of magnitude cheaper than a
+swe.calc_ut call.
+
+The table is optional: set EPHEMERIS_TABLE to the file path to enable it.
+Lookups outside the covered range (or with other flags) fall back to swisseph.
+
+    python -m services.ephemeris build            # writes data/sidereal_ephemeris.bin
+    python -m services.ephemeris verify           # error report against swisseph
+"""
+import argparse
+import logging
+import os
+import struct
+import sys
+import threading
+
+import numpy as np
+import swisseph as swe
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TABLE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "sidereal_ephemeris.bin")
+
+TABLE_FLAGS = swe.FLG_MOSEPH | swe.FLG_SIDEREAL | swe.FLG_SPEED
+TABLE_SID_MODE = swe.SIDM_LAHIRI
+
+# Stated accuracy of the table against swisseph, in arc-seconds of longitude.
+ACCURACY_BOUND_ARCSEC = 1.0
+
+# Base segment length in days per body. Chebyshev degree is shared (NCOEF - 1);
+# fast movers get short segments so the same degree keeps them under the bound.
+SEGMENT_DAYS = {
+    swe.SUN: 8.0,
+    swe.MOON: 4.0,
+    swe.MERCURY: 8.0,
+    swe.VENUS: 8.0,
+    swe.MARS: 8.0,
+    swe.JUPITER: 32.0,
+    swe.SATURN: 32.0,
+    swe.URANUS: 32.0,
+    swe.NEPTUNE: 32.0,
+    swe.PLUTO: 32.0,
+    swe.MEAN_NODE: 32.0,
+}
+NCOEF = 13
+
+# Segments whose fit misses swisseph by more than this at the interior check
+# points are split in half.
+FIT_TOLERANCE_ARCSEC = 0.25
+CHECK_POINTS = 8
+MAX_SPLITS = 8
+
+# Gravitational light deflection puts a sub-day feature of up to ~1.7" into a
+# planet's apparent longitude around its conjunction with the Sun, which the
+# check points of a long segment can miss; segments that contain a conjunction
+# (or come within CONJUNCTION_ZONE degrees of one) are always split down to
+# CONJUNCTION_SEGMENT_DAYS.
+CONJUNCTION_ZONE = 3.0
+CONJUNCTION_SEGMENT_DAYS = 1.0
+DEFLECTED_BODIES = {swe.MERCURY, swe.VENUS, swe.MARS, swe.JUPITER, swe.SATURN, swe.URANUS, swe.NEPTUNE, swe.PLUTO}
+
+MAGIC = b"SIDEPH02"
+# magic, flags, sid_mode, ncoef, nbodies, jd_start, jd_end
+HEADER = struct.Struct("<8siiiidd")
+# body id, number of segments, base segment days, byte offset of the boundary array, byte offset of the coefficients
+DIRECTORY = struct.Struct("<iidqq")
+
+
+def _chebyshev_nodes(n):
+    return np.cos(np.pi * (np.arange(n) + 0.5) / n)
+
+
+def _chebyshev_fit(values):
+    """Chebyshev interpolation coefficients for samples taken at _chebyshev_nodes"""
+    n = values.shape[-1]
+    k = np.arange(n) + 0.5
+    basis = np.cos(np.pi * np.outer(np.arange(n), k) / n)  # (degree, node)
+    coefs = (2.0 / n) * values @ basis.T
+    coefs[..., 0] *= 0.5
+    return coefs
+
+
+def _clenshaw(coefs, x):
+    b1 = b2 = 0.0
+    x2 = 2.0 * x
+    for c in coefs[:0:-1]:
+        b1, b2 = x2 * b1 - b2 + c, b1
+    return x * b1 - b2 + coefs[0]
+
+
+def _sample(jds, pid):
+    res = np.array([swe.calc_ut(float(jd), pid, TABLE_FLAGS)[0] for jd in jds])
+    return res[:, 0], res[:, 3]
+
+
+def _fit_segment(pid, start, end, nodes, splits=0):
+    """Fit [start, end) and return a list of (start, coefs), splitting until within tolerance"""
+    mid, half = (start + end) / 2.0, (end - start) / 2.0
+    lon, speed = _sample(mid + nodes * half, pid)
+    # Longitude wraps at 360; fit a continuous curve and reduce after evaluation.
+    # Nodes run from +1 to -1, so unwrap in chronological order.
+    lon = np.unwrap(lon[::-1], period=360.0)[::-1]
+    coefs = np.stack([_chebyshev_fit(lon), _chebyshev_fit(speed)])
+
+    if pid in DEFLECTED_BODIES and end - start > CONJUNCTION_SEGMENT_DAYS:
+        sun_lon, _ = _sample(mid + nodes * half, swe.SUN)
+        elongation = (lon - sun_lon + 180.0) % 360.0 - 180.0
+        crosses = (np.sign(elongation[1:]) != np.sign(elongation[:-1])) & (np.abs(elongation[1:]) < 90.0)
+        if np.abs(elongation).min() < CONJUNCTION_ZONE or crosses.any():
+            return (_fit_segment(pid, start, mid, nodes, splits + 1)
+                    + _fit_segment(pid, mid, end, nodes, splits + 1))
+
+    if splits < MAX_SPLITS:
+        xs = (np.arange(CHECK_POINTS) + 0.5) / CHECK_POINTS * 2.0 - 1.0
+        ref_lon, _ = _sample(mid + xs * half, pid)
+        fit_lon = np.array([_clenshaw(coefs[0].tolist(), x) for x in xs])
+        err = np.abs((fit_lon - ref_lon + 180.0) % 360.0 - 180.0) * 3600.0
+        if err.max() > FIT_TOLERANCE_ARCSEC:
+            return (_fit_segment(pid, start, mid, nodes, splits + 1)
+                    + _fit_segment(pid, mid, end, nodes, splits + 1))
+    return [(start, coefs)]
+
+
+def build_table(path=DEFAULT_TABLE_PATH, start_year=1900, end_year=2100, bodies=None, progress=None):
+    """Fit every body over [start_year, end_year] and write the binary table to path"""
+    bodies = list(bodies or SEGMENT_DAYS)
+    jd_start = swe.julday(start_year, 1, 1, 0.0)
+    jd_end = swe.julday(end_year + 1, 1, 1, 0.0)
+
+    swe.set_ephe_path('')
+    swe.set_sid_mode(TABLE_SID_MODE)
+    nodes = _chebyshev_nodes(NCOEF)
+
+    blocks = []
+    for pid in bodies:
+        seg_days = SEGMENT_DAYS[pid]
+        segments = []
+        start = jd_start
+        while start < jd_end:
+            end = min(start + seg_days, jd_end)
+            segments.extend(_fit_segment(pid, start, end, nodes))
+            start = end
+        bounds = np.array([seg[0] for seg in segments] + [jd_end], dtype="<f8")
+        coefs = np.stack([seg[1] for seg in segments]).astype("<f8")  # (nseg, 2, NCOEF)
+        blocks.append((pid, len(segments), seg_days, bounds, coefs))
+        if progress:
+            progress(pid, len(segments))
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as fh:
+        fh.write(HEADER.pack(MAGIC, TABLE_FLAGS, TABLE_SID_MODE, NCOEF, len(blocks), jd_start, jd_end))
+        offset = HEADER.size + DIRECTORY.size * len(blocks)
+        for pid, nseg, seg_days, bounds, coefs in blocks:
+            fh.write(DIRECTORY.pack(pid, nseg, seg_days, offset, offset + bounds.nbytes))
+            offset += bounds.nbytes + coefs.nbytes
+        for _, _, _, bounds, coefs in blocks:
+            fh.write(bounds.tobytes())
+            fh.write(coefs.tobytes())
+    os.replace(tmp_path, path)
+    return path
+
+
+class EphemerisTable:
+    """Memory-mapped Chebyshev table of sidereal longitude and speed"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as fh:
+            magic, self.flags, self.sid_mode, self.ncoef, nbodies, self.jd_start, self.jd_end = HEADER.unpack(fh.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a sidereal ephemeris table")
+            directory = [DIRECTORY.unpack(fh.read(DIRECTORY.size)) for _ in range(nbodies)]
+
+        self.segments = {}
+        for pid, nseg, seg_days, bounds_offset, coefs_offset in directory:
+            # Plain ndarray views over the mapping skip np.memmap's per-index overhead
+            bounds = np.memmap(path, dtype="<f8", mode="r", offset=bounds_offset, shape=(nseg + 1,)).view(np.ndarray)
+            coefs = np.memmap(path, dtype="<f8", mode="r", offset=coefs_offset, shape=(nseg, 2, self.ncoef)).view(np.ndarray)
+            self.segments[pid] = (bounds, coefs)
+
+    def covers(self, jd, pid):
+        return pid in self.segments and self.jd_start <= jd < self.jd_end
+
+    def lookup(self, jd, pid):
+        """Sidereal (longitude, speed) of a body at a UT Julian day"""
+        bounds, coefs = self.segments[pid]
+        seg = int(bounds.searchsorted(jd, side="right")) - 1
+        start, end = bounds[seg:seg + 2].tolist()
+        x = 2.0 * (jd - start) / (end - start) - 1.0
+        lon_coefs, speed_coefs = coefs[seg].tolist()
+        return _clenshaw(lon_coefs, x) % 360.0, _clenshaw(speed_coefs, x)
+
+    def lookup_many(self, jds, pid):
+        """Vectorised lookup for an array of Julian days; returns (lon, speed) arrays"""
+        bounds, coefs = self.segments[pid]
+        jds = np.asarray(jds, dtype=float)
+        seg = bounds.searchsorted(jds, side="right") - 1
+        start, end = bounds[seg], bounds[seg + 1]
+        x = 2.0 * (jds - start) / (end - start) - 1.0
+        block = np.asarray(coefs[seg])  # (n, 2, ncoef)
+        b1 = np.zeros(block.shape[:2])
+        b2 = np.zeros_like(b1)
+        x2 = (2.0 * x)[:, None]
+        for j in range(self.ncoef - 1, 0, -1):
+            b1, b2 = x2 * b1 - b2 + block[:, :, j], b1
+        values = x[:, None] * b1 - b2 + block[:, :, 0]
+        return values[:, 0] % 360.0, values[:, 1]
+
+    def is_retrograde(self, jd, pid):
+        return self.lookup(jd, pid)[1] < 0
+
+
+_table = None
+_table_loaded = False
+_table_lock = threading.Lock()
+
+
+def get_table():
+    """Return the table configured by EPHEMERIS_TABLE, or None when disabled/unavailable"""
+    global _table, _table_loaded
+    if not _table_loaded:
+        with _table_lock:
+            if not _table_loaded:
+                path = os.getenv("EPHEMERIS_TABLE", "").strip()
+                if path:
+                    try:
+                        _table = EphemerisTable(path)
+                    except (OSError, ValueError) as e:
+                        logger.warning("Ephemeris table unavailable (%s) -> Using swisseph", e)
+                # Only after _table is set, so concurrent first callers never see a premature None
+                _table_loaded = True
+    return _table
+
+
+def calc_lon_speed(jd, pid, flags=TABLE_FLAGS, sid_mode=TABLE_SID_MODE):
+    """Sidereal longitude and speed, served from the table when it covers the request"""
+    table = get_table()
+    if table is not None and flags == table.flags and sid_mode == table.sid_mode and table.covers(jd, pid):
+        return table.lookup(jd, pid)
+    res = swe.calc_ut(jd, pid, flags)[0]
+    return res[0], res[3]
+
+
+def verify(table, samples=20000, seed=0):
+    """Compare random table lookups with swisseph; returns per-body max errors"""
+    swe.set_ephe_path('')
+    swe.set_sid_mode(table.sid_mode)
+    rng = np.random.default_rng(seed)
+    jds = rng.uniform(table.jd_start, table.jd_end, samples)
+    report = {}
+    for pid in table.segments:
+        lon, speed = table.lookup_many(jds, pid)
+        ref = np.array([swe.calc_ut(float(jd), pid, table.flags)[0] for jd in jds])
+        lon_err = np.abs((lon - ref[:, 0] + 180.0) % 360.0 - 180.0) * 3600.0
+        report[swe.get_planet_name(pid)] = {
+            "max_lon_error_arcsec": float(lon_err.max()),
+            "max_speed_error_deg_per_day": float(np.abs(speed - ref[:, 3]).max()),
+            "retrograde_mismatches": int(np.count_nonzero((speed < 0) != (ref[:, 3] < 0))),
+        }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or verify the sidereal ephemeris table")
+    parser.add_argument("command", choices=["build", "verify"])
+    parser.add_argument("--path", default=os.getenv("EPHEMERIS_TABLE") or DEFAULT_TABLE_PATH)
+    parser.add_argument("--start", type=int, default=1900, help="first year covered")
+    parser.add_argument("--end", type=int, default=2100, help="last year covered")
+    parser.add_argument("--samples", type=int, default=20000, help="random epochs checked by verify")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        build_table(args.path, args.start, args.end,
+                    progress=lambda pid, nseg: print(f"{swe.get_planet_name(pid)}: {nseg} segments"))
+        print(f"Wrote {args.path} ({os.path.getsize(args.path) / 1e6:.1f} MB)")
+        return 0
+
+    report = verify(EphemerisTable(args.path), samples=args.samples)
+    worst = 0.0
+    for name, row in report.items():
+        worst = max(worst, row["max_lon_error_arcsec"])
+        print(f"{name:10s} lon {row['max_lon_error_arcsec']:.4f}\"  speed {row['max_speed_error_deg_per_day']:.2e} deg/day  retro mismatches {row['retrograde_mismatches']}")
+    ok = worst <= ACCURACY_BOUND_ARCSEC
+    print(f"Max longitude error {worst:.4f}\" (bound {ACCURACY_BOUND_ARCSEC}\") -> {'OK' if ok else 'FAIL'}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,421 @@
+"""
+Catalog of solar eclipses, lunar eclipses and planetary conjunctions.
+
+Searching for eclipses with swisseph costs milliseconds per event, so every
+event of a long span (1900-2100 by default) is found once and written to a
+compact binary file: a sorted array of UT Julian days followed by a parallel
+array of fixed-size records. The file is memory-mapped and a date range is
+answered by bisecting the Julian day array; nothing outside the returned
+slice is read. Local circumstances (visibility, contact times, altitudes)
+depend on the observer, so they are computed only for the events a query
+returns.
+
+Conjunctions are in sidereal (Lahiri) longitude between the five naked-eye
+planets; Jupiter-Saturn conjunctions are flagged as great conjunctions.
+
+    python -m services.events build             # writes data/event_catalog.bin
+    python -m services.events query 2024-01-01 2025-01-01
+"""
+import argparse
+import datetime
+import itertools
+import logging
+import os
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import swisseph as swe
+
+from services.chart_engine import FLAGS, ensure_configured
+from services.ephemeris import calc_lon_speed
+from services.transits import solve_bracketed
+from services.vedic import date_to_jd, jd_to_iso, sign_of
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "event_catalog.bin")
+
+MAGIC = b"EVCAT001"
+# magic, event count, first and last covered Julian day
+HEADER = struct.Struct("<8sIdd")
+RECORD = np.dtype([
+    ("kind", "u1"),
+    ("type", "u1"),
+    ("body1", "u1"),
+    ("body2", "u1"),
+    ("magnitude", "<f4"),   # eclipse magnitude, or conjunction separation in latitude (degrees)
+    ("penumbral", "<f4"),   # lunar penumbral magnitude
+    ("lon", "<f4"),         # sidereal longitude of the Sun / Moon / conjunction
+    ("geo_lon", "<f4"),     # where a solar eclipse is greatest
+    ("geo_lat", "<f4"),
+])
+
+EVENT_KINDS = ("solar_eclipse", "lunar_eclipse", "conjunction")
+ECLIPSE_TYPES = ("", "total", "annular", "hybrid", "partial", "penumbral")
+CONJUNCTION_BODIES = {
+    "Mercury": swe.MERCURY, "Venus": swe.VENUS, "Mars": swe.MARS, "Jupiter": swe.JUPITER, "Saturn": swe.SATURN,
+}
+BODY_NAMES = {pid: name for name, pid in CONJUNCTION_BODIES.items()}
+BODY_NAMES.update({swe.SUN: "Sun", swe.MOON: "Moon"})
+GREAT_CONJUNCTION = (swe.JUPITER, swe.SATURN)
+
+# Conjunctions are bracketed on this grid; short enough that no pair meets twice between samples
+CONJUNCTION_STEP_DAYS = 2.0
+# A conjunction counts as visible when the planets are up and the Sun is below civil twilight
+TWILIGHT_ALTITUDE = -6.0
+MAX_EVENTS = 500
+
+
+def _eclipse_type(retflags, lunar=False):
+    if lunar:
+        checks = ((swe.ECL_TOTAL, 1), (swe.ECL_PARTIAL, 4), (swe.ECL_PENUMBRAL, 5))
+    else:
+        checks = ((swe.ECL_ANNULAR_TOTAL, 3), (swe.ECL_TOTAL, 1), (swe.ECL_ANNULAR, 2), (swe.ECL_PARTIAL, 4))
+    for flag, code in checks:
+        if retflags & flag:
+            return code
+    return 0
+
+
+def _solar_eclipses(jd_start, jd_end):
+    rows = []
+    jd = jd_start
+    while True:
+        retflags, tret = swe.sol_eclipse_when_glob(jd, swe.FLG_MOSEPH)
+        if tret[0] >= jd_end:
+            return rows
+        _, geopos, attr = swe.sol_eclipse_where(tret[0], swe.FLG_MOSEPH)
+        sun_lon = swe.calc_ut(tret[0], swe.SUN, FLAGS)[0][0]
+        rows.append((tret[0], (0, _eclipse_type(retflags), swe.SUN, swe.MOON, attr[0], np.nan,
+                               sun_lon, geopos[0], geopos[1])))
+        # Eclipses are at least a lunation apart
+        jd = tret[0] + 20.0
+
+
+def _lunar_eclipses(jd_start, jd_end):
+    rows = []
+    jd = jd_start
+    while True:
+        retflags, tret = swe.lun_eclipse_when(jd, swe.FLG_MOSEPH)
+        if tret[0] >= jd_end:
+            return rows
+        _, attr = swe.lun_eclipse_how(tret[0], (0.0, 0.0, 0.0), swe.FLG_MOSEPH)
+        moon_lon = swe.calc_ut(tret[0], swe.MOON, FLAGS)[0][0]
+        rows.append((tret[0], (1, _eclipse_type(retflags, lunar=True), swe.SUN, swe.MOON, attr[0], attr[1],
+                               moon_lon, np.nan, np.nan)))
+        jd = tret[0] + 20.0
+
+
+def _wrap(diff):
+    return (diff + 180.0) % 360.0 - 180.0
+
+
+def _conjunctions(jd_start, jd_end):
+    n = int(np.ceil((jd_end - jd_start) / CONJUNCTION_STEP_DAYS)) + 1
+    grid = jd_start + np.arange(n) * CONJUNCTION_STEP_DAYS
+    lons = {pid: np.array([calc_lon_speed(float(jd), pid, FLAGS)[0] for jd in grid])
+            for pid in CONJUNCTION_BODIES.values()}
+    rows = []
+    for a, b in itertools.combinations(sorted(lons), 2):
+        diff = _wrap(lons[a] - lons[b])
+        # A sign change near 0° (not the jump at ±180°) brackets a conjunction
+        hits = np.nonzero((np.sign(diff[1:]) != np.sign(diff[:-1])) & (np.abs(diff[:-1] - diff[1:]) < 180.0))[0]
+        for i in hits:
+
+            def f(t, a=a, b=b):
+                return _wrap(calc_lon_speed(t, a, FLAGS)[0] - calc_lon_speed(t, b, FLAGS)[0])
+
+            jd = solve_bracketed(f, grid[i], grid[i + 1], diff[i], diff[i + 1])
+            if not jd_start <= jd < jd_end:
+                continue
+            pos_a = swe.calc_ut(jd, a, FLAGS)[0]
+            pos_b = swe.calc_ut(jd, b, FLAGS)[0]
+            rows.append((jd, (2, 0, a, b, abs(pos_a[1] - pos_b[1]), np.nan, pos_a[0], np.nan, np.nan)))
+    return rows
+
+
+def build_catalog(path=DEFAULT_CATALOG_PATH, start_year=1900, end_year=2100):
+    """Find every event in [start_year, end_year] and write the sorted catalog to path"""
+    ensure_configured()
+    jd_start = swe.julday(start_year, 1, 1, 0.0)
+    jd_end = swe.julday(end_year + 1, 1, 1, 0.0)
+    rows = _solar_eclipses(jd_start, jd_end) + _lunar_eclipses(jd_start, jd_end) + _conjunctions(jd_start, jd_end)
+    rows.sort(key=lambda row: row[0])
+    jds = np.array([row[0] for row in rows], dtype="<f8")
+    records = np.array([row[1] for row in rows], dtype=RECORD)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as fh:
+        fh.write(HEADER.pack(MAGIC, len(rows), jd_start, jd_end))
+        fh.write(jds.tobytes())
+        fh.write(records.tobytes())
+    os.replace(tmp_path, path)
+    return path
+
+
+def _iso(jd):
+    # swisseph reports contacts that do not happen (or are not visible) as 0
+    return jd_to_iso(jd) if jd > 0 else None
+
+
+class EventCatalog:
+    """Memory-mapped, time-sorted event catalog"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as fh:
+            magic, self.count, self.jd_start, self.jd_end = HEADER.unpack(fh.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an event catalog")
+        self.jds = np.memmap(path, dtype="<f8", mode="r", offset=HEADER.size, shape=(self.count,)).view(np.ndarray)
+        self.records = np.memmap(path, dtype=RECORD, mode="r", offset=HEADER.size + self.jds.nbytes,
+                                 shape=(self.count,)).view(np.ndarray)
+
+    def search(self, jd_start, jd_end, kinds=EVENT_KINDS, planets=None, limit=MAX_EVENTS):
+        """
+        Event dicts in [jd_start, jd_end), oldest first. planets restricts
+        conjunctions to those involving one of the named planets.
+        """
+        lo, hi = self.jds.searchsorted([jd_start, jd_end], side="left").tolist()
+        records = self.records[lo:hi]
+        mask = np.isin(records["kind"], [EVENT_KINDS.index(kind) for kind in kinds])
+        if planets:
+            ids = [CONJUNCTION_BODIES[name] for name in planets]
+            mask &= (records["kind"] != 2) | np.isin(records["body1"], ids) | np.isin(records["body2"], ids)
+        index = np.nonzero(mask)[0][:limit]
+        return [self._event(jd, record) for jd, record in zip(self.jds[lo:hi][index].tolist(), records[index].tolist())]
+
+    @staticmethod
+    def _event(jd, record):
+        kind, etype, body1, body2, magnitude, penumbral, lon, geo_lon, geo_lat = record
+        event = {"type": EVENT_KINDS[kind], "jd": jd, "time": jd_to_iso(jd), "sign": sign_of(lon), "lon": round(lon, 4)}
+        if kind == 2:
+            event["planets"] = [BODY_NAMES[body1], BODY_NAMES[body2]]
+            event["separation"] = round(magnitude, 4)
+            event["great"] = (body1, body2) == GREAT_CONJUNCTION
+            return event
+        event["eclipse_type"] = ECLIPSE_TYPES[etype]
+        event["magnitude"] = round(magnitude, 4)
+        if kind == 0:
+            event["greatest_at"] = {"lat": round(geo_lat, 4), "lon": round(geo_lon, 4)}
+        else:
+            event["penumbral_magnitude"] = round(penumbral, 4)
+        return event
+
+    def stats(self):
+        kinds = np.bincount(self.records["kind"], minlength=len(EVENT_KINDS)).tolist()
+        return {
+            "path": self.path,
+            "size_bytes": os.path.getsize(self.path),
+            "events": self.count,
+            "by_kind": dict(zip(EVENT_KINDS, kinds)),
+            "start": jd_to_iso(self.jd_start),
+            "end": jd_to_iso(self.jd_end),
+        }
+
+
+def _solar_local(event, geopos):
+    retflags, tret, attr = swe.sol_eclipse_when_loc(event["jd"] - 1.0, geopos, swe.FLG_MOSEPH)
+    # when_loc finds the next eclipse seen from geopos; a later one means this one is not visible there
+    if abs(tret[0] - event["jd"]) > 0.5:
+        return {"visible": False}
+    return {
+        "visible": True,
+        "eclipse_type": ECLIPSE_TYPES[_eclipse_type(retflags)],
+        "maximum": _iso(tret[0]),
+        "begins": _iso(tret[1]),
+        "totality_begins": _iso(tret[2]),
+        "totality_ends": _iso(tret[3]),
+        "ends": _iso(tret[4]),
+        "magnitude": round(attr[0], 4),
+        "obscuration": round(min(attr[2], 1.0), 4),
+        "sun_altitude": round(attr[5], 2),
+    }
+
+
+def _lunar_local(event, geopos):
+    retflags, tret, attr = swe.lun_eclipse_when_loc(event["jd"] - 1.0, geopos, swe.FLG_MOSEPH)
+    if abs(tret[0] - event["jd"]) > 0.5:
+        return {"visible": False}
+    return {
+        "visible": True,
+        "maximum": _iso(tret[0]),
+        "penumbral_begins": _iso(tret[6]),
+        "partial_begins": _iso(tret[2]),
+        "totality_begins": _iso(tret[4]),
+        "totality_ends": _iso(tret[5]),
+        "partial_ends": _iso(tret[3]),
+        "penumbral_ends": _iso(tret[7]),
+        "moon_altitude": round(attr[5], 2),
+    }
+
+
+def _altitude(jd, pid, geopos):
+    pos = swe.calc_ut(jd, pid, swe.FLG_MOSEPH)[0]
+    return pos[0], swe.azalt(jd, swe.ECL2HOR, geopos, 0.0, 0.0, pos[:3])[1]
+
+
+def _conjunction_local(event, geopos):
+    jd = event["jd"]
+    sun_lon, sun_alt = _altitude(jd, swe.SUN, geopos)
+    altitudes, elongations = {}, {}
+    for name in event["planets"]:
+        planet_lon, alt = _altitude(jd, CONJUNCTION_BODIES[name], geopos)
+        altitudes[name] = round(alt, 2)
+        elongations[name] = round(abs(_wrap(planet_lon - sun_lon)), 2)
+    return {
+        "visible": min(altitudes.values()) > 0.0 and sun_alt < TWILIGHT_ALTITUDE,
+        "altitudes": altitudes,
+        "elongations": elongations,
+        "sun_altitude": round(sun_alt, 2),
+    }
+
+
+_LOCAL = {"solar_eclipse": _solar_local, "lunar_eclipse": _lunar_local, "conjunction": _conjunction_local}
+
+
+def add_local_circumstances(events, lat, lon):
+    """Attach a "local" dict (visibility, contacts, altitudes at lat/lon) to each event in place"""
+    ensure_configured()
+    geopos = (lon, lat, 0.0)
+    for event in events:
+        event["local"] = _LOCAL[event["type"]](event, geopos)
+    return events
+
+
+class CatalogNotReady(Exception):
+    """The catalog file does not exist (yet)"""
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+_build_process = None
+
+
+def catalog_path():
+    return os.getenv("EVENT_CATALOG", DEFAULT_CATALOG_PATH)
+
+
+def get_event_catalog():
+    """
+    Shared catalog from EVENT_CATALOG (default data/event_catalog.bin).
+    Raises CatalogNotReady while the file is missing; it is never built here.
+    """
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            try:
+                _catalog = EventCatalog(catalog_path())
+            except (OSError, ValueError, struct.error) as e:
+                building = _build_process is not None and _build_process.poll() is None
+                raise CatalogNotReady(
+                    "Event catalog is being built, try again shortly" if building
+                    else "Event catalog not built; run python -m services.events build"
+                ) from e
+        return _catalog
+
+
+def _lower_priority():
+    # Linux: run only when no other process wants the CPU; elsewhere the lowest nice level
+    if hasattr(os, "sched_setscheduler") and hasattr(os, "SCHED_IDLE"):
+        os.sched_setscheduler(0, os.SCHED_IDLE, os.sched_param(0))
+    else:
+        os.nice(19)
+
+
+def start_catalog_build():
+    """
+    Called at startup. The catalog is meant to be prebuilt (python -m
+    services.events build); a missing one is only logged, since building it
+    takes seconds of CPU the server needs for requests. With
+    EVENT_CATALOG_BUILD=1 it is built instead in a separate, lowest-priority
+    process that survives a server shutdown and writes the file when done.
+    Returns that process, or None.
+    """
+    global _build_process
+    path = catalog_path()
+    if os.path.exists(path):
+        return None
+    if os.getenv("EVENT_CATALOG_BUILD", "0") != "1":
+        logger.warning("Event catalog %s is missing; /events answers 503 until it is built with "
+                       "python -m services.events build", path)
+        return None
+    if _build_process is not None and _build_process.poll() is None:
+        return _build_process
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if os.name == "posix":
+        options = {"preexec_fn": _lower_priority, "start_new_session": True}
+    else:
+        options = {"creationflags": subprocess.BELOW_NORMAL_PRIORITY_CLASS}
+    logger.info("Building event catalog %s in the background", path)
+    _build_process = subprocess.Popen(
+        [sys.executable, "-m", "services.events", "--path", path, "build"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        stdout=subprocess.DEVNULL, **options,
+    )
+    return _build_process
+
+
+def catalog_stats():
+    return get_event_catalog().stats()
+
+
+def find_events(start, end, kinds=EVENT_KINDS, planets=None, lat=None, lon=None, limit=MAX_EVENTS):
+    """
+    Catalog events between two datetime.dates (00:00 UTC, end exclusive),
+    with local circumstances when lat and lon are given. ValueError for bad
+    filters or an empty range.
+    """
+    if end <= start:
+        raise ValueError("end must be after start")
+    unknown = [kind for kind in kinds if kind not in EVENT_KINDS]
+    if unknown:
+        raise ValueError(f"Unknown event kind(s) {unknown}. Supported: {', '.join(EVENT_KINDS)}")
+    unknown = [name for name in planets or () if name not in CONJUNCTION_BODIES]
+    if unknown:
+        raise ValueError(f"Unknown planet(s) {unknown}. Supported: {', '.join(CONJUNCTION_BODIES)}")
+    if not 1 <= limit <= MAX_EVENTS:
+        raise ValueError(f"limit must be between 1 and {MAX_EVENTS}")
+    events = get_event_catalog().search(date_to_jd(start), date_to_jd(end), kinds, planets, limit)
+    if lat is not None and lon is not None:
+        add_local_circumstances(events, lat, lon)
+    return events
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query the eclipse and conjunction catalog")
+    parser.add_argument("--path", default=os.getenv("EVENT_CATALOG") or DEFAULT_CATALOG_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build")
+    build.add_argument("--start", type=int, default=1900, help="first year covered")
+    build.add_argument("--end", type=int, default=2100, help="last year covered")
+    query = sub.add_parser("query")
+    query.add_argument("start", help="YYYY-MM-DD")
+    query.add_argument("end", help="YYYY-MM-DD")
+    query.add_argument("--kinds", default=",".join(EVENT_KINDS))
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        t0 = time.perf_counter()
+        build_catalog(args.path, args.start, args.end)
+        catalog = EventCatalog(args.path)
+        print(f"Wrote {args.path}: {catalog.count} events, {os.path.getsize(args.path) / 1e3:.1f} kB "
+              f"in {time.perf_counter() - t0:.1f} s")
+        return 0
+
+    catalog = EventCatalog(args.path)
+    start = date_to_jd(datetime.date.fromisoformat(args.start))
+    end = date_to_jd(datetime.date.fromisoformat(args.end))
+    for event in catalog.search(start, end, args.kinds.split(",")):
+        detail = event.get("eclipse_type") or "-".join(event["planets"])
+        print(f"{event['time']}  {event['type']:13s} {detail:16s} {event['sign']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,243 @@
+"""
+Columnar export of charts for bulk birth records (Parquet or Arrow IPC).
+
+Records are streamed from an NDJSON, CSV or JSON file, computed a chunk at a
+time on the chart engine (bypassing the request cache, which millions of
+one-off charts would only churn) and written straight from numpy arrays as
+one row group / record batch per chunk, so memory stays bounded by the chunk
+size however long the input is. Every value is a fixed-width column: for each
+body <name>_lon, <name>_speed (float64) and <name>_retro (bool), then the
+ascendant, MC and cusp_1..cusp_12. Records that fail keep their row with NaN
+values and the reason in the error column.
+
+An Arrow IPC file memory-maps and loads without copying:
+
+    pyarrow.ipc.open_file(pyarrow.memory_map("charts.arrow")).read_all()
+
+pyarrow is only needed here (pip install pyarrow).
+
+    python -m services.export users.ndjson charts.parquet
+    python -m services.export users.csv charts.arrow --chunk 100000
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from services.chart_core import PLANETS_MAP, birth_chart_job
+from services.chart_engine import get_chart_engine, shutdown_chart_engine
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional: only the export needs it
+    pa = pq = None
+
+BODY_NAMES = list(PLANETS_MAP.values()) + ["Ketu"]
+RAHU_INDEX = BODY_NAMES.index("Rahu")
+CUSPS = 12
+DEFAULT_CHUNK = 65536
+FORMATS = {".parquet": "parquet", ".pq": "parquet", ".arrow": "arrow", ".ipc": "arrow", ".feather": "arrow"}
+RECORD_FIELDS = ("dob", "time", "place", "lat", "lon", "timezone", "ayanamsa", "house_system")
+
+
+def _schema():
+    fields = [
+        pa.field("row", pa.int64()),
+        pa.field("id", pa.string()),
+        pa.field("julian_day", pa.float64()),
+        pa.field("lat", pa.float64()),
+        pa.field("lon", pa.float64()),
+    ]
+    for name in BODY_NAMES:
+        key = name.lower()
+        fields += [pa.field(f"{key}_lon", pa.float64()), pa.field(f"{key}_speed", pa.float64()),
+                   pa.field(f"{key}_retro", pa.bool_())]
+    fields += [pa.field("ascendant", pa.float64()), pa.field("mc", pa.float64())]
+    fields += [pa.field(f"cusp_{i}", pa.float64()) for i in range(1, CUSPS + 1)]
+    fields.append(pa.field("error", pa.string()))
+    return pa.schema(fields)
+
+
+def read_records(path):
+    """Yield birth records (dicts) from an .ndjson/.jsonl, .csv or .json (array) file"""
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, encoding="utf-8", newline="") as fh:
+        if ext in (".ndjson", ".jsonl"):
+            for line in fh:
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except ValueError as e:
+                        yield e
+        elif ext == ".csv":
+            yield from csv.DictReader(fh)
+        elif ext == ".json":
+            # A JSON array has to be parsed whole; use NDJSON or CSV for very large inputs
+            records = json.load(fh)
+            yield from (records.get("records", []) if isinstance(records, dict) else records)
+        else:
+            raise ValueError(f"Unsupported input '{ext}'; use .ndjson, .jsonl, .csv or .json")
+
+
+def _float_or_none(value):
+    return None if value in (None, "") else float(value)
+
+
+def record_job(record):
+    """ChartJob for one input record; ValueError (with the reason) for a bad one"""
+    if isinstance(record, Exception):
+        raise ValueError(f"Invalid JSON: {record}")
+    if not isinstance(record, dict):
+        raise ValueError("Record must be a JSON object")
+    # CSV gives "" for empty cells
+    fields = {key: None if record.get(key) in (None, "") else record[key] for key in RECORD_FIELDS}
+    if not fields["dob"] or not fields["time"]:
+        raise ValueError("dob and time are required")
+    job, _, _ = birth_chart_job(
+        str(fields["dob"]), str(fields["time"]), fields["place"] or "", _float_or_none(fields["lat"]),
+        _float_or_none(fields["lon"]), fields["timezone"], fields["ayanamsa"] or "lahiri", fields["house_system"] or "W",
+    )
+    return job
+
+
+def chunk_table(first_row, records, engine):
+    """An Arrow table for one chunk of input records"""
+    n = len(records)
+    jobs, rows, errors = [], [], [None] * n
+    for i, record in enumerate(records):
+        try:
+            jobs.append(record_job(record))
+            rows.append(i)
+        except (ValueError, TypeError) as e:
+            errors[i] = str(e) or "Invalid date/time format"
+
+    bodies = np.full((n, len(BODY_NAMES), 2), np.nan)
+    houses = np.full((n, CUSPS + 2), np.nan)  # ascendant, MC, cusps
+    meta = np.full((n, 3), np.nan)            # julian day, lat, lon
+    for i, job, raw in zip(rows, jobs, engine.compute_many(jobs)):
+        if isinstance(raw, Exception):
+            errors[i] = f"Calculation failed: {raw}"
+            continue
+        bodies[i, :RAHU_INDEX + 1] = raw["bodies"]
+        houses[i, 0], houses[i, 1] = raw["ascmc"][0], raw["ascmc"][1]
+        houses[i, 2:] = raw["cusps"][:CUSPS]
+        meta[i] = job.jd, job.lat, job.lon
+    # Ketu: opposite the (mean) node and, like it, always retrograde
+    bodies[:, -1, 0] = (bodies[:, RAHU_INDEX, 0] + 180.0) % 360.0
+    bodies[:, -1, 1] = bodies[:, RAHU_INDEX, 1]
+
+    ok = np.array([e is None for e in errors])
+    columns = [
+        pa.array(np.arange(first_row, first_row + n, dtype=np.int64)),
+        pa.array([None if not isinstance(r, dict) or r.get("id") in (None, "") else str(r["id"]) for r in records],
+                 pa.string()),
+        pa.array(meta[:, 0]), pa.array(meta[:, 1]), pa.array(meta[:, 2]),
+    ]
+    for b in range(len(BODY_NAMES)):
+        speed = bodies[:, b, 1]
+        columns += [pa.array(bodies[:, b, 0]), pa.array(speed), pa.array(speed < 0, mask=~ok)]
+    columns += [pa.array(houses[:, c]) for c in range(CUSPS + 2)]
+    columns.append(pa.array(errors, pa.string()))
+    return pa.Table.from_arrays(columns, schema=_schema())
+
+
+class _Writer:
+    """One row group (Parquet) or record batch (Arrow IPC) per write"""
+
+    def __init__(self, path, fmt, compression):
+        self.fmt = fmt
+        if fmt == "parquet":
+            self.writer = pq.ParquetWriter(path, _schema(), compression=compression)
+        else:
+            self.sink = pa.OSFile(path, "wb")
+            options = pa.ipc.IpcWriteOptions(compression=None if compression == "none" else compression)
+            self.writer = pa.ipc.new_file(self.sink, _schema(), options=options)
+
+    def write(self, table):
+        if self.fmt == "parquet":
+            self.writer.write_table(table, row_group_size=table.num_rows)
+        else:
+            for batch in table.to_batches(max_chunksize=table.num_rows):
+                self.writer.write_batch(batch)
+
+    def close(self):
+        self.writer.close()
+        if self.fmt == "arrow":
+            self.sink.close()
+
+
+def export_charts(records, path, fmt=None, chunk=DEFAULT_CHUNK, compression=None, progress=None):
+    """
+    Compute a chart for every record and write them to path; returns
+    (rows, failed rows). fmt is "parquet" or "arrow" (default: by extension).
+    """
+    if pa is None:
+        raise RuntimeError("pyarrow is required for chart export: pip install pyarrow")
+    fmt = fmt or FORMATS.get(os.path.splitext(path)[1].lower())
+    if fmt not in ("parquet", "arrow"):
+        raise ValueError(f"Unknown output format for '{path}'; use .parquet or .arrow, or pass fmt")
+    if compression is None:
+        # Arrow IPC stays uncompressed so it can be memory-mapped without decoding
+        compression = "zstd" if fmt == "parquet" else "none"
+
+    engine = get_chart_engine()
+    engine.start()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    writer = _Writer(tmp_path, fmt, compression)
+    rows = failed = 0
+    records = iter(records)
+    try:
+        while True:
+            block = list(itertools.islice(records, chunk))
+            if not block:
+                break
+            table = chunk_table(rows, block, engine)
+            writer.write(table)
+            rows += table.num_rows
+            failed += table.num_rows - table.column("error").null_count
+            if progress:
+                progress(rows, failed)
+    except BaseException:
+        writer.close()
+        os.remove(tmp_path)
+        raise
+    writer.close()
+    os.replace(tmp_path, path)
+    return rows, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export charts for bulk birth records to Parquet or Arrow IPC")
+    parser.add_argument("input", help="birth records: .ndjson/.jsonl, .csv or .json")
+    parser.add_argument("output", help=".parquet or .arrow path")
+    parser.add_argument("--format", choices=["parquet", "arrow"], help="output format (default: by extension)")
+    parser.add_argument("--chunk", type=int, default=DEFAULT_CHUNK, help="records per row group / record batch")
+    parser.add_argument("--compression", help="zstd, snappy, lz4 or none (default: zstd for Parquet, none for Arrow)")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    try:
+        rows, failed = export_charts(
+            read_records(args.input), args.output, args.format, args.chunk, args.compression,
+            progress=lambda rows, failed: print(f"{rows} charts ({failed} failed), {time.perf_counter() - t0:.1f} s",
+                                                file=sys.stderr),
+        )
+    except (RuntimeError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        shutdown_chart_engine()
+    print(f"Wrote {args.output}: {rows} charts ({failed} failed), {os.path.getsize(args.output) / 1e6:.1f} MB "
+          f"in {time.perf_counter() - t0:.1f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
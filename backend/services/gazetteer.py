@@ -0,0 +1,344 @@
+"""
+Offline place search: autocomplete and place-name -> coordinates.
+
+Places come from a GeoNames-style cities file (data/cities.tsv is bundled; a
+full GeoNames dump such as cities15000.txt can be used instead) and are
+compiled into a binary index that is memory-mapped, so startup time and
+resident memory stay flat however large the source is:
+
+- place rows sorted by population, descending, so a row number is its rank
+- every normalised name, ASCII name and alternate name in one sorted key
+  list, searched with bisect for the range of keys starting with a prefix
+- the best places for every prefix whose range is too large to rank per
+  keystroke (one or two letters), precomputed at build time
+
+A keystroke therefore costs two bisects plus ranking at most SCAN_LIMIT keys.
+
+GAZETTEER_SOURCE and GAZETTEER_INDEX override the file paths; the index is
+rebuilt when it is missing or older than the source. Build one by hand with
+`python -m services.gazetteer build [source] [--out path]`.
+"""
+import argparse
+import bisect
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+DEFAULT_SOURCE_PATH = os.path.join(DATA_DIR, "cities.tsv")
+DEFAULT_INDEX_PATH = os.path.join(DATA_DIR, "gazetteer.idx")
+
+MAGIC = b"GAZIDX01"
+HEADER = struct.Struct("<8sIIIII")  # magic, places, keys, top prefixes, top_k, zones
+SECTION = struct.Struct("<QQ")      # byte offset, item count
+SECTIONS = [
+    ("lat", "<f8"), ("lon", "<f8"), ("population", "<i8"), ("zone", "<u2"), ("country", "S2"),
+    ("name_off", "<u4"), ("name_pool", "u1"),
+    ("admin1_off", "<u4"), ("admin1_pool", "u1"),
+    ("zone_off", "<u4"), ("zone_pool", "u1"),
+    ("key_off", "<u4"), ("key_pool", "u1"), ("key_place", "<u4"),
+    ("top_off", "<u4"), ("top_pool", "u1"), ("top_place", "<u4"),
+]
+# Prefixes matching more keys than this get their results precomputed
+SCAN_LIMIT = 256
+TOP_K = 20
+MAX_LIMIT = TOP_K
+NO_PLACE = 0xFFFFFFFF
+
+# GeoNames cities*.txt columns
+COL_NAME, COL_ASCII, COL_ALTERNATES, COL_LAT, COL_LON = 1, 2, 3, 4, 5
+COL_COUNTRY, COL_ADMIN1, COL_POPULATION, COL_TIMEZONE = 8, 10, 14, 17
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def normalize(text):
+    """Search key for a name or query: ASCII-folded, lower case, punctuation-free"""
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode().lower().replace("'", "")
+    return " ".join(_NON_ALNUM.sub(" ", text).split())
+
+
+def read_source(path):
+    """Yield (names, lat, lon, country, admin1, population, timezone) rows of a GeoNames-style file"""
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            if not line.strip() or line.startswith("#"):
+                continue
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) <= COL_TIMEZONE:
+                continue
+            names = [cols[COL_NAME], cols[COL_ASCII]] + [a for a in cols[COL_ALTERNATES].split(",") if a]
+            yield (names, float(cols[COL_LAT]), float(cols[COL_LON]), cols[COL_COUNTRY],
+                   cols[COL_ADMIN1], int(cols[COL_POPULATION] or 0), cols[COL_TIMEZONE])
+
+
+def _pool(strings):
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype="<u4")
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(encoded), dtype="u1")
+
+
+def _top_prefixes(keys, key_place):
+    """(prefix, best place rows) for every prefix matching more than SCAN_LIMIT keys"""
+    top = []
+    length = 1
+    while True:
+        found = False
+        start = 0
+        while start < len(keys):
+            prefix = keys[start][:length]
+            if len(prefix) < length:
+                # A key shorter than this level has no prefix of this length
+                start += 1
+                continue
+            end = bisect.bisect_left(keys, prefix + "\x7f", start)
+            if end - start > SCAN_LIMIT:
+                found = True
+                top.append((prefix, np.unique(key_place[start:end])[:TOP_K]))
+            start = end
+        if not found:
+            return sorted(top)
+        length += 1
+
+
+def build_index(source=DEFAULT_SOURCE_PATH, out=DEFAULT_INDEX_PATH):
+    """Compile a GeoNames-style source file into the memory-mappable index at out"""
+    rows = sorted(read_source(source), key=lambda r: -r[5])
+    zones = sorted({r[6] for r in rows})
+    zone_ids = {z: i for i, z in enumerate(zones)}
+
+    pairs = set()
+    for place, (names, *_rest) in enumerate(rows):
+        for name in names:
+            key = normalize(name)
+            if key:
+                pairs.add((key, place))
+    pairs = sorted(pairs)
+    keys = [k for k, _ in pairs]
+    key_place = np.array([p for _, p in pairs], dtype="<u4")
+
+    top = _top_prefixes(keys, key_place)
+    top_place = np.full((len(top), TOP_K), NO_PLACE, dtype="<u4")
+    for i, (_, places) in enumerate(top):
+        top_place[i, :len(places)] = places
+
+    name_off, name_pool = _pool(r[0][0] for r in rows)
+    admin1_off, admin1_pool = _pool(r[4] for r in rows)
+    zone_off, zone_pool = _pool(zones)
+    key_off, key_pool = _pool(keys)
+    top_off, top_pool = _pool(p for p, _ in top)
+    arrays = {
+        "lat": np.array([r[1] for r in rows], dtype="<f8"),
+        "lon": np.array([r[2] for r in rows], dtype="<f8"),
+        "population": np.array([r[5] for r in rows], dtype="<i8"),
+        "zone": np.array([zone_ids[r[6]] for r in rows], dtype="<u2"),
+        "country": np.array([r[3].encode("ascii", "ignore")[:2] for r in rows], dtype="S2"),
+        "name_off": name_off, "name_pool": name_pool,
+        "admin1_off": admin1_off, "admin1_pool": admin1_pool,
+        "zone_off": zone_off, "zone_pool": zone_pool,
+        "key_off": key_off, "key_pool": key_pool, "key_place": key_place,
+        "top_off": top_off, "top_pool": top_pool, "top_place": top_place.ravel(),
+    }
+
+    tmp = out + ".tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(HEADER.pack(MAGIC, len(rows), len(keys), len(top), TOP_K, len(zones)))
+        offset = HEADER.size + SECTION.size * len(SECTIONS)
+        table = []
+        for name, dtype in SECTIONS:
+            offset = (offset + 7) & ~7
+            array = np.ascontiguousarray(arrays[name], dtype=dtype)
+            table.append((offset, array.size))
+            offset += array.nbytes
+        for entry in table:
+            fh.write(SECTION.pack(*entry))
+        for (name, dtype), (offset, _) in zip(SECTIONS, table):
+            fh.write(b"\0" * (offset - fh.tell()))
+            fh.write(np.ascontiguousarray(arrays[name], dtype=dtype).tobytes())
+    os.replace(tmp, out)
+    return {"places": len(rows), "keys": len(keys), "top_prefixes": len(top), "zones": len(zones)}
+
+
+class _Strings:
+    """Sequence view of the i-th string of an offsets/pool pair, for bisect"""
+
+    def __init__(self, mm, offsets, pool_start):
+        self.mm = mm
+        self.offsets = offsets
+        self.pool_start = pool_start
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        start = self.pool_start + int(self.offsets[i])
+        return self.mm[start:self.pool_start + int(self.offsets[i + 1])]
+
+
+class Gazetteer:
+    def __init__(self, path):
+        t0 = time.perf_counter()
+        self.path = path
+        with open(path, "rb") as fh:
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.n_places, self.n_keys, self.n_top, self.top_k, self.n_zones = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a gazetteer index")
+        offsets = {}
+        for i, (name, dtype) in enumerate(SECTIONS):
+            offset, count = SECTION.unpack_from(self._mm, HEADER.size + i * SECTION.size)
+            offsets[name] = offset
+            setattr(self, name, np.frombuffer(self._mm, dtype=dtype, count=count, offset=offset))
+        self._keys = _Strings(self._mm, self.key_off, offsets["key_pool"])
+        self._top = _Strings(self._mm, self.top_off, offsets["top_pool"])
+        self._names = _Strings(self._mm, self.name_off, offsets["name_pool"])
+        self._admin1 = _Strings(self._mm, self.admin1_off, offsets["admin1_pool"])
+        zones = _Strings(self._mm, self.zone_off, offsets["zone_pool"])
+        self.zones = [zones[i].decode() for i in range(len(zones))]
+        self.load_ms = (time.perf_counter() - t0) * 1000.0
+
+    def place(self, row):
+        name = self._names[row].decode()
+        admin1 = self._admin1[row].decode()
+        country = self.country[row].decode()
+        return {
+            "name": name,
+            "admin1": admin1,
+            "country": country,
+            "label": ", ".join(p for p in (name, admin1, country) if p),
+            "lat": float(self.lat[row]),
+            "lon": float(self.lon[row]),
+            "population": int(self.population[row]),
+            "timezone": self.zones[int(self.zone[row])],
+        }
+
+    def _range(self, key):
+        lo = bisect.bisect_left(self._keys, key)
+        hi = bisect.bisect_left(self._keys, key + b"\x7f", lo)
+        return lo, hi
+
+    def search_rows(self, query, limit=10, country=None):
+        """Place rows whose names start with query, most populous first"""
+        key = normalize(query).encode()
+        if not key:
+            return []
+        limit = max(1, min(limit, MAX_LIMIT))
+        lo, hi = self._range(key)
+        if lo == hi:
+            return []
+        if country:
+            rows = np.unique(self.key_place[lo:hi])
+            return rows[self.country[rows] == country.upper().encode()][:limit].tolist()
+        if hi - lo > SCAN_LIMIT:
+            t = bisect.bisect_left(self._top, key)
+            if t < self.n_top and self._top[t] == key:
+                rows = self.top_place[t * self.top_k:(t + 1) * self.top_k]
+                return rows[rows != NO_PLACE][:limit].tolist()
+        return np.unique(self.key_place[lo:hi])[:limit].tolist()
+
+    def search(self, query, limit=10, country=None):
+        return [self.place(row) for row in self.search_rows(query, limit, country)]
+
+    def resolve(self, text):
+        """
+        Best place for free text such as "Chennai", "Paris, FR" or "Portland, Oregon":
+        an exact name match (qualified by country code or region when given),
+        otherwise the most populous prefix match. None when nothing matches.
+        """
+        name, *qualifiers = [part for part in (normalize(p) for p in text.split(",")) if part] or [""]
+        if not name:
+            return None
+        key = name.encode()
+        lo = bisect.bisect_left(self._keys, key)
+        hi = bisect.bisect_right(self._keys, key, lo)
+        rows = np.unique(self.key_place[lo:hi]).tolist() or self.search_rows(name, MAX_LIMIT)
+        for qualifier in qualifiers:
+            matching = [r for r in rows if qualifier in (self.country[r].decode().lower(), normalize(self._admin1[r].decode()))]
+            rows = matching or rows
+        return self.place(rows[0]) if rows else None
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "places": self.n_places,
+            "keys": self.n_keys,
+            "top_prefixes": self.n_top,
+            "zones": self.n_zones,
+            "index_bytes": len(self._mm),
+            "load_ms": round(self.load_ms, 3),
+        }
+
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+_build_ms = None
+
+
+def get_gazetteer():
+    """Shared gazetteer, (re)building the index from the source first if it is stale"""
+    global _gazetteer, _build_ms
+    with _gazetteer_lock:
+        if _gazetteer is None:
+            source = os.getenv("GAZETTEER_SOURCE", DEFAULT_SOURCE_PATH)
+            index = os.getenv("GAZETTEER_INDEX", DEFAULT_INDEX_PATH)
+            if os.path.exists(source) and (not os.path.exists(index) or os.path.getmtime(index) < os.path.getmtime(source)):
+                t0 = time.perf_counter()
+                logger.info("Building place index %s from %s", index, source)
+                build_index(source, index)
+                _build_ms = (time.perf_counter() - t0) * 1000.0
+            _gazetteer = Gazetteer(index)
+        return _gazetteer
+
+
+def gazetteer_stats():
+    stats = get_gazetteer().stats()
+    stats["build_ms"] = round(_build_ms, 3) if _build_ms is not None else None
+    return stats
+
+
+def resolve_coordinates(place, lat, lon):
+    """(lat, lon, place record or None): given coordinates win, otherwise place is looked up"""
+    if lat is not None and lon is not None:
+        return lat, lon, None
+    found = get_gazetteer().resolve(place or "")
+    if found is None:
+        raise ValueError(f"Unknown place '{place}'; pass lat and lon")
+    return found["lat"], found["lon"], found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query the offline place index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="compile a GeoNames-style cities file")
+    build.add_argument("source", nargs="?", default=DEFAULT_SOURCE_PATH)
+    build.add_argument("--out", default=DEFAULT_INDEX_PATH)
+    search = sub.add_parser("search", help="autocomplete a prefix")
+    search.add_argument("query")
+    search.add_argument("--index", default=DEFAULT_INDEX_PATH)
+    search.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        t0 = time.perf_counter()
+        counts = build_index(args.source, args.out)
+        print(f"Wrote {args.out}: {counts} in {time.perf_counter() - t0:.2f}s ({os.path.getsize(args.out)} bytes)")
+    else:
+        gazetteer = Gazetteer(args.index)
+        for place in gazetteer.search(args.query, args.limit):
+            print(f"{place['label']}\t{place['lat']:.4f}\t{place['lon']:.4f}\t{place['population']}\t{place['timezone']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,285 @@
+"""
+Shared async Gemini client.
+
+All LLM call sites (daily prediction, chart analysis, matchmaking) go through
+one pooled httpx.AsyncClient so connections are kept alive, concurrency is
+bounded by a semaphore, every call has a hard deadline, and a circuit breaker
+sends requests straight to the local fallbacks once the upstream is failing
+instead of waiting out the timeout each time.
+
+GEMINI_BASE_URL points the client at a local stub server for testing.
+"""
+import asyncio
+import json
+import os
+import time
+
+import httpx
+
+from services.metrics import LLM_SECONDS, record_stage, timed
+
+DEFAULT_BASE_URL = "https://generativelanguage.googleapis.com"
+
+
+class GeminiError(Exception):
+    """Upstream call failed, timed out or returned an unusable response"""
+
+
+class CircuitOpenError(GeminiError):
+    """The circuit breaker is open; callers should use their local fallback"""
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after failure_threshold consecutive failures.
+    Open -> half-open after reset_timeout seconds, letting one probe through;
+    the probe's outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probe_in_flight = False
+
+    def allow(self):
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_abandoned(self):
+        """The call ended without a verdict (the caller went away); let another probe through"""
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+def extract_json(raw_text):
+    """Strip optional markdown code fences from an LLM reply and parse it as JSON"""
+    with timed("llm_parse"):
+        if "```json" in raw_text:
+            raw_text = raw_text.split("```json")[1].split("```")[0].strip()
+        elif "```" in raw_text:
+            raw_text = raw_text.split("```")[1].split("```")[0].strip()
+        return json.loads(raw_text)
+
+
+class GeminiClient:
+    def __init__(self, base_url=DEFAULT_BASE_URL, max_connections=20, max_concurrency=16,
+                 failure_threshold=5, reset_timeout=30.0):
+        self.base_url = base_url.rstrip("/")
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._http = httpx.AsyncClient(
+            base_url=self.base_url,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            headers={"Content-Type": "application/json"},
+        )
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+
+    async def generate(self, model, prompt, api_key, timeout):
+        """
+        Send one generateContent request and return the reply text.
+
+        timeout is the whole deadline, including time spent waiting for a
+        concurrency slot. Raises CircuitOpenError without touching the network
+        when the breaker is open, and GeminiError for any other failure.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"Circuit open after {self.breaker.failures} consecutive failures")
+
+        self.calls += 1
+        started = time.perf_counter()
+        finished = False
+        outcome = "abandoned"
+        try:
+            text = await asyncio.wait_for(self._generate(model, prompt, api_key), timeout)
+            finished = True
+            outcome = "ok"
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            self.timeouts += 1
+            self._record_failure()
+            raise GeminiError(f"Gemini call exceeded {timeout}s deadline")
+        except httpx.HTTPStatusError as e:
+            outcome = "http_error"
+            self._record_failure()
+            raise GeminiError(f"Gemini API Error {e.response.status_code}") from e
+        except (httpx.HTTPError, KeyError, IndexError, TypeError, ValueError) as e:
+            outcome = "error"
+            self._record_failure()
+            raise GeminiError(f"Gemini call failed: {e}") from e
+        finally:
+            self._record_latency(model, outcome, time.perf_counter() - started)
+            if finished:
+                self.breaker.record_success()
+            elif outcome == "abandoned" and self.breaker.state == "half_open":
+                # Cancelled (CancelledError is a BaseException): release the probe so the breaker can recover
+                self.breaker.record_abandoned()
+        return text
+
+    async def _generate(self, model, prompt, api_key):
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                # Key travels as a header so it never shows up in logged URLs
+                response = await self._http.post(
+                    f"/v1beta/models/{model}:generateContent",
+                    headers={"x-goog-api-key": api_key},
+                    json={"contents": [{"parts": [{"text": prompt}]}]},
+                )
+            finally:
+                self.in_flight -= 1
+        response.raise_for_status()
+        data = response.json()
+        return data['candidates'][0]['content']['parts'][0]['text']
+
+    async def stream(self, model, prompt, api_key, timeout):
+        """
+        Send one streamGenerateContent request and yield the reply text as it
+        arrives.
+
+        timeout is the deadline for the whole stream. The breaker and errors
+        behave as in generate(); a failure partway through is raised after the
+        text received so far has been yielded.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"Circuit open after {self.breaker.failures} consecutive failures")
+
+        self.calls += 1
+        started = time.perf_counter()
+        deadline = time.monotonic() + timeout
+        chunks = self._stream(model, prompt, api_key)
+        finished = False
+        outcome = "abandoned"
+        try:
+            while True:
+                try:
+                    text = await asyncio.wait_for(chunks.__anext__(), deadline - time.monotonic())
+                except StopAsyncIteration:
+                    break
+                yield text
+            finished = True
+            outcome = "ok"
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            self.timeouts += 1
+            self._record_failure()
+            raise GeminiError(f"Gemini stream exceeded {timeout}s deadline")
+        except httpx.HTTPStatusError as e:
+            outcome = "http_error"
+            self._record_failure()
+            raise GeminiError(f"Gemini API Error {e.response.status_code}") from e
+        except (httpx.HTTPError, KeyError, IndexError, TypeError, ValueError) as e:
+            outcome = "error"
+            self._record_failure()
+            raise GeminiError(f"Gemini stream failed: {e}") from e
+        finally:
+            await chunks.aclose()
+            self._record_latency(model, outcome, time.perf_counter() - started)
+            if finished:
+                self.breaker.record_success()
+            elif self.breaker.state == "half_open":
+                self.breaker.record_abandoned()
+
+    async def _stream(self, model, prompt, api_key):
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                async with self._http.stream(
+                    "POST",
+                    f"/v1beta/models/{model}:streamGenerateContent",
+                    params={"alt": "sse"},
+                    headers={"x-goog-api-key": api_key},
+                    json={"contents": [{"parts": [{"text": prompt}]}]},
+                ) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        data = json.loads(line[5:])
+                        if "error" in data:
+                            raise ValueError(data["error"])
+                        # The last event may carry only a finish reason
+                        parts = data['candidates'][0].get('content', {}).get('parts', [])
+                        text = "".join(part.get('text', "") for part in parts)
+                        if text:
+                            yield text
+            finally:
+                self.in_flight -= 1
+
+    @staticmethod
+    def _record_latency(model, outcome, seconds):
+        LLM_SECONDS.observe(seconds, model, outcome)
+        record_stage("llm_request", seconds)
+
+    def _record_failure(self):
+        self.failures += 1
+        self.breaker.record_failure()
+
+    def stats(self):
+        return {
+            "base_url": self.base_url,
+            "circuit_state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "rejected_by_circuit": self.breaker.rejected,
+            "calls": self.calls,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+        }
+
+    async def aclose(self):
+        await self._http.aclose()
+
+
+_client = None
+_client_loop = None
+
+
+def get_gemini_client():
+    """Process-wide client configured from GEMINI_* environment variables"""
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    # The pool and semaphore belong to one event loop; rebuild if the app is served from a new one
+    if _client is None or _client_loop is not loop:
+        _client = GeminiClient(
+            base_url=os.getenv("GEMINI_BASE_URL", DEFAULT_BASE_URL),
+            max_connections=int(os.getenv("GEMINI_MAX_CONNECTIONS", 20)),
+            max_concurrency=int(os.getenv("GEMINI_MAX_CONCURRENCY", 16)),
+            failure_threshold=int(os.getenv("GEMINI_BREAKER_THRESHOLD", 5)),
+            reset_timeout=float(os.getenv("GEMINI_BREAKER_RESET", 30)),
+        )
+        _client_loop = loop
+    return _client
+
+
+async def close_gemini_client():
+    global _client, _client_loop
+    if _client is not None:
+        await _client.aclose()
+    _client = _client_loop = None
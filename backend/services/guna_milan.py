@@ -0,0 +1,192 @@
+"""
+Deterministic Ashta Koota (Guna Milan) engine.
+
+Each person is reduced to one index: the Moon's sidereal longitude in units
+of 1°40' (216 per circle). That unit divides the nakshatras (8 per nakshatra),
+the signs (18 per sign) and the half-signs used by Vashya, so every koota is
+a function of the two indices. The eight koota tables are built once from the
+27x27 nakshatra and 12x12 rasi rules and stacked into (216, 216) arrays
+indexed [boy, girl]; scoring a pair is a lookup, and ranking one profile
+against N candidates is a single vectorised gather.
+"""
+import datetime
+
+import numpy as np
+import swisseph as swe
+
+from services.chart_engine import FLAGS, ensure_configured
+from services.ephemeris import calc_lon_speed
+from services.vedic import datetime_to_jd, nakshatra_of, sign_of
+
+UNITS = 216
+UNIT_SPAN = 360.0 / UNITS
+
+KOOTAS = ["varna", "vashya", "tara", "yoni", "graha_maitri", "gana", "bhakoot", "nadi"]
+KOOTA_MAX = {"varna": 1, "vashya": 2, "tara": 3, "yoni": 4, "graha_maitri": 5, "gana": 6, "bhakoot": 7, "nadi": 8}
+
+# --- Nakshatra attributes (index 0 = Ashwini) ---
+# Gana: 0 Deva, 1 Manushya, 2 Rakshasa
+NAKSHATRA_GANA = [0, 1, 2, 1, 0, 1, 0, 0, 2, 2, 1, 1, 0, 2, 0, 2, 0, 2, 2, 1, 1, 0, 2, 2, 1, 1, 0]
+# Nadi: 0 Adi, 1 Madhya, 2 Antya
+NAKSHATRA_NADI = [0, 1, 2, 2, 1, 0, 0, 1, 2, 2, 1, 0, 0, 1, 2, 2, 1, 0, 0, 1, 2, 2, 1, 0, 0, 1, 2]
+# Yoni: Horse, Elephant, Sheep, Serpent, Dog, Cat, Rat, Cow, Buffalo, Tiger, Deer, Monkey, Mongoose, Lion
+NAKSHATRA_YONI = [0, 1, 2, 3, 3, 4, 5, 2, 5, 6, 6, 7, 8, 9, 8, 9, 10, 10, 4, 11, 12, 11, 13, 0, 13, 7, 1]
+YONI_SCORES = [
+    [4, 2, 2, 3, 2, 2, 2, 1, 0, 1, 3, 3, 2, 1],
+    [2, 4, 3, 3, 2, 2, 2, 2, 3, 1, 2, 3, 2, 0],
+    [2, 3, 4, 2, 1, 2, 1, 3, 3, 1, 2, 0, 3, 1],
+    [3, 3, 2, 4, 2, 1, 1, 1, 1, 2, 2, 2, 0, 2],
+    [2, 2, 1, 2, 4, 2, 1, 2, 2, 1, 0, 2, 1, 1],
+    [2, 2, 2, 1, 2, 4, 0, 2, 2, 1, 3, 3, 2, 1],
+    [2, 2, 1, 1, 1, 0, 4, 2, 2, 2, 2, 2, 1, 2],
+    [1, 2, 3, 1, 2, 2, 2, 4, 3, 0, 3, 2, 2, 1],
+    [0, 3, 3, 1, 2, 2, 2, 3, 4, 1, 2, 2, 2, 1],
+    [1, 1, 1, 2, 1, 1, 2, 0, 1, 4, 1, 1, 2, 1],
+    [3, 2, 2, 2, 0, 3, 2, 3, 2, 1, 4, 2, 2, 1],
+    [3, 3, 0, 2, 2, 3, 2, 2, 2, 1, 2, 4, 3, 2],
+    [2, 2, 3, 0, 1, 2, 1, 2, 2, 2, 2, 3, 4, 2],
+    [1, 0, 1, 2, 1, 1, 2, 1, 1, 1, 1, 2, 2, 4],
+]
+# [boy gana][girl gana]
+GANA_SCORES = [
+    [6, 6, 0],
+    [5, 6, 0],
+    [1, 0, 6],
+]
+
+# --- Rasi attributes (index 0 = Aries) ---
+# Varna: 3 Brahmin (water), 2 Kshatriya (fire), 1 Vaishya (earth), 0 Shudra (air)
+RASI_VARNA = [2, 1, 0, 3, 2, 1, 0, 3, 2, 1, 0, 3]
+# Lords: 0 Sun, 1 Moon, 2 Mars, 3 Mercury, 4 Jupiter, 5 Venus, 6 Saturn
+RASI_LORD = [2, 5, 3, 1, 0, 3, 5, 2, 4, 6, 6, 4]
+# Natural relationship of planet (row) towards planet (column): 1 friend, 0 neutral, -1 enemy
+PLANET_RELATION = [
+    [1, 1, 1, 0, 1, -1, -1],
+    [1, 1, 0, 1, 0, 0, 0],
+    [1, 1, 1, -1, 1, 0, 0],
+    [1, -1, 0, 1, 0, 1, 0],
+    [1, 1, 1, -1, 1, -1, 0],
+    [-1, -1, 0, 1, 0, 1, 1],
+    [-1, -1, -1, 1, 0, 1, 1],
+]
+# Vashya: 0 Chatushpada, 1 Manava, 2 Jalachara, 3 Vanachara, 4 Keeta; (first half, second half) of each sign
+RASI_VASHYA = [(0, 0), (0, 0), (1, 1), (2, 2), (3, 3), (1, 1), (1, 1), (4, 4), (1, 0), (0, 2), (1, 1), (2, 2)]
+VASHYA_SCORES = [
+    [2, 1, 1, 0.5, 1],
+    [1, 2, 0.5, 0, 1],
+    [1, 0.5, 2, 1, 1],
+    [0.5, 0, 1, 2, 0],
+    [1, 1, 1, 0, 2],
+]
+
+
+def _maitri(boy_lord, girl_lord):
+    if boy_lord == girl_lord:
+        return 5
+    a, b = PLANET_RELATION[boy_lord][girl_lord], PLANET_RELATION[girl_lord][boy_lord]
+    return {(1, 1): 5, (1, 0): 4, (0, 1): 4, (0, 0): 3, (1, -1): 1, (-1, 1): 1,
+            (0, -1): 0.5, (-1, 0): 0.5, (-1, -1): 0}[(a, b)]
+
+
+def _tara(boy_nak, girl_nak):
+    def good(src, dst):
+        return ((dst - src) % 27 + 1) % 9 not in (3, 5, 7)
+    return 1.5 * good(boy_nak, girl_nak) + 1.5 * good(girl_nak, boy_nak)
+
+
+def _bhakoot(boy_rasi, girl_rasi):
+    distance = (boy_rasi - girl_rasi) % 12 + 1
+    return 0 if distance in (2, 12, 5, 9, 6, 8) else 7
+
+
+def _build_tables():
+    # 27x27 nakshatra-pair and 12x12 rasi-pair tables
+    nak = np.arange(27)
+    rasi = np.arange(12)
+    nak_tables = {
+        "tara": np.array([[_tara(b, g) for g in nak] for b in nak]),
+        "yoni": np.array([[YONI_SCORES[NAKSHATRA_YONI[b]][NAKSHATRA_YONI[g]] for g in nak] for b in nak]),
+        "gana": np.array([[GANA_SCORES[NAKSHATRA_GANA[b]][NAKSHATRA_GANA[g]] for g in nak] for b in nak]),
+        "nadi": np.array([[0 if NAKSHATRA_NADI[b] == NAKSHATRA_NADI[g] else 8 for g in nak] for b in nak]),
+    }
+    rasi_tables = {
+        "varna": np.array([[1 if RASI_VARNA[b] >= RASI_VARNA[g] else 0 for g in rasi] for b in rasi]),
+        "graha_maitri": np.array([[_maitri(RASI_LORD[b], RASI_LORD[g]) for g in rasi] for b in rasi]),
+        "bhakoot": np.array([[_bhakoot(b, g) for g in rasi] for b in rasi]),
+    }
+
+    # Expand to 1°40' units
+    units = np.arange(UNITS)
+    unit_nak = units // 8
+    unit_rasi = units // 18
+    unit_vashya = np.array([RASI_VASHYA[u // 18][(u % 18) // 9] for u in units])
+    tables = {}
+    for name, table in nak_tables.items():
+        tables[name] = table[np.ix_(unit_nak, unit_nak)]
+    for name, table in rasi_tables.items():
+        tables[name] = table[np.ix_(unit_rasi, unit_rasi)]
+    tables["vashya"] = np.array(VASHYA_SCORES)[np.ix_(unit_vashya, unit_vashya)]
+    stacked = np.stack([tables[k] for k in KOOTAS]).astype(np.float32)  # (8, 216, 216)
+    return stacked, stacked.sum(axis=0)
+
+
+KOOTA_TABLES, TOTAL_TABLE = _build_tables()
+
+
+def ist_julian_day(dob, time):
+    """UT Julian day of a birth date/time given in IST"""
+    year, month, day = map(int, dob.split('-'))
+    hour, minute = map(int, time.split(':'))
+    dt_utc = datetime.datetime(year, month, day, hour, minute) - datetime.timedelta(hours=5, minutes=30)
+    return datetime_to_jd(dt_utc)
+
+
+def moon_longitude(dob, time):
+    """Sidereal (Lahiri) Moon longitude for a birth date/time given in IST"""
+    jd = ist_julian_day(dob, time)
+    ensure_configured()
+    lon, _ = calc_lon_speed(jd, swe.MOON, FLAGS)
+    return lon
+
+
+def moon_unit(lon):
+    return int(lon // UNIT_SPAN) % UNITS
+
+
+def score_pair(boy_moon_lon, girl_moon_lon):
+    """Koota breakdown and total (out of 36) for two Moon longitudes"""
+    b, g = moon_unit(boy_moon_lon), moon_unit(girl_moon_lon)
+    kootas = {name: float(KOOTA_TABLES[i, b, g]) for i, name in enumerate(KOOTAS)}
+    return {
+        "score": float(TOTAL_TABLE[b, g]),
+        "kootas": kootas,
+        "boy_moon": {"sign": sign_of(boy_moon_lon), "nakshatra": nakshatra_of(boy_moon_lon)},
+        "girl_moon": {"sign": sign_of(girl_moon_lon), "nakshatra": nakshatra_of(girl_moon_lon)},
+        "nadi_dosha": kootas["nadi"] == 0,
+        "bhakoot_dosha": kootas["bhakoot"] == 0,
+    }
+
+
+def rank_candidates(profile_moon_lon, candidate_moon_lons, profile_is_boy=True, top_k=10):
+    """
+    Score one profile against every candidate Moon longitude and return
+    (indices, scores) of the best top_k, best first. O(N) gather plus an
+    O(N) partial sort; no per-candidate Python work.
+    """
+    units = (np.asarray(candidate_moon_lons, dtype=float) // UNIT_SPAN).astype(np.int64) % UNITS
+    me = moon_unit(profile_moon_lon)
+    scores = TOTAL_TABLE[me, units] if profile_is_boy else TOTAL_TABLE[units, me]
+    top_k = min(top_k, len(scores))
+    if top_k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    top = np.argpartition(-scores, top_k - 1)[:top_k]
+    # Stable order for ties: higher score first, then input order
+    top = top[np.lexsort((top, -scores[top]))]
+    return top, scores[top]
+
+
+def verdict_for(score):
+    if score > 28: return "Excellent Match"
+    elif score > 24: return "Very Good Match"
+    elif score > 18: return "Average Compatibility"
+    else: return "Challenging"
@@ -0,0 +1,256 @@
+"""
+Local (offline) chart interpretation, the fallback for Gemini.
+
+Planets are placed in whole-sign houses counted from the ascendant sign, and
+every piece of text is looked up rather than generated per call: placement
+sentences are precompiled for each (planet, sign, house), personality
+paragraphs for each (ascendant, moon sign), and career/relationship/health
+lines per sign. Choices between equally valid fragments are made with a
+random.Random seeded from the birth details, so the same person always gets
+the same reading and concurrent requests never share RNG state. A reading is
+a few dozen dict lookups, cheap enough to serve every analysis during an
+upstream outage.
+"""
+import random
+
+from services.vedic import ZODIAC_SIGNS
+
+ELEMENTS = ("Fire", "Earth", "Air", "Water")  # Aries, Taurus, Gemini, Cancer, then repeating
+
+# sign -> nature, emotional tone, comfort, strength, challenge, career, relationships, body area
+SIGN_TEXT = {
+    "Aries": ("bold, pioneering and direct", "quick to feel and quick to act", "new challenges",
+              "Courage to start what others only talk about", "Impatience when results are slow",
+              "roles where you lead from the front: entrepreneurship, sports, defence or engineering",
+              "a partner who can match your pace and does not take your directness personally",
+              "the head; guard against headaches, fevers and burnout from rushing"),
+    "Taurus": ("steady, sensual and dependable", "calm and slow to be shaken", "familiar comforts and good food",
+               "Patience and staying power", "Resistance to necessary change",
+               "work that builds lasting value: finance, agriculture, design, food or real estate",
+               "loyalty and physical affection; you commit slowly and then for good",
+               "the throat and neck; keep a moderate diet and regular exercise"),
+    "Gemini": ("curious, quick-witted and sociable", "light and changeable", "conversation and ideas",
+               "A sharp, adaptable intellect", "Scattered focus across too many interests",
+               "communication-heavy fields: writing, media, teaching, sales or technology",
+               "a partner who is also a friend and a good conversationalist",
+               "the lungs, arms and nerves; make time for rest from constant stimulation"),
+    "Cancer": ("caring, protective and intuitive", "deep and tidal", "home and close family",
+               "Deep emotional intelligence", "Holding on to old hurts",
+               "nurturing work: healthcare, hospitality, education, property or family business",
+               "security and emotional closeness; home life matters a great deal to you",
+               "the chest and stomach; emotional stress shows up in digestion"),
+    "Leo": ("warm, confident and generous", "proud and big-hearted", "appreciation and creative expression",
+            "Natural leadership and warmth", "Needing recognition to feel secure",
+            "visible roles: management, politics, performing arts or anything with an audience",
+            "admiration and loyalty; you are a generous, romantic partner",
+            "the heart and spine; keep up cardiovascular fitness"),
+    "Virgo": ("precise, analytical and helpful", "reserved and discerning", "order and useful work",
+              "A sharp analytical mind with an eye for detail", "Perfectionism and self-criticism",
+              "skilled, exacting work: research, accounting, medicine, editing or analysis",
+              "quiet acts of service; you show love by taking care of practical things",
+              "the digestive system; routine, clean food and less worry help most"),
+    "Libra": ("diplomatic, charming and fair-minded", "balanced but easily unsettled by conflict", "harmony and beauty",
+              "Diplomacy and a strong sense of fairness", "Indecision when every side has merit",
+              "work that weighs and connects: law, design, negotiation, HR or the arts",
+              "partnership itself; you thrive with an equal and dislike being alone for long",
+              "the kidneys and lower back; balance exertion with rest and hydration"),
+    "Scorpio": ("intense, perceptive and determined", "private and powerful", "depth and trust",
+                "Unwavering determination", "Difficulty letting go of control",
+                "investigative or transformative fields: research, surgery, psychology, finance or security",
+                "a deep, all-or-nothing bond; trust once broken is hard to rebuild",
+                "the reproductive and excretory systems; release stress instead of storing it"),
+    "Sagittarius": ("optimistic, philosophical and freedom-loving", "buoyant and restless", "travel and learning",
+                    "Optimism and a broad vision", "Overpromising and restlessness",
+                    "expansive work: teaching, law, publishing, travel or advisory roles",
+                    "a partner who shares your beliefs and leaves you room to roam",
+                    "the hips, thighs and liver; moderation with rich food and alcohol helps"),
+    "Capricorn": ("ambitious, disciplined and practical", "contained and serious", "achievement and structure",
+                  "Discipline and long-term planning", "Working too hard and resting too little",
+                  "structured careers with a ladder to climb: administration, engineering, government or business",
+                  "reliability and shared goals; affection grows steadily with time",
+                  "the knees, bones and joints; stretch and keep calcium and vitamin D up"),
+    "Aquarius": ("independent, inventive and humanitarian", "detached and idealistic", "community and new ideas",
+                 "Original thinking", "Emotional distance from those closest",
+                 "innovative or collective work: technology, science, social causes or networks",
+                 "friendship first and plenty of personal freedom",
+                 "the ankles and circulation; stay active and avoid long sedentary stretches"),
+    "Pisces": ("compassionate, imaginative and spiritual", "sensitive and porous", "solitude, music and the sea",
+               "Empathy and compassion", "Escapism and weak boundaries",
+               "caring or creative work: healing, music, art, charity or spiritual teaching",
+               "a soulful, devoted bond; you must guard against self-sacrifice",
+               "the feet and immune system; sleep and quiet time restore you"),
+}
+SIGN_LORDS = ("Mars", "Venus", "Mercury", "Moon", "Sun", "Mercury", "Venus", "Mars", "Jupiter", "Saturn", "Saturn", "Jupiter")
+
+# planet -> (label, what it governs, exalted in, debilitated in, own signs)
+PLANETS = {
+    "Sun": ("Soul & Life Path", "vitality, authority and sense of self", "Aries", "Libra", ("Leo",)),
+    "Moon": ("Mind & Emotions", "emotions, mind and sense of security", "Taurus", "Scorpio", ("Cancer",)),
+    "Mars": ("Action & Energy", "drive, courage and energy", "Capricorn", "Cancer", ("Aries", "Scorpio")),
+    "Mercury": ("Intellect", "intellect, speech and skill", "Virgo", "Pisces", ("Gemini", "Virgo")),
+    "Jupiter": ("Growth & Wisdom", "wisdom, growth and good fortune", "Cancer", "Capricorn", ("Sagittarius", "Pisces")),
+    "Venus": ("Love & Art", "love, pleasure and artistic taste", "Pisces", "Virgo", ("Taurus", "Libra")),
+    "Saturn": ("Karma & Structure", "discipline, duty and endurance", "Libra", "Aries", ("Capricorn", "Aquarius")),
+    "Rahu": ("Ambition & Chaos", "worldly ambition and hunger for the new", "Taurus", "Scorpio", ()),
+    "Ketu": ("Spirituality & Letting Go", "detachment and spiritual insight", "Scorpio", "Taurus", ()),
+}
+MALEFICS = ("Mars", "Saturn", "Rahu", "Ketu")
+
+HOUSES = ("self, body and temperament", "wealth, speech and family", "courage, siblings and communication",
+          "home, mother and inner peace", "creativity, children and intellect", "health, service and rivals",
+          "partnership and marriage", "transformation, longevity and the hidden", "fortune, faith and teachers",
+          "career and public standing", "gains, friends and aspirations", "expenses, solitude and liberation")
+KENDRAS = (1, 4, 7, 10)
+DUSTHANAS = (6, 8, 12)
+
+TRAIT_WORDS = {
+    "outward": ("dynamic", "composed", "intense", "charming", "reserved", "magnetic"),
+    "impression": ("reliable", "energetic", "thoughtful", "authoritative", "approachable"),
+}
+
+
+def ordinal(n):
+    return f"{n}{'th' if 11 <= n % 100 <= 13 else {1: 'st', 2: 'nd', 3: 'rd'}.get(n % 10, 'th')}"
+
+
+def article(phrase):
+    return f"{'an' if phrase[0] in 'aeiou' else 'a'} {phrase}"
+
+
+def dignity(planet, sign):
+    _, _, exalted, debilitated, own = PLANETS[planet]
+    if sign == exalted:
+        return "exalted"
+    if sign == debilitated:
+        return "debilitated"
+    if sign in own:
+        return "own sign"
+    return None
+
+
+def house_of(sign_index, asc_index):
+    """Whole-sign house (1..12) of a sign counted from the ascendant sign"""
+    return (sign_index - asc_index) % 12 + 1
+
+
+def _placement_text(planet, sign, house):
+    _, governs, _, _, _ = PLANETS[planet]
+    state = dignity(planet, sign)
+    strength = {"exalted": " It is exalted here, at its strongest.",
+                "debilitated": " It is debilitated here, so its results come with effort.",
+                "own sign": " It is in its own sign, comfortable and reliable."}.get(state, "")
+    return (f"{planet} in {sign} in the {ordinal(house)} house: your {governs} work through matters of "
+            f"{HOUSES[house - 1]}, in {article(SIGN_TEXT[sign][0])} way.{strength}")
+
+
+def _personality_text(ascendant, moon):
+    asc_element = ELEMENTS[ZODIAC_SIGNS.index(ascendant) % 4]
+    moon_element = ELEMENTS[ZODIAC_SIGNS.index(moon) % 4]
+    if asc_element == moon_element:
+        blend = "Outer manner and inner feeling agree, so people read you accurately."
+    elif {asc_element, moon_element} in ({"Fire", "Air"}, {"Earth", "Water"}):
+        blend = f"Your {asc_element.lower()} manner and {moon_element.lower()} feelings complement each other."
+    else:
+        blend = (f"There is a creative tension between your {asc_element.lower()} manner and "
+                 f"{moon_element.lower()} feelings; others may not see how you really feel.")
+    nature, emotion, comfort = SIGN_TEXT[ascendant][0], SIGN_TEXT[moon][1], SIGN_TEXT[moon][2]
+    lord = SIGN_LORDS[ZODIAC_SIGNS.index(ascendant)]
+    return (f"Your Ascendant is **{ascendant}**, ruled by {lord}. This creates a personality that is outwardly "
+            f"{nature}. {{outward}} at first meeting, you are often seen as {{impression}}.",
+            f"Your Moon Sign is **{moon}**. Your emotional core is {emotion}, and you find comfort in {comfort}. {blend}")
+
+
+def _placement_notes(planet, sign, house):
+    """(strength, challenge) this placement contributes, either may be None"""
+    state = dignity(planet, sign)
+    governs = PLANETS[planet][1]
+    strength = challenge = None
+    if state in ("exalted", "own sign"):
+        strength = f"Strong {governs} ({planet} {state} in {sign})"
+    elif house in KENDRAS and planet in ("Jupiter", "Venus", "Mercury"):
+        strength = f"Supportive {governs} ({planet} in the {ordinal(house)} house)"
+    if state == "debilitated":
+        challenge = f"Extra effort needed for {governs} ({planet} debilitated in {sign})"
+    elif planet in MALEFICS and house in (1, 7, 8):
+        challenge = f"Pressure on {HOUSES[house - 1]} ({planet} in the {ordinal(house)} house)"
+    return strength, challenge
+
+
+# Precompiled lookup tables
+SIGN_INDEX = {sign: i for i, sign in enumerate(ZODIAC_SIGNS)}
+# (planet, sign, house) -> (placement sentence, strength or None, challenge or None)
+PLACEMENTS = {(planet, sign, house): (_placement_text(planet, sign, house),) + _placement_notes(planet, sign, house)
+              for planet in PLANETS for sign in ZODIAC_SIGNS for house in range(1, 13)}
+# (ascendant, moon sign) -> (ascendant paragraph template, moon paragraph)
+PERSONALITY = {(asc, moon): _personality_text(asc, moon) for asc in ZODIAC_SIGNS for moon in ZODIAC_SIGNS}
+# life area -> (house, topic, SIGN_TEXT field)
+LIFE_AREAS = {"career": (10, "career", 5), "relationships": (7, "partnership", 6), "health": (6, "health", 7)}
+# (life area, sign on its house) -> sentence
+LIFE_LINES = {(area, sign): f"With {sign} on the {ordinal(house)} house of {topic}, look to {SIGN_TEXT[sign][field]}."
+              for area, (house, topic, field) in LIFE_AREAS.items() for sign in ZODIAC_SIGNS}
+CONSTITUTION = {sign: f"Your constitution is sensitive in {SIGN_TEXT[sign][7]}. " for sign in ZODIAC_SIGNS}
+NO_MOON_TEXT = "Your Moon Sign needs an exact birth date, time and place to calculate."
+
+
+def _sample(rng, items, k):
+    items = list(dict.fromkeys(items))
+    return rng.sample(items, min(k, len(items)))
+
+
+def _occupants(planets):
+    """Sentence for the planets in a life-area house"""
+    if not planets:
+        return ""
+    verb = "adds" if len(planets) == 1 else "add"
+    return f" {' and '.join(planets)} here {verb} {' and '.join(PLANETS[p][1] for p in planets)}."
+
+
+def interpret_chart(ascendant, planets, seed):
+    """
+    Full analysis (the same keys as the Gemini reply) for an ascendant sign
+    and planets [{"name", "sign"}, ...]. seed makes the choice of equivalent
+    fragments deterministic per person.
+    """
+    rng = random.Random(seed)
+    asc_index = SIGN_INDEX[ascendant]
+    details, strengths, challenges = [], [SIGN_TEXT[ascendant][3]], [SIGN_TEXT[ascendant][4]]
+    by_house = {}
+    moon = None
+    for p in planets:
+        planet, sign = p["name"], p["sign"]
+        if planet not in PLANETS:
+            continue
+        house = (SIGN_INDEX[sign] - asc_index) % 12 + 1
+        text, strength, challenge = PLACEMENTS[(planet, sign, house)]
+        details.append({"planet": planet, "sign": sign, "house": str(house), "significance": text})
+        if strength:
+            strengths.append(strength)
+        if challenge:
+            challenges.append(challenge)
+        by_house.setdefault(house, []).append(planet)
+        if planet == "Moon":
+            moon = sign
+
+    if moon is not None:
+        ascendant_text, moon_text = PERSONALITY[(ascendant, moon)]
+        strengths.insert(1, SIGN_TEXT[moon][3])
+        challenges.insert(1, SIGN_TEXT[moon][4])
+    else:
+        ascendant_text, moon_text = PERSONALITY[(ascendant, ascendant)][0], NO_MOON_TEXT
+    ascendant_text = ascendant_text.format(outward=rng.choice(TRAIT_WORDS["outward"]).capitalize(),
+                                           impression=rng.choice(TRAIT_WORDS["impression"]))
+
+    predictions = {}
+    for area, (house, _, _) in LIFE_AREAS.items():
+        sign = ZODIAC_SIGNS[(asc_index + house - 1) % 12]
+        predictions[area] = LIFE_LINES[(area, sign)] + _occupants(by_house.get(house))
+    predictions["health"] = CONSTITUTION[ascendant] + predictions["health"]
+
+    return {
+        "ascendant": ascendant_text,
+        "moon_sign": moon_text,
+        "planetary_details": details,
+        "strengths": _sample(rng, strengths, 4),
+        "challenges": _sample(rng, challenges, 3),
+        "life_predictions": predictions,
+    }
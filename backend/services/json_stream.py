@@ -0,0 +1,73 @@
+"""
+Incremental parser for a JSON object arriving in pieces (e.g. a streamed LLM reply).
+
+Feed text chunks as they come in; every top-level member of the object is
+returned as soon as its value is complete, without waiting for the closing
+brace. Anything before the first '{' (markdown fences, preamble) and after
+the final '}' is ignored. Each character is scanned once, so a reply of n
+characters costs O(n) however it is chunked.
+"""
+import json
+
+
+class ObjectStreamParser:
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.member_start = None
+        self.done = False
+
+    def feed(self, chunk):
+        """Consume a chunk and return a list of (key, value) members completed by it"""
+        members = []
+        if self.done:
+            return members
+        self.buffer += chunk
+        buffer = self.buffer
+        for i in range(self.pos, len(buffer)):
+            ch = buffer[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif self.depth == 0:
+                if ch == "{":
+                    self.depth = 1
+                    self.member_start = i + 1
+            elif ch == '"':
+                self.in_string = True
+            elif ch in "{[":
+                self.depth += 1
+            elif ch in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    members.extend(self._member(buffer[self.member_start:i]))
+                    self.done = True
+                    self.pos = i + 1
+                    return members
+            elif ch == "," and self.depth == 1:
+                members.extend(self._member(buffer[self.member_start:i]))
+                self.member_start = i + 1
+        self.pos = len(buffer)
+        # Drop text that can no longer be part of a pending member
+        if self.member_start is not None and self.member_start > 0:
+            self.buffer = buffer[self.member_start:]
+            self.pos -= self.member_start
+            self.member_start = 0
+        elif self.depth == 0:
+            self.buffer = ""
+            self.pos = 0
+        return members
+
+    @staticmethod
+    def _member(text):
+        """Parse one '"key": value' fragment; raises ValueError if it is not valid JSON"""
+        if not text.strip():
+            return []
+        return list(json.loads("{" + text + "}").items())
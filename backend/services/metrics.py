@@ -0,0 +1,216 @@
+"""
+In-process metrics: Prometheus histograms and counters, plus per-request
+stage timings for the Server-Timing header.
+
+timed(stage) measures a block of work, records it in the astro_stage_seconds
+histogram and, inside an HTTP request, adds it to that request's timings.
+The timings live in a ContextVar that ServerTimingMiddleware sets per request;
+run_in_threadpool copies the context, so stages timed in threadpool code are
+attributed to the right request. Chart timings measured in worker processes
+are sent back with the results and recorded here by the parent.
+
+GET /metrics renders the registry in the Prometheus text format (0.0.4).
+Metric updates take a per-metric lock and a bisect, so they are cheap enough
+for the chart hot path.
+"""
+import bisect
+import contextlib
+import contextvars
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; from a single swisseph call (~10 us) up to a slow LLM reply
+DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def values(self):
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labelvalues, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labelvalues)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labelvalues -> [per-bucket counts (last is +Inf), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: ([*counts], total) for labels, (counts, total) in self._series.items()}
+        for labelvalues, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = 'le="%g"' % bound
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labelvalues, le)} {cumulative}")
+            cumulative += counts[-1]
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, labelvalues, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labelvalues)} {total:.9g}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labelvalues)} {cumulative}")
+        return lines
+
+
+_metrics = []
+
+
+def _register(metric):
+    _metrics.append(metric)
+    return metric
+
+
+REQUEST_SECONDS = _register(Histogram(
+    "astro_http_request_seconds", "HTTP request latency until the response starts", ("method", "route", "status")))
+STAGE_SECONDS = _register(Histogram(
+    "astro_stage_seconds", "Time spent per processing stage", ("stage",)))
+BODY_SECONDS = _register(Histogram(
+    "astro_body_position_seconds", "Time per body position lookup (swe.calc_ut or the ephemeris table)", ("body",)))
+LLM_SECONDS = _register(Histogram(
+    "astro_llm_request_seconds", "Gemini call latency", ("model", "outcome")))
+FALLBACKS = _register(Counter(
+    "astro_fallbacks_total", "Responses served by a local fallback instead of the LLM", ("endpoint", "reason")))
+
+
+def render_metrics():
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- per-request stage timings ---
+# stage -> [total seconds, count] for the current request, or None outside one
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def record_stage(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        entry = timings.get(stage)
+        if entry is None:
+            timings[stage] = [seconds, 1]
+        else:
+            entry[0] += seconds
+            entry[1] += 1
+
+
+@contextlib.contextmanager
+def timed(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+def record_fallback(endpoint, reason, error=None):
+    """Count a response served by a local fallback and log why"""
+    FALLBACKS.inc(endpoint, reason)
+    logger.warning("Switching to local fallback", extra={"endpoint": endpoint, "reason": reason,
+                                                          "error": str(error) if error else None})
+
+
+def fallback_counts():
+    """{endpoint: {reason: count}}"""
+    counts = {}
+    for (endpoint, reason), value in FALLBACKS.values().items():
+        counts.setdefault(endpoint, {})[reason] = value
+    return counts
+
+
+def server_timing(timings, total):
+    """Server-Timing header value: one entry per stage (ms, summed over repeats) plus the total"""
+    entries = []
+    for stage, (seconds, count) in timings.items():
+        entry = f"{stage};dur={seconds * 1000:.3f}"
+        if count > 1:
+            entry += f';desc="{count}x"'
+        entries.append(entry)
+    entries.append(f"total;dur={total * 1000:.3f}")
+    return ", ".join(entries)
+
+
+class ServerTimingMiddleware:
+    """
+    Times every HTTP request into astro_http_request_seconds and adds a
+    Server-Timing header listing the stages recorded before the response
+    started (for streamed responses, only the work done before the first byte).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = {}
+        token = _request_timings.set(timings)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                elapsed = time.perf_counter() - started
+                route = scope.get("route")
+                REQUEST_SECONDS.observe(elapsed, scope["method"], getattr(route, "path", "unmatched"),
+                                        str(message["status"]))
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(timings, elapsed).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
@@ -0,0 +1,292 @@
+"""
+Panchang: sunrise, sunset, vara, tithi, nakshatra, yoga and karana per day.
+
+The four limbs are angles that only ever increase (Moon - Sun elongation,
+Moon longitude, Sun + Moon longitude), so their transitions are found by
+sampling the angles on a half-day grid, bracketing every boundary the
+unwrapped angle passes and solving for it with Newton steps on the ephemeris
+speed. They are the same instants everywhere; only sunrise/sunset
+(swe.rise_trans) and the local calendar date depend on the place.
+
+Days are cached per (lat/lon cell, time zone, date) in a bounded LRU, so
+everyone in the same city shares them. PANCHANG_CELL_DEG sets the cell size
+(default 0.1°, sunrise within ~30 s across a cell) and PANCHANG_CACHE_SIZE
+the number of days kept. precompute_panchang() fills a year for each city in
+PANCHANG_PRECOMPUTE (";"-separated place names) at startup.
+"""
+import bisect
+import collections
+import datetime
+import logging
+import os
+import threading
+
+import numpy as np
+import pytz
+import swisseph as swe
+
+from services.chart_engine import FLAGS, ensure_configured
+from services.ephemeris import calc_lon_speed
+from services.gazetteer import resolve_coordinates
+from services.timezones import local_to_utc, resolve_zone
+from services.vedic import NAKSHATRA_SPAN, NAKSHATRAS, datetime_to_jd, jd_to_datetime
+
+logger = logging.getLogger(__name__)
+
+TITHIS = ("Pratipada", "Dwitiya", "Tritiya", "Chaturthi", "Panchami", "Shashthi", "Saptami", "Ashtami",
+          "Navami", "Dashami", "Ekadashi", "Dwadashi", "Trayodashi", "Chaturdashi")
+YOGAS = ("Vishkambha", "Priti", "Ayushman", "Saubhagya", "Shobhana", "Atiganda", "Sukarma", "Dhriti", "Shula",
+         "Ganda", "Vriddhi", "Dhruva", "Vyaghata", "Harshana", "Vajra", "Siddhi", "Vyatipata", "Variyana",
+         "Parigha", "Shiva", "Siddha", "Sadhya", "Shubha", "Shukla", "Brahma", "Indra", "Vaidhriti")
+MOVABLE_KARANAS = ("Bava", "Balava", "Kaulava", "Taitila", "Gara", "Vanija", "Vishti")
+# Indexed by datetime.date.weekday() (Monday = 0)
+VARAS = ("Somavara", "Mangalavara", "Budhavara", "Guruvara", "Shukravara", "Shanivara", "Ravivara")
+
+# element -> (angle: "elongation" / "moon" / "sum", degrees per division, divisions per circle)
+ELEMENTS = {
+    "tithi": ("elongation", 12.0, 30),
+    "karana": ("elongation", 6.0, 60),
+    "nakshatra": ("moon", NAKSHATRA_SPAN, 27),
+    "yoga": ("sum", NAKSHATRA_SPAN, 27),
+}
+
+SAMPLE_DAYS = 0.5     # the fastest angle (Sun + Moon) moves < 8° per half day
+TOLERANCE_DAYS = 1e-6  # ~0.1 s
+MAX_DAYS = 366
+RISE_FLAGS = swe.FLG_MOSEPH
+
+CELL_DEG = float(os.getenv("PANCHANG_CELL_DEG", 0.1))
+
+
+def tithi_name(index):
+    paksha = "Shukla" if index < 15 else "Krishna"
+    if index == 14:
+        return paksha, "Purnima"
+    if index == 29:
+        return paksha, "Amavasya"
+    return paksha, TITHIS[index % 15]
+
+
+def karana_name(index):
+    if index == 0:
+        return "Kimstughna"
+    if index >= 57:
+        return ("Shakuni", "Chatushpada", "Naga")[index - 57]
+    return MOVABLE_KARANAS[(index - 1) % 7]
+
+
+def element_entry(element, index):
+    if element == "tithi":
+        paksha, name = tithi_name(index)
+        return {"index": index + 1, "name": name, "paksha": paksha}
+    if element == "karana":
+        return {"index": index + 1, "name": karana_name(index)}
+    names = NAKSHATRAS if element == "nakshatra" else YOGAS
+    return {"index": index + 1, "name": names[index]}
+
+
+def _angles(jd):
+    """(elongation, moon, sum) longitudes and their speeds (deg/day) at jd"""
+    sun, sun_speed = calc_lon_speed(jd, swe.SUN, FLAGS)
+    moon, moon_speed = calc_lon_speed(jd, swe.MOON, FLAGS)
+    return {
+        "elongation": ((moon - sun) % 360.0, moon_speed - sun_speed),
+        "moon": (moon, moon_speed),
+        "sum": ((sun + moon) % 360.0, sun_speed + moon_speed),
+    }
+
+
+def _crossing(angle, target, a, b, fa, fb):
+    """Time in [a, b] at which the increasing angle reaches target (fa <= target < fb, unwrapped)"""
+    t = a + (b - a) * (target - fa) / (fb - fa)
+    for _ in range(20):
+        value, speed = _angles(t)[angle]
+        step = ((value - target + 180.0) % 360.0 - 180.0) / speed
+        t = min(max(t - step, a), b)
+        if abs(step) < TOLERANCE_DAYS:
+            break
+    return t
+
+
+def find_transitions(jd_start, jd_end):
+    """
+    {element: (jds, indices)}: each element's index at jd_start (with jd
+    -inf) followed by every change in (jd_start, jd_end] with the index it
+    changes to.
+    """
+    ensure_configured()
+    n = max(2, int(np.ceil((jd_end - jd_start) / SAMPLE_DAYS)) + 1)
+    grid = np.linspace(jd_start, jd_end, n)
+    samples = [_angles(jd) for jd in grid]
+    unwrapped = {angle: np.unwrap([s[angle][0] for s in samples], period=360.0)
+                 for angle in ("elongation", "moon", "sum")}
+
+    transitions = {}
+    for element, (angle, span, divisions) in ELEMENTS.items():
+        values = unwrapped[angle]
+        jds, indices = [float("-inf")], [int(values[0] // span) % divisions]
+        for i in range(n - 1):
+            first, last = int(values[i] // span) + 1, int(values[i + 1] // span)
+            for k in range(first, last + 1):
+                jds.append(_crossing(angle, k * span, grid[i], grid[i + 1], values[i], values[i + 1]))
+                indices.append(k % divisions)
+        transitions[element] = (jds, indices)
+    return transitions
+
+
+def _sun_event(jd, lat, lon, event):
+    """First sunrise/sunset after jd (upper limb, with refraction), or None where the Sun does not rise/set"""
+    res, tret = swe.rise_trans(jd, swe.SUN, event, (lon, lat, 0.0), 0.0, 0.0, RISE_FLAGS)
+    return tret[0] if res == 0 else None
+
+
+def _local_iso(jd, tz):
+    return jd_to_datetime(jd).astimezone(tz).isoformat()
+
+
+def _day_segments(element, transitions, day_start, day_end, tz):
+    """Element periods overlapping [day_start, day_end), each with its start and end"""
+    jds, indices = transitions[element]
+    first = bisect.bisect_right(jds, day_start) - 1
+    segments = []
+    for i in range(first, len(jds)):
+        if jds[i] >= day_end:
+            break
+        entry = element_entry(element, indices[i])
+        entry["start"] = _local_iso(jds[i], tz) if jds[i] != float("-inf") else None
+        entry["end"] = _local_iso(jds[i + 1], tz) if i + 1 < len(jds) else None
+        segments.append(entry)
+    return segments
+
+
+def compute_days(lat, lon, zone, dates):
+    """Panchang for consecutive local dates at (lat, lon), found in one transition pass"""
+    tz = pytz.timezone(zone)
+    midnights = []
+    for offset in range(len(dates) + 1):
+        local = datetime.datetime.combine(dates[0] + datetime.timedelta(days=offset), datetime.time())
+        utc, _, _ = local_to_utc(local, zone)
+        midnights.append(datetime_to_jd(utc))
+    sunrises = [_sun_event(jd, lat, lon, swe.CALC_RISE) for jd in midnights]
+    # A Panchang day runs from sunrise to the next sunrise (midnight where the Sun does not rise)
+    starts = [rise if rise is not None else midnight for rise, midnight in zip(sunrises, midnights)]
+    # Elements can start well before the first sunrise and end well after the last one (a nakshatra lasts up to ~27 h)
+    transitions = find_transitions(starts[0] - 1.5, starts[-1] + 1.5)
+
+    days = {}
+    for i, date in enumerate(dates):
+        sunrise = sunrises[i]
+        sunset = _sun_event(sunrise if sunrise is not None else midnights[i], lat, lon, swe.CALC_SET)
+        day = {
+            "date": date.isoformat(),
+            "vara": VARAS[date.weekday()],
+            "sunrise": _local_iso(sunrise, tz) if sunrise is not None else None,
+            "sunset": _local_iso(sunset, tz) if sunset is not None and sunset < starts[i + 1] else None,
+        }
+        for element in ELEMENTS:
+            day[element] = _day_segments(element, transitions, starts[i], starts[i + 1], tz)
+        days[date] = day
+    return days
+
+
+class PanchangCache:
+    """Bounded LRU of Panchang days keyed by (cell lat, cell lon, zone, date)"""
+
+    def __init__(self, max_entries=20000):
+        self.max_entries = max_entries
+        self._days = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_days(self, lat, lon, zone, dates):
+        with self._lock:
+            found = {}
+            for date in dates:
+                day = self._days.get((lat, lon, zone, date))
+                if day is not None:
+                    self._days.move_to_end((lat, lon, zone, date))
+                    found[date] = day
+            self.hits += len(found)
+            self.misses += len(dates) - len(found)
+
+        missing = [date for date in dates if date not in found]
+        if missing:
+            # One pass over the span of the missing dates (cached ones inside it are refreshed)
+            span = [missing[0] + datetime.timedelta(days=i) for i in range((missing[-1] - missing[0]).days + 1)]
+            computed = compute_days(lat, lon, zone, span)
+            found.update(computed)
+            with self._lock:
+                for date, day in computed.items():
+                    self._days[(lat, lon, zone, date)] = day
+                    self._days.move_to_end((lat, lon, zone, date))
+                while len(self._days) > self.max_entries:
+                    self._days.popitem(last=False)
+        return [found[date] for date in dates]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._days),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_panchang_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PanchangCache(int(os.getenv("PANCHANG_CACHE_SIZE", 20000)))
+        return _cache
+
+
+def location_cell(lat, lon):
+    """Centre of the PANCHANG_CELL_DEG cell containing (lat, lon)"""
+    def snap(value):
+        return round(round(value / CELL_DEG) * CELL_DEG, 6) + 0.0
+    return snap(lat), snap(lon)
+
+
+def get_panchang(lat, lon, start, end, timezone=None, place=None):
+    """
+    Panchang days for local dates start..end (inclusive) at the cell of
+    (lat, lon). Returns (location meta, days).
+    """
+    if end < start:
+        raise ValueError("end must not be before start")
+    if (end - start).days + 1 > MAX_DAYS:
+        raise ValueError(f"range is limited to {MAX_DAYS} days")
+    cell_lat, cell_lon = location_cell(lat, lon)
+    zone, source = resolve_zone(cell_lat, cell_lon, timezone, place)
+    dates = [start + datetime.timedelta(days=i) for i in range((end - start).days + 1)]
+    days = get_panchang_cache().get_days(cell_lat, cell_lon, zone, dates)
+    location = {"lat": cell_lat, "lon": cell_lon, "cell_deg": CELL_DEG, "timezone": zone, "timezone_source": source}
+    return location, days
+
+
+def precompute_panchang(places=None, days=None):
+    """Fill the cache for each PANCHANG_PRECOMPUTE place from the first of this month for PANCHANG_PRECOMPUTE_DAYS days"""
+    if places is None:
+        places = [p.strip() for p in os.getenv("PANCHANG_PRECOMPUTE", "").split(";") if p.strip()]
+    days = days or min(int(os.getenv("PANCHANG_PRECOMPUTE_DAYS", MAX_DAYS)), MAX_DAYS)
+    start = datetime.date.today().replace(day=1)
+    done = 0
+    for name in places:
+        try:
+            lat, lon, place = resolve_coordinates(name, None, None)
+            get_panchang(lat, lon, start, start + datetime.timedelta(days=days - 1), place=place)
+            done += 1
+        except ValueError as e:
+            logger.warning("Panchang precompute skipped: %s", e, extra={"place": name})
+        except Exception:
+            logger.exception("Panchang precompute failed", extra={"place": name})
+    if places:
+        logger.info("Panchang precomputed", extra={"places": done, "days": days})
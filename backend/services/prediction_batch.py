@@ -0,0 +1,124 @@
+"""
+Day-at-a-time prediction generation.
+
+All twelve rasis of a date are asked for in one structured upstream call
+instead of one call each. The combined reply is validated and split per sign,
+every valid sign is written to the prediction cache, and only the signs that
+failed validation are asked for again. Concurrent fills for the same date
+(user misses, the background scheduler) share one in-flight batch.
+"""
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class DayBatchLoader:
+    def __init__(self, cache, generate, validate, rasis, max_retries=2):
+        """
+        generate: async (date, rasis) -> {rasi: raw prediction}, one upstream call; raises if the call fails.
+        validate: raw prediction -> prediction dict, or None if it is unusable.
+        max_retries: extra calls made for the signs that failed validation.
+        """
+        self.cache = cache
+        self.generate = generate
+        self.validate = validate
+        self.rasis = list(rasis)
+        self.max_retries = max_retries
+        self.batches = 0
+        self.upstream_calls = 0
+        self.upstream_errors = 0
+        self.signs_requested = 0
+        self.signs_stored = 0
+        self.signs_invalid = 0
+        self.retries = 0
+        # date -> (task, rasis it covers), all on the serving event loop
+        self._flights = {}
+
+    def canonical(self, rasi):
+        """The configured spelling of a rasi name, or None if it is not one"""
+        wanted = rasi.strip().lower()
+        return next((name for name in self.rasis if name.lower() == wanted), None)
+
+    async def fill(self, date, rasis=None):
+        """
+        Generate and store predictions for date; returns {rasi: prediction}
+        for the signs that succeeded.
+
+        rasis defaults to every sign missing from the cache. An in-flight
+        batch for the same date is joined, and only signs it does not cover
+        start a new one. Raises if the first upstream call of a batch fails.
+        """
+        if rasis is None:
+            rasis = [rasi for rasi in self.rasis if self.cache.get(self.cache.make_key(rasi, date)) is None]
+        results = {}
+        flight = self._flights.get(date)
+        if flight is not None:
+            task, covered = flight
+            results.update(await asyncio.shield(task))
+            rasis = [rasi for rasi in rasis if rasi not in covered]
+        if rasis:
+            task = asyncio.ensure_future(self._fill(date, rasis))
+            self._flights[date] = (task, set(rasis))
+            task.add_done_callback(lambda done: self._forget(date, done))
+            results.update(await asyncio.shield(task))
+        return results
+
+    def _forget(self, date, task):
+        if self._flights.get(date, (None,))[0] is task:
+            del self._flights[date]
+
+    async def load(self, rasi, date):
+        """Loader for a single (rasi, date) cache miss: generates the whole day"""
+        results = await self.fill(date)
+        if rasi not in results:
+            # Filled by a batch that finished before this one started
+            value = self.cache.get(self.cache.make_key(rasi, date))
+            if value is None:
+                raise ValueError(f"No valid prediction for {rasi} on {date}")
+            return value
+        return results[rasi]
+
+    async def _fill(self, date, rasis):
+        self.batches += 1
+        self.signs_requested += len(rasis)
+        results = {}
+        pending = list(rasis)
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.retries += 1
+            self.upstream_calls += 1
+            try:
+                raw = await self.generate(date, pending)
+            except Exception:
+                self.upstream_errors += 1
+                # Keep what earlier attempts stored; only a failed first call fails the batch
+                if attempt == 0:
+                    raise
+                break
+            for rasi in pending:
+                value = self.validate(raw.get(rasi))
+                if value is not None:
+                    self.cache.set(self.cache.make_key(rasi, date), value)
+                    results[rasi] = value
+            pending = [rasi for rasi in pending if rasi not in results]
+            self.signs_invalid += len(pending)
+            if not pending:
+                break
+        self.signs_stored += len(results)
+        if pending:
+            logger.warning("Prediction batch for %s: no valid prediction for %s", date, ", ".join(pending))
+        return results
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "upstream_calls": self.upstream_calls,
+            "upstream_errors": self.upstream_errors,
+            "signs_requested": self.signs_requested,
+            "signs_stored": self.signs_stored,
+            "signs_invalid": self.signs_invalid,
+            "retries": self.retries,
+            # 1.0 would be one call per sign
+            "signs_per_call": round(self.signs_stored / self.upstream_calls, 2) if self.upstream_calls else 0.0,
+        }
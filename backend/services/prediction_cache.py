@@ -0,0 +1,170 @@
+"""
+Persistent cache for daily horoscope predictions.
+
+A prediction depends only on (rasi, date), so there are only 12 live keys per
+day. Entries are stored in a local SQLite file with an entry limit and stay
+valid until the end of their date (and at least the TTL after being stored),
+and concurrent misses for the same key are coalesced so only one upstream
+call is made while the other requests await its result.
+"""
+import asyncio
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "predictions.sqlite3")
+
+
+class PredictionCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_seconds=24 * 3600, max_entries=10000):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.loads = 0
+        self.load_errors = 0
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS predictions ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS predictions_created ON predictions (created_at)")
+        self._db_lock = threading.Lock()
+        # In-flight loads per key, all on the serving event loop
+        self._flights = {}
+
+    @staticmethod
+    def make_key(rasi, date):
+        return f"{rasi.strip().lower()}|{date}"
+
+    def expires_at(self, key, now):
+        """End of the key's date (local time), but never sooner than the TTL from now"""
+        expires = now + self.ttl_seconds
+        try:
+            date = datetime.date.fromisoformat(key.rpartition("|")[2])
+        except ValueError:
+            return expires
+        end_of_date = datetime.datetime.combine(date + datetime.timedelta(days=1), datetime.time.min).timestamp()
+        return max(expires, end_of_date)
+
+    def get(self, key):
+        """Return the cached value, or None if missing or expired (does not touch hit/miss counters)"""
+        with self._db_lock:
+            row = self._db.execute("SELECT value, expires_at FROM predictions WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return json.loads(row[0])
+
+    def remaining_ttl(self, key):
+        """Seconds until key expires (0 when missing or already expired)"""
+        with self._db_lock:
+            row = self._db.execute("SELECT expires_at FROM predictions WHERE key = ?", (key,)).fetchone()
+        return max(0.0, row[0] - time.time()) if row else 0.0
+
+    def set(self, key, value):
+        now = time.time()
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO predictions (key, value, created_at, expires_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, self.expires_at(key, now)),
+            )
+            self._db.execute("DELETE FROM predictions WHERE expires_at <= ?", (now,))
+            # Enforce the size limit by dropping the oldest entries
+            self._db.execute(
+                "DELETE FROM predictions WHERE key IN ("
+                " SELECT key FROM predictions ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    async def get_or_load(self, key, loader):
+        """
+        Return the cached value for key, awaiting loader() on a miss.
+
+        Only one load runs per key at a time; concurrent callers await the same
+        task and share its result (or its exception). The load runs as its own
+        task so a disconnecting client does not cancel it for the others.
+        Only successful results are stored.
+        """
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        flight = self._flights.get(key)
+        if flight is None:
+            self.misses += 1
+            flight = self._flights[key] = asyncio.ensure_future(self._load(key, loader))
+            flight.add_done_callback(lambda task: self._flights.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(flight)
+
+    async def refresh(self, key, loader):
+        """
+        Load key and store the result even if a cached value exists.
+
+        Used by background pre-generation: it joins an in-flight load for the
+        same key instead of starting a second one, and leaves the hit/miss
+        counters to user traffic.
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = asyncio.ensure_future(self._load(key, loader, force=True))
+            flight.add_done_callback(lambda task: self._flights.pop(key, None))
+        return await asyncio.shield(flight)
+
+    async def _load(self, key, loader, force=False):
+        # Another load may have filled the key between the lookup and this task starting
+        value = None if force else self.get(key)
+        if value is not None:
+            return value
+        self.loads += 1
+        try:
+            value = await loader()
+        except Exception:
+            self.load_errors += 1
+            raise
+        self.set(key, value)
+        return value
+
+    def stats(self):
+        with self._db_lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM predictions WHERE expires_at > ?", (time.time(),)).fetchone()[0]
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "loads": self.loads,
+            "load_errors": self.load_errors,
+            "hit_ratio": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_prediction_cache():
+    """Shared cache configured from PREDICTION_CACHE_PATH / _TTL / _MAX_ENTRIES"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PredictionCache(
+                path=os.getenv("PREDICTION_CACHE_PATH", DEFAULT_CACHE_PATH),
+                ttl_seconds=int(os.getenv("PREDICTION_CACHE_TTL", 24 * 3600)),
+                max_entries=int(os.getenv("PREDICTION_CACHE_MAX_ENTRIES", 10000)),
+            )
+        return _cache
@@ -0,0 +1,172 @@
+"""
+Background pre-generation of daily predictions.
+
+The key space is 12 rasis x a handful of upcoming dates, so instead of
+generating lazily while a user waits on the LLM, an in-process task fills the
+prediction cache for today plus the next N days. Cached entries last until the
+end of their date, so signs already cached are skipped, the missing signs of
+each date are generated together in one batch (dates run at bounded
+concurrency), signs a batch could not produce are retried with backoff, and
+the request path becomes a cache lookup.
+"""
+import asyncio
+import datetime
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PredictionScheduler:
+    def __init__(self, cache, fill_day, rasis, days_ahead=2, concurrency=2, max_retries=3,
+                 retry_delay=5.0, interval=1800.0):
+        """
+        fill_day: async callable (date, rasis) -> {rasi: prediction} that generates
+            and stores the given signs, omitting the ones it could not produce
+            and raising if the upstream call failed.
+        """
+        self.cache = cache
+        self.fill_day = fill_day
+        self.rasis = list(rasis)
+        self.days_ahead = days_ahead
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.interval = interval
+
+        self.running = False
+        self.runs = 0
+        self.last_run_started = None
+        self.last_run_finished = None
+        self.jobs_total = 0
+        self.jobs_done = 0
+        self.jobs_failed = 0
+        self.jobs_skipped = 0
+        self.retries = 0
+        self.behind_since = None
+        self._task = None
+
+    def window(self, today=None):
+        today = today or datetime.date.today()
+        return [(today + datetime.timedelta(days=i)).isoformat() for i in range(self.days_ahead + 1)]
+
+    def _is_fresh(self, rasi, date):
+        # Entries last until the end of their date, so only missing (or failed) signs need generating
+        return self.cache.remaining_ttl(self.cache.make_key(rasi, date)) > 0
+
+    async def run_once(self, today=None):
+        """Generate every stale (rasi, date) in the window; returns the number of failed jobs"""
+        self.running = True
+        self.runs += 1
+        self.last_run_started = time.time()
+        jobs = [(rasi, date) for date in self.window(today) for rasi in self.rasis]
+        pending = [job for job in jobs if not self._is_fresh(*job)]
+        self.jobs_total = len(jobs)
+        self.jobs_skipped = len(jobs) - len(pending)
+        self.jobs_done = 0
+        self.jobs_failed = 0
+        if pending and self.behind_since is None:
+            self.behind_since = self.last_run_started
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        by_date = {}
+        for rasi, date in pending:
+            by_date.setdefault(date, []).append(rasi)
+
+        async def run_date(date, rasis):
+            for attempt in range(self.max_retries + 1):
+                try:
+                    async with semaphore:
+                        results = await self.fill_day(date, rasis)
+                    self.jobs_done += len(results)
+                    rasis = [rasi for rasi in rasis if rasi not in results]
+                    error = "no valid prediction"
+                except Exception as e:
+                    error = e
+                if not rasis:
+                    return
+                if attempt == self.max_retries:
+                    logger.warning("Prediction pre-generation failed for %s on %s: %s", ", ".join(rasis), date, error)
+                    self.jobs_failed += len(rasis)
+                    return
+                self.retries += 1
+                # Back off without holding a concurrency slot
+                await asyncio.sleep(self.retry_delay * 2 ** attempt)
+
+        try:
+            await asyncio.gather(*(run_date(date, rasis) for date, rasis in by_date.items()))
+        finally:
+            self.running = False
+            self.last_run_finished = time.time()
+        if self.jobs_failed == 0:
+            self.behind_since = None
+        return self.jobs_failed
+
+    async def run_forever(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.exception("Prediction scheduler run failed: %s", e)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run_forever())
+        return self._task
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        window = self.window()
+        fresh = sum(1 for date in window for rasi in self.rasis if self._is_fresh(rasi, date))
+        total = len(window) * len(self.rasis)
+        completed = self.jobs_skipped + self.jobs_done + self.jobs_failed
+        return {
+            "running": self.running,
+            "runs": self.runs,
+            "window": {"start": window[0], "end": window[-1], "fresh": fresh, "total": total},
+            "progress": round(completed / self.jobs_total, 4) if self.jobs_total else 1.0,
+            "jobs": {"total": self.jobs_total, "done": self.jobs_done, "skipped": self.jobs_skipped,
+                     "failed": self.jobs_failed, "retries": self.retries},
+            "last_run_started": self.last_run_started,
+            "last_run_finished": self.last_run_finished,
+            # How long the store has been missing part of the window (0 when fully covered)
+            "lag_seconds": 0.0 if fresh == total or self.behind_since is None else round(time.time() - self.behind_since, 1),
+        }
+
+
+_scheduler = None
+
+
+def start_prediction_scheduler(cache, fill_day, rasis):
+    """Create and start the shared scheduler, configured from PREDICTION_PREFETCH_* variables"""
+    global _scheduler
+    _scheduler = PredictionScheduler(
+        cache, fill_day, rasis,
+        days_ahead=int(os.getenv("PREDICTION_PREFETCH_DAYS", 2)),
+        concurrency=int(os.getenv("PREDICTION_PREFETCH_CONCURRENCY", 2)),
+        max_retries=int(os.getenv("PREDICTION_PREFETCH_RETRIES", 3)),
+        interval=float(os.getenv("PREDICTION_PREFETCH_INTERVAL", 1800)),
+    )
+    _scheduler.start()
+    return _scheduler
+
+
+def get_prediction_scheduler():
+    return _scheduler
+
+
+async def stop_prediction_scheduler():
+    global _scheduler
+    if _scheduler is not None:
+        await _scheduler.stop()
+    _scheduler = None
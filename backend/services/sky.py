@@ -0,0 +1,272 @@
+"""
+Observer sky view: altitude/azimuth tracks, rise/transit/set and visibility
+of the Sun, Moon and planets from a place over a time grid.
+
+swisseph is only called for apparent equatorial coordinates (RA, Dec,
+distance) at nodes every 6 hours (hourly for the Moon); the grid (e.g.
+5-minute steps) interpolates them linearly, which is within a few
+arc-seconds. Sidereal time is linear in UT, so the hour angle, the
+equatorial-to-horizontal rotation, lunar parallax and refraction are numpy
+expressions over the whole (bodies x samples) grid instead of a swe.azalt
+call per sample. Rise, set and meridian transit times are
+bracketed by the grid and refined with a few vectorised regula falsi steps on
+the same model.
+
+Long ranges are produced in chunks (sky_chunks) so they can be streamed.
+"""
+import datetime
+
+import numpy as np
+import pytz
+import swisseph as swe
+
+from services.chart_engine import ensure_configured
+from services.timezones import local_to_utc, resolve_zone
+from services.vedic import datetime_to_jd, jd_to_datetime, jd_to_iso
+
+SKY_BODIES = {
+    "Sun": swe.SUN, "Moon": swe.MOON, "Mercury": swe.MERCURY, "Venus": swe.VENUS, "Mars": swe.MARS,
+    "Jupiter": swe.JUPITER, "Saturn": swe.SATURN, "Uranus": swe.URANUS, "Neptune": swe.NEPTUNE, "Pluto": swe.PLUTO,
+}
+EQUATORIAL_FLAGS = swe.FLG_MOSEPH | swe.FLG_EQUATORIAL
+# Spacing of the swisseph nodes the grid interpolates between
+NODE_DAYS = {"Moon": 1.0 / 24.0}
+DEFAULT_NODE_DAYS = 0.25
+SIDEREAL_RATE = 360.98564736629  # degrees of sidereal time per UT day
+EARTH_RADIUS_AU = 6378.137 / 149597870.7
+# Rise/set when the apparent upper limb touches the horizon: minus the semi-diameter (degrees)
+HORIZON = {"Sun": -0.2666, "Moon": -0.2583}
+# Planets count as visible above the horizon once the Sun is below civil twilight
+TWILIGHT_ALTITUDE = -6.0
+
+MIN_STEP_MINUTES = 1
+MAX_STEP_MINUTES = 240
+MAX_SAMPLES = 105408     # a year at 5-minute steps, for streamed responses
+MAX_JSON_SAMPLES = 2016  # a week at 5-minute steps in one JSON body
+CHUNK_SAMPLES = 288
+REFINE_STEPS = 4
+
+
+def _refraction(alt):
+    """Refraction in degrees for true altitudes (Saemundsson, 10 °C and 1010 hPa); 0 well below the horizon"""
+    safe = np.maximum(alt, -1.0)
+    return np.where(alt > -1.0, 1.02 / np.tan(np.radians(safe + 10.3 / (safe + 5.11))) / 60.0, 0.0)
+
+
+class SkyModel:
+    """
+    Horizontal coordinates of bodies seen from (lat, lon) during
+    [jd_start, jd_end]. Bodies are addressed by their index in self.bodies,
+    so one call evaluates any mix of (body, time) pairs.
+    """
+
+    def __init__(self, lat, lon, jd_start, jd_end, bodies=tuple(SKY_BODIES)):
+        ensure_configured()
+        self.sin_lat, self.cos_lat = np.sin(np.radians(lat)), np.cos(np.radians(lat))
+        self.jd0 = jd_start
+        self.lst0 = swe.sidtime(jd_start) * 15.0 + lon
+        self.bodies = tuple(bodies)
+        self.node_days = np.array([NODE_DAYS.get(name, DEFAULT_NODE_DAYS) for name in self.bodies])
+        self.node0 = jd_start - self.node_days
+        # (bodies, nodes) RA/Dec/distance; rows of slower bodies are shorter and padded with their last node
+        counts = np.ceil((jd_end - jd_start) / self.node_days).astype(int) + 3
+        nodes = np.empty((len(self.bodies), counts.max(), 3))
+        for row, name in enumerate(self.bodies):
+            jds = self.node0[row] + np.arange(counts[row]) * self.node_days[row]
+            nodes[row, :counts[row]] = [swe.calc_ut(jd, SKY_BODIES[name], EQUATORIAL_FLAGS)[0][:3] for jd in jds.tolist()]
+            nodes[row, counts[row]:] = nodes[row, counts[row] - 1]
+        self.ra = np.unwrap(nodes[:, :, 0], period=360.0, axis=1)
+        self.dec = nodes[:, :, 1]
+        self.dist = nodes[:, :, 2]
+        self.last = counts - 2
+        self.horizon = np.array([HORIZON.get(name, 0.0) for name in self.bodies])
+
+    def horizontal(self, rows, jds):
+        """
+        (apparent altitude, azimuth from north through east, hour angle in
+        [-180, 180)) for body rows and UT Julian days (broadcast together)
+        """
+        pos = (jds - self.node0[rows]) / self.node_days[rows]
+        index = np.clip(pos.astype(int), 0, self.last[rows])
+        frac = pos - index
+        ra, dec, dist = (table[rows, index] + frac * (table[rows, index + 1] - table[rows, index])
+                         for table in (self.ra, self.dec, self.dist))
+        hour_angle = (self.lst0 + SIDEREAL_RATE * (jds - self.jd0) - ra + 180.0) % 360.0 - 180.0
+        h, d = np.radians(hour_angle), np.radians(dec)
+        sin_alt = self.sin_lat * np.sin(d) + self.cos_lat * np.cos(d) * np.cos(h)
+        alt = np.degrees(np.arcsin(np.clip(sin_alt, -1.0, 1.0)))
+        az = np.degrees(np.arctan2(-np.cos(d) * np.sin(h), np.sin(d) * self.cos_lat - np.cos(d) * np.cos(h) * self.sin_lat)) % 360.0
+        # Topocentric parallax (only the Moon's is noticeable), then refraction
+        alt = alt - np.degrees(np.arcsin(EARTH_RADIUS_AU / dist)) * np.cos(np.radians(alt))
+        return alt + _refraction(alt), az, hour_angle
+
+    def _refine(self, rows, a, b, fa, fb, part, offset):
+        """Vectorised regula falsi for roots of horizontal()[part] - offset bracketed by [a, b]"""
+        for _ in range(REFINE_STEPS):
+            c = (a * fb - b * fa) / (fb - fa)
+            fc = self.horizontal(rows, c)[part] - offset
+            left = np.sign(fc) == np.sign(fa)
+            a, fa = np.where(left, c, a), np.where(left, fc, fa)
+            b, fb = np.where(left, b, c), np.where(left, fb, fc)
+        return (a * fb - b * fa) / (fb - fa)
+
+    def events(self, jds, alt, hour_angle):
+        """
+        Rise, set and upper transit events of every body inside the grid jds,
+        given its (bodies, samples) altitude and hour angle; a list per body,
+        oldest first.
+        """
+        events = [[] for _ in self.bodies]
+        above = alt - self.horizon[:, None]
+        rows, cols = np.nonzero(np.sign(above[:, 1:]) != np.sign(above[:, :-1]))
+        if rows.size:
+            times = self._refine(rows, jds[cols], jds[cols + 1], above[rows, cols], above[rows, cols + 1],
+                                 0, self.horizon[rows])
+            azimuths = self.horizontal(rows, times)[1]
+            rising = above[rows, cols + 1] > 0
+            for row, t, az, up in zip(rows.tolist(), times.tolist(), azimuths.tolist(), rising.tolist()):
+                events[row].append((t, {"type": "rise" if up else "set", "azimuth": round(az, 2)}))
+        # Upper transit: hour angle passes 0 going up (its wrap at ±180 is the lower transit)
+        rows, cols = np.nonzero((hour_angle[:, :-1] < 0) & (hour_angle[:, 1:] >= 0))
+        if rows.size:
+            times = self._refine(rows, jds[cols], jds[cols + 1], hour_angle[rows, cols], hour_angle[rows, cols + 1], 2, 0.0)
+            altitudes = self.horizontal(rows, times)[0]
+            for row, t, a in zip(rows.tolist(), times.tolist(), altitudes.tolist()):
+                events[row].append((t, {"type": "transit", "altitude": round(a, 2)}))
+        for body in events:
+            body.sort(key=lambda item: item[0])
+            for t, event in body:
+                event["time"] = jd_to_iso(t)
+        return [[event for _, event in body] for body in events]
+
+
+def _magnitudes(names, jd):
+    return {name: round(swe.pheno_ut(jd, SKY_BODIES[name], swe.FLG_MOSEPH)[4], 2) for name in names}
+
+
+def sky_chunks(lat, lon, start, end, step_minutes=5, bodies=None, chunk=CHUNK_SAMPLES):
+    """
+    Yield the sky from (lat, lon) between two naive UTC datetimes (end
+    inclusive when it falls on the grid) as dicts of up to chunk samples:
+    {"times": [...], "bodies": {name: {"alt", "az", "visible", "events"}}}.
+    A body's events are the rises, sets and transits between the chunk's
+    first and last sample.
+    """
+    names = list(bodies or SKY_BODIES)
+    step = datetime.timedelta(minutes=step_minutes)
+    count = int((end - start) / step) + 1
+    jd_start = datetime_to_jd(start)
+    step_days = step_minutes / 1440.0
+    # The Sun is always modelled because planet visibility depends on twilight
+    modelled = list(dict.fromkeys(["Sun"] + names))
+    model = SkyModel(lat, lon, jd_start, jd_start + (count - 1) * step_days, modelled)
+    rows = np.array([modelled.index(name) for name in names])[:, None]
+    needs_dark = np.array([name not in HORIZON for name in names])[:, None]
+    base = np.datetime64(start.replace(microsecond=0), "s")
+    for first in range(0, count, chunk):
+        # One sample of overlap with the previous chunk so crossings on the boundary are found
+        index = np.arange(max(first - 1, 0), min(first + chunk, count))
+        jds = jd_start + index * step_days
+        skip = 1 if first else 0
+        alt, az, hour_angle = model.horizontal(np.arange(len(modelled))[:, None], jds[None, :])
+        events = model.events(jds, alt, hour_angle)
+        dark = alt[0] < TWILIGHT_ALTITUDE
+        alt, az, hour_angle = alt[rows[:, 0]], az[rows[:, 0]], hour_angle[rows[:, 0]]
+        visible = (alt > model.horizon[rows]) & (dark | ~needs_dark)
+        alt_lists = np.round(alt[:, skip:], 2).tolist()
+        az_lists = np.round(az[:, skip:], 2).tolist()
+        visible_lists = visible[:, skip:].tolist()
+        tracks = {
+            name: {"alt": alt_lists[i], "az": az_lists[i], "visible": visible_lists[i], "events": events[modelled.index(name)]}
+            for i, name in enumerate(names)
+        }
+        times = np.datetime_as_string(base + index[skip:] * np.timedelta64(step_minutes * 60, "s"), unit="s")
+        yield {"times": [t + "Z" for t in times.tolist()], "bodies": tracks}
+
+
+def _local(value, zone):
+    """Naive UTC datetime for an ISO date-time; naive input is local time in zone"""
+    dt = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        return local_to_utc(dt, zone)[0]
+    return dt.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def _night(lat, lon, date, zone):
+    """(sunset, next sunrise) as naive UTC datetimes for a local date; 18:00-06:00 where the Sun does not set/rise"""
+    noon = local_to_utc(datetime.datetime.combine(date, datetime.time(12)), zone)[0]
+    jd = datetime_to_jd(noon)
+    geopos = (lon, lat, 0.0)
+    res_set, sunset = swe.rise_trans(jd, swe.SUN, swe.CALC_SET, geopos, 0.0, 0.0, swe.FLG_MOSEPH)
+    if res_set == 0:
+        res_rise, sunrise = swe.rise_trans(sunset[0], swe.SUN, swe.CALC_RISE, geopos, 0.0, 0.0, swe.FLG_MOSEPH)
+        if res_rise == 0:
+            return (jd_to_datetime(sunset[0]).replace(tzinfo=None), jd_to_datetime(sunrise[0]).replace(tzinfo=None))
+    return noon + datetime.timedelta(hours=6), noon + datetime.timedelta(hours=18)
+
+
+def sky_window(lat, lon, start=None, end=None, night=None, hours=None, timezone=None, place=None):
+    """
+    (start, end, zone, source) of the requested window as naive UTC datetimes.
+    start/end are ISO date-times (naive = local time at the place); night is a
+    local YYYY-MM-DD and means sunset to the next sunrise, which is also the
+    default (tonight). hours sets the length from start.
+    """
+    zone, source = resolve_zone(lat, lon, timezone, place)
+    if start:
+        start_utc = _local(start, zone)
+        if end:
+            end_utc = _local(end, zone)
+        else:
+            end_utc = start_utc + datetime.timedelta(hours=hours or 12)
+    else:
+        date = datetime.date.fromisoformat(night) if night else datetime.datetime.now(pytz.timezone(zone)).date()
+        start_utc, end_utc = _night(lat, lon, date, zone)
+        if hours:
+            end_utc = start_utc + datetime.timedelta(hours=hours)
+    if end_utc <= start_utc:
+        raise ValueError("end must be after start")
+    return start_utc, end_utc, zone, source
+
+
+def check_grid(start, end, step_minutes, max_samples):
+    """Number of samples of the grid; ValueError if the step or size is out of bounds"""
+    if not MIN_STEP_MINUTES <= step_minutes <= MAX_STEP_MINUTES:
+        raise ValueError(f"step must be between {MIN_STEP_MINUTES} and {MAX_STEP_MINUTES} minutes")
+    count = int((end - start) / datetime.timedelta(minutes=step_minutes)) + 1
+    if count > max_samples:
+        raise ValueError(f"{count} samples requested; the limit is {max_samples} "
+                         f"(use a larger step{', or format=ndjson' if max_samples < MAX_SAMPLES else ''})")
+    return count
+
+
+def parse_bodies(spec):
+    """Body names from a comma-separated list (None for all); ValueError for an unknown body"""
+    if not spec:
+        return None
+    names = [name.strip().title() for name in spec.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SKY_BODIES]
+    if unknown:
+        raise ValueError(f"Unknown body(ies) {unknown}. Supported: {', '.join(SKY_BODIES)}")
+    return list(dict.fromkeys(names))
+
+
+def sky_header(lat, lon, start, end, step_minutes, bodies, zone, source):
+    names = list(bodies or SKY_BODIES)
+    mid = datetime_to_jd(start + (end - start) / 2)
+    return {
+        "location": {"lat": lat, "lon": lon, "timezone": zone, "timezone_source": source},
+        "start": start.isoformat() + "Z",
+        "end": end.isoformat() + "Z",
+        "step_minutes": step_minutes,
+        "bodies": names,
+        "magnitudes": _magnitudes(names, mid),
+    }
+
+
+def sky_view(lat, lon, start, end, step_minutes=5, bodies=None, zone="UTC", source="request"):
+    """Header plus the whole grid in one dict (at most MAX_JSON_SAMPLES samples)"""
+    check_grid(start, end, step_minutes, MAX_JSON_SAMPLES)
+    view = sky_header(lat, lon, start, end, step_minutes, bodies, zone, source)
+    view.update(next(sky_chunks(lat, lon, start, end, step_minutes, bodies, chunk=MAX_JSON_SAMPLES)))
+    return view
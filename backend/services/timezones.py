@@ -0,0 +1,199 @@
+"""
+Birth time -> UTC, with the IANA zone resolved from coordinates.
+
+Coordinates are looked up in the zone-boundary polygons of timezonefinder
+(built from the timezone-boundary-builder / OpenStreetMap data, with Etc/GMT
+zones over the oceans), so a point resolves to the zone it actually lies in,
+even a few km from a border. A zone given with the request, or the zone of a
+place resolved by name, is used as is.
+
+Without timezonefinder installed the index falls back to a 1-degree grid over
+the gazetteer's places, each of which carries its IANA zone. That only
+answers when the nearest place is close (MAX_PLACE_DISTANCE) and no place in
+another zone is nearly as close; otherwise it raises ValueError asking for an
+explicit timezone rather than guessing.
+
+Offsets come from the tz database via pytz, so DST and historical rules
+(e.g. India's +5:21 Madras time and +6:30 war time) are applied. Both the
+coordinate lookup and the (zone, local time) -> offset step are memoised so
+bulk jobs with repeated places and times pay for them once.
+"""
+import functools
+import math
+import threading
+
+import numpy as np
+import pytz
+
+from services.gazetteer import get_gazetteer
+
+try:
+    from timezonefinder import TimezoneFinder
+except ImportError:  # falls back to the nearest-place grid
+    TimezoneFinder = None
+
+MAX_RING = 5
+# Nearest-place fallback: degrees of arc (~55 km), and how much closer than any other zone's place it must be
+MAX_PLACE_DISTANCE = 0.5
+AMBIGUITY_RATIO = 2.0
+GRID_COLUMNS = 360
+GRID_CELLS = 180 * GRID_COLUMNS
+
+
+# Cell offsets of the (2 * MAX_RING + 1)^2 block searched around a cell, and the ring each lies on
+_DR, _DC = [a.ravel() for a in np.mgrid[-MAX_RING:MAX_RING + 1, -MAX_RING:MAX_RING + 1]]
+_RING = np.maximum(np.abs(_DR), np.abs(_DC))
+
+
+class ZoneGrid:
+    """Places bucketed by 1-degree cell (CSR layout: rows of cell c are order[starts[c]:starts[c + 1]])"""
+
+    def __init__(self, lat, lon, zone, zone_names):
+        self.lat = np.asarray(lat, dtype=float)
+        self.lon = np.asarray(lon, dtype=float)
+        self.zone = np.asarray(zone)
+        self.zone_names = zone_names
+        cells = self._cell(np.floor(self.lat).astype(int), np.floor(self.lon).astype(int))
+        self.order = np.argsort(cells, kind="stable")
+        self.starts = np.searchsorted(cells[self.order], np.arange(GRID_CELLS + 1))
+
+    @staticmethod
+    def _cell(row, col):
+        return (np.clip(row + 90, 0, 179)) * GRID_COLUMNS + (col + 180) % GRID_COLUMNS
+
+    def _candidates(self, row, col):
+        """Place rows a nearest-place search from cell (row, col) has to look at, or None"""
+        rows = row + _DR
+        valid = (rows >= -90) & (rows <= 89)
+        cells = self._cell(rows[valid], col + _DC[valid])
+        rings = _RING[valid]
+        starts, ends = self.starts[cells], self.starts[cells + 1]
+        occupied = ends > starts
+        if not occupied.any():
+            return None
+        # The nearest place can sit one ring further out than the first hit
+        keep = occupied & (rings <= rings[occupied].min() + 1)
+        return np.concatenate([self.order[s:e] for s, e in zip(starts[keep], ends[keep])])
+
+    def nearest(self, lat, lon, rows=None):
+        """(row, distance in degrees of arc) of the nearest place within MAX_RING cells, or None"""
+        if rows is None:
+            rows = self._candidates(math.floor(lat), math.floor(lon))
+            if rows is None:
+                return None
+        dist = self._distances(lat, lon, rows)
+        best = int(np.argmin(dist))
+        return int(rows[best]), float(dist[best])
+
+    def _distances(self, lat, lon, rows):
+        dlat = self.lat[rows] - lat
+        dlon = (self.lon[rows] - lon + 180.0) % 360.0 - 180.0
+        return np.hypot(dlat, dlon * math.cos(math.radians(lat)))
+
+    def zone_for(self, lat, lon):
+        """
+        (zone name, source) for a coordinate, from the nearest place. Raises
+        ValueError when no place is within MAX_PLACE_DISTANCE or a place in
+        another zone is nearly as close, so a border or empty region is never
+        guessed.
+        """
+        rows = self._candidates(math.floor(lat), math.floor(lon))
+        if rows is not None:
+            dist = self._distances(lat, lon, rows)
+            best = int(np.argmin(dist))
+            zone = self.zone[rows[best]]
+            others = dist[self.zone[rows] != zone]
+            if dist[best] <= MAX_PLACE_DISTANCE and (not others.size or others.min() > AMBIGUITY_RATIO * dist[best]):
+                return self.zone_names[int(zone)], "nearest_place"
+        raise ValueError(f"Unknown time zone at {lat:.4f}, {lon:.4f}; pass timezone (an IANA name such as Asia/Kolkata)")
+
+
+_grid = None
+_grid_lock = threading.Lock()
+
+
+def get_zone_grid():
+    global _grid
+    with _grid_lock:
+        if _grid is None:
+            gazetteer = get_gazetteer()
+            _grid = ZoneGrid(gazetteer.lat, gazetteer.lon, gazetteer.zone, gazetteer.zones)
+        return _grid
+
+
+_finder = None
+_finder_lock = threading.Lock()
+
+
+def _zone_at(lat, lon):
+    """Zone of the boundary polygon containing the coordinate, or None (no polygon, or no timezonefinder)"""
+    global _finder
+    if TimezoneFinder is None:
+        return None
+    # One shared finder; its lookups are not documented as thread-safe
+    with _finder_lock:
+        if _finder is None:
+            _finder = TimezoneFinder()
+        return _finder.timezone_at(lng=lon, lat=lat)
+
+
+@functools.lru_cache(maxsize=65536)
+def zone_for_coordinates(lat, lon):
+    zone = _zone_at(lat, lon)
+    if zone is not None:
+        return zone, "boundaries"
+    return get_zone_grid().zone_for(lat, lon)
+
+
+def resolve_zone(lat, lon, timezone=None, place=None):
+    """
+    (zone name, source) for a birth: an explicit IANA name wins, then the zone
+    of a place resolved by name, then the coordinate index.
+    """
+    if timezone:
+        try:
+            return pytz.timezone(timezone).zone, "request"
+        except pytz.UnknownTimeZoneError:
+            raise ValueError(f"Unknown timezone '{timezone}'")
+    if place is not None and place.get("timezone"):
+        return place["timezone"], "place"
+    return zone_for_coordinates(lat, lon)
+
+
+@functools.lru_cache(maxsize=65536)
+def utc_offset(zone, local):
+    """
+    (UTC offset, note) for a naive local datetime in zone. A time skipped by a
+    DST change is read with the pre-change offset and one that occurs twice
+    with the standard-time offset; note says which, else it is None.
+    """
+    tz = pytz.timezone(zone)
+    try:
+        return tz.localize(local, is_dst=None).utcoffset(), None
+    except pytz.NonExistentTimeError:
+        return tz.localize(local, is_dst=False).utcoffset(), "nonexistent"
+    except pytz.AmbiguousTimeError:
+        return tz.localize(local, is_dst=False).utcoffset(), "ambiguous"
+
+
+def format_offset(offset):
+    seconds = int(offset.total_seconds())
+    sign = "-" if seconds < 0 else "+"
+    hours, rem = divmod(abs(seconds), 3600)
+    minutes, seconds = divmod(rem, 60)
+    return f"{sign}{hours:02d}:{minutes:02d}" + (f":{seconds:02d}" if seconds else "")
+
+
+def local_to_utc(local, zone):
+    """(naive UTC datetime, offset, note) for a naive local datetime"""
+    offset, note = utc_offset(zone, local)
+    return local - offset, offset, note
+
+
+def cache_stats():
+    zones = zone_for_coordinates.cache_info()
+    offsets = utc_offset.cache_info()
+    return {
+        "zone_lookups": {"hits": zones.hits, "misses": zones.misses, "entries": zones.currsize},
+        "offset_lookups": {"hits": offsets.hits, "misses": offsets.misses, "entries": offsets.currsize},
+    }
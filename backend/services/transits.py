@@ -0,0 +1,187 @@
+"""
+Transit (Gochar) events: sign ingresses, nakshatra ingresses and stations.
+
+Event times are found by bracketing and root-finding rather than by stepping
+day by day: each body is sampled on a coarse grid (spaced so that its speed
+cannot change sign twice and it cannot move 180° between samples), stations
+are solved for as roots of the sidereal speed, and between stations the
+longitude is monotonic so every sign/nakshatra boundary it passes is crossed
+exactly once and can be solved for inside its grid interval.
+"""
+import datetime
+import functools
+
+import numpy as np
+import swisseph as swe
+
+from services.chart_engine import FLAGS, ensure_configured
+from services.ephemeris import calc_lon_speed
+from services.vedic import (
+    GRAHAS, NAKSHATRAS, NAKSHATRA_SPAN, SIGN_SPAN, ZODIAC_SIGNS, date_to_jd, jd_to_iso, nakshatra_of, sign_of,
+)
+
+# Grid spacing in days; shorter than half the shortest retrograde/direct arc of each body
+SAMPLE_DAYS = {
+    "Sun": 5.0, "Moon": 1.0, "Mercury": 5.0, "Venus": 5.0, "Mars": 5.0,
+    "Jupiter": 10.0, "Saturn": 10.0, "Rahu": 10.0, "Ketu": 10.0,
+}
+# Bodies whose true motion reverses; the Sun and Moon never station and mean nodes are always retrograde
+STATIONING = {"Mercury", "Venus", "Mars", "Jupiter", "Saturn"}
+
+EVENT_KINDS = ("sign", "nakshatra", "station")
+TOLERANCE_DAYS = 1e-6  # ~0.1 s
+MAX_RANGE_DAYS = 3660
+
+
+def _lon_speed(name, jd):
+    if name == "Ketu":
+        lon, speed = calc_lon_speed(jd, swe.MEAN_NODE, FLAGS)
+        return (lon + 180.0) % 360.0, speed
+    return calc_lon_speed(jd, GRAHAS[name], FLAGS)
+
+
+def solve_bracketed(f, a, b, fa, fb):
+    """Illinois (modified regula falsi) root of f on [a, b] where fa, fb have opposite signs"""
+    side = 0
+    for _ in range(100):
+        c = (a * fb - b * fa) / (fb - fa)
+        if b - a < TOLERANCE_DAYS:
+            return c
+        fc = f(c)
+        if fc == 0.0:
+            return c
+        if (fc > 0) == (fb > 0):
+            b, fb = c, fc
+            if side == -1:
+                fa /= 2.0
+            side = -1
+        else:
+            a, fa = c, fc
+            if side == 1:
+                fb /= 2.0
+            side = 1
+    return (a + b) / 2.0
+
+
+def _body_events(name, jd_start, jd_end, kinds):
+    step = SAMPLE_DAYS[name]
+    n = max(2, int(np.ceil((jd_end - jd_start) / step)) + 1)
+    grid = np.linspace(jd_start, jd_end, n)
+    samples = [_lon_speed(name, jd) for jd in grid]
+    lons = np.unwrap(np.array([s[0] for s in samples]), period=360.0)
+    speeds = np.array([s[1] for s in samples])
+    events = []
+
+    # Stations split the grid into monotonic pieces
+    cuts = []
+    if name in STATIONING:
+        for i in range(n - 1):
+            if (speeds[i] > 0) != (speeds[i + 1] > 0):
+                jd = solve_bracketed(lambda t: _lon_speed(name, t)[1], grid[i], grid[i + 1], speeds[i], speeds[i + 1])
+                lon = _lon_speed(name, jd)[0]
+                cuts.append((i, jd, lon))
+                if "station" in kinds:
+                    events.append({
+                        "type": "station",
+                        "planet": name,
+                        "jd": jd,
+                        "station": "retrograde" if speeds[i] > 0 else "direct",
+                        "sign": sign_of(lon),
+                        "lon": lon,
+                    })
+
+    # Interval endpoints (unwrapped lon) between which the motion is monotonic
+    intervals = []
+    cut_at = {i: (jd, lon) for i, jd, lon in cuts}
+    for i in range(n - 1):
+        a, la, b, lb = grid[i], lons[i], grid[i + 1], lons[i + 1]
+        if i in cut_at:
+            jd, lon = cut_at[i]
+            lc = la + ((lon - la + 180.0) % 360.0 - 180.0)
+            intervals.extend([(a, la, jd, lc), (jd, lc, b, lb)])
+        else:
+            intervals.append((a, la, b, lb))
+
+    for kind, span, names in (("sign", SIGN_SPAN, ZODIAC_SIGNS), ("nakshatra", NAKSHATRA_SPAN, NAKSHATRAS)):
+        if kind not in kinds:
+            continue
+        for a, la, b, lb in intervals:
+            lo, hi = min(la, lb), max(la, lb)
+            k_first, k_last = int(np.floor(lo / span)) + 1, int(np.floor(hi / span))
+            for k in range(k_first, k_last + 1):
+                boundary = k * span
+                if boundary <= lo or boundary >= hi:
+                    continue
+
+                def f(t, la=la, boundary=boundary):
+                    lon = _lon_speed(name, t)[0]
+                    return la + ((lon - la + 180.0) % 360.0 - 180.0) - boundary
+
+                jd = solve_bracketed(f, a, b, la - boundary, lb - boundary)
+                forward = lb > la
+                entered = k if forward else k - 1
+                left = k - 1 if forward else k
+                events.append({
+                    "type": f"{kind}_ingress",
+                    "planet": name,
+                    "jd": jd,
+                    "from": names[left % len(names)],
+                    "to": names[entered % len(names)],
+                    "retrograde": not forward,
+                })
+    return events
+
+
+@functools.lru_cache(maxsize=256)
+def _events_for_range(start, end, bodies, kinds):
+    ensure_configured()
+    jd_start, jd_end = date_to_jd(start), date_to_jd(end)
+    events = []
+    for name in bodies:
+        events.extend(_body_events(name, jd_start, jd_end, kinds))
+    events = [e for e in events if jd_start <= e["jd"] < jd_end]
+    events.sort(key=lambda e: e["jd"])
+    for e in events:
+        e["jd"] = float(e["jd"])
+        e["time"] = jd_to_iso(e["jd"])
+    return tuple(events)
+
+
+def find_transit_events(start, end, bodies=None, kinds=EVENT_KINDS):
+    """
+    Every sign ingress, nakshatra ingress and station of the grahas in
+    [start, end) (datetime.date, 00:00 UTC), sorted by time.
+
+    Results are cached per (range, bodies, kinds), so repeated queries for the
+    same window (the prediction prompt, the frontend) are free.
+    """
+    if end <= start:
+        raise ValueError("end must be after start")
+    if (end - start).days > MAX_RANGE_DAYS:
+        raise ValueError(f"range is limited to {MAX_RANGE_DAYS} days")
+    bodies = tuple(bodies or GRAHAS)
+    unknown = [b for b in bodies if b not in GRAHAS]
+    if unknown:
+        raise ValueError(f"unknown planets: {', '.join(unknown)}")
+    kinds = tuple(k for k in EVENT_KINDS if k in kinds)
+    return [dict(e) for e in _events_for_range(start, end, bodies, kinds)]
+
+
+def describe_transits(date):
+    """One-paragraph transit summary for an LLM prompt: positions at noon UTC plus the day's events"""
+    ensure_configured()
+    jd_noon = date_to_jd(date) + 0.5
+    positions = []
+    for name in GRAHAS:
+        lon, speed = _lon_speed(name, jd_noon)
+        retro = " (retrograde)" if name in STATIONING and speed < 0 else ""
+        positions.append(f"{name} in {sign_of(lon)} ({nakshatra_of(lon)}){retro}")
+
+    lines = ["Sidereal (Lahiri) positions at 12:00 UTC: " + ", ".join(positions) + "."]
+    for e in find_transit_events(date, date + datetime.timedelta(days=1)):
+        if e["type"] == "station":
+            lines.append(f"{e['planet']} stations {e['station']} in {e['sign']} at {e['time']}.")
+        else:
+            kind = "sign" if e["type"] == "sign_ingress" else "nakshatra"
+            lines.append(f"{e['planet']} enters {kind} {e['to']} at {e['time']}.")
+    return " ".join(lines)
@@ -0,0 +1,125 @@
+"""
+Divisional (varga) charts of the Shodashavarga, per Parashara.
+
+A varga splits each 30° sign into N parts and maps (sign, part) to a sign.
+Every varga here is tabulated once as a flat array of 12 * N result signs
+indexed by floor(longitude * N / 30), so the Trimsamsa's unequal parts use a
+1° grid (N = 30). All requested vargas are then read for a whole array of
+longitudes (charts x bodies) with a single numpy gather: the tables are
+concatenated and each varga's index is offset into its own slice, so the
+lookup has no Python loop per chart, body or varga.
+"""
+import numpy as np
+
+from services.vedic import ZODIAC_SIGNS
+
+
+def _by_part(parts, first, step=1):
+    """Table for a varga whose part p of sign s falls in sign first(s) + step(s) * p"""
+    table = np.empty((12, parts), dtype=np.int64)
+    for sign in range(12):
+        table[sign] = (first(sign) + (step(sign) if callable(step) else step) * np.arange(parts)) % 12
+    return table
+
+
+def _odd(sign):
+    # Aries (index 0) is an odd sign
+    return sign % 2 == 0
+
+
+def _modality(sign, movable, fixed, dual):
+    return (movable, fixed, dual)[sign % 3]
+
+
+def _trimsamsa():
+    # Unequal parts (degrees) and lords: Mars, Saturn, Jupiter, Mercury, Venus in odd signs, reversed in even
+    odd = [(5, 0), (5, 10), (8, 8), (7, 2), (5, 6)]     # Aries, Aquarius, Sagittarius, Gemini, Libra
+    even = [(5, 1), (7, 5), (8, 11), (5, 9), (5, 7)]    # Taurus, Virgo, Pisces, Capricorn, Scorpio
+    table = np.empty((12, 30), dtype=np.int64)
+    for sign in range(12):
+        table[sign] = np.repeat([s for _, s in (odd if _odd(sign) else even)],
+                                [d for d, _ in (odd if _odd(sign) else even)])
+    return table
+
+
+# code -> (name, table of shape (12, parts))
+VARGAS = {
+    "D1": ("Rasi", _by_part(1, lambda s: s)),
+    "D2": ("Hora", _by_part(2, lambda s: 4 if _odd(s) else 3, lambda s: -1 if _odd(s) else 1)),
+    "D3": ("Drekkana", _by_part(3, lambda s: s, 4)),
+    "D4": ("Chaturthamsa", _by_part(4, lambda s: s, 3)),
+    "D7": ("Saptamsa", _by_part(7, lambda s: s if _odd(s) else s + 6)),
+    "D9": ("Navamsa", _by_part(9, lambda s: s + _modality(s, 0, 8, 4))),
+    "D10": ("Dashamsa", _by_part(10, lambda s: s if _odd(s) else s + 8)),
+    "D12": ("Dwadashamsa", _by_part(12, lambda s: s)),
+    "D16": ("Shodashamsa", _by_part(16, lambda s: _modality(s, 0, 4, 8))),
+    "D20": ("Vimshamsa", _by_part(20, lambda s: _modality(s, 0, 8, 4))),
+    "D24": ("Chaturvimshamsa", _by_part(24, lambda s: 4 if _odd(s) else 3)),
+    "D27": ("Saptavimshamsa", _by_part(27, lambda s: 3 * (s % 4))),
+    "D30": ("Trimsamsa", _trimsamsa()),
+    "D40": ("Khavedamsa", _by_part(40, lambda s: 0 if _odd(s) else 6)),
+    "D45": ("Akshavedamsa", _by_part(45, lambda s: _modality(s, 0, 4, 8))),
+    "D60": ("Shashtiamsa", _by_part(60, lambda s: s)),
+}
+
+_SIGN_NAMES = np.array(ZODIAC_SIGNS, dtype=object)
+_PARTS = {code: table.shape[1] for code, (_, table) in VARGAS.items()}
+_FLAT = np.concatenate([table.ravel() for _, table in VARGAS.values()])
+_OFFSETS = dict(zip(VARGAS, np.cumsum([0] + [table.size for _, table in VARGAS.values()])[:-1].tolist()))
+
+
+def parse_vargas(spec):
+    """
+    Varga codes from "D9,D10", "9,10" or "all", in Shodashavarga order and
+    without duplicates; () for an empty spec. ValueError for an unknown code.
+    """
+    if not spec:
+        return ()
+    items = spec if isinstance(spec, (list, tuple)) else str(spec).split(",")
+    wanted = set()
+    for item in items:
+        code = str(item).strip().upper()
+        if not code:
+            continue
+        if code == "ALL":
+            return tuple(VARGAS)
+        if not code.startswith("D"):
+            code = "D" + code
+        if code not in VARGAS:
+            raise ValueError(f"Unknown varga '{item}'. Supported: {', '.join(VARGAS)}")
+        wanted.add(code)
+    return tuple(code for code in VARGAS if code in wanted)
+
+
+def varga_signs(lons, codes):
+    """
+    Sign indices (0 = Aries) of every longitude in every varga.
+
+    lons: array of sidereal longitudes, any shape (e.g. charts x bodies).
+    Returns an int array of shape lons.shape + (len(codes),).
+    """
+    lons = np.mod(np.asarray(lons, dtype=float), 360.0)
+    parts = np.array([_PARTS[code] for code in codes], dtype=float)
+    sizes = (12 * parts).astype(np.int64)
+    offsets = np.array([_OFFSETS[code] for code in codes], dtype=np.int64)
+    index = np.floor(lons[..., None] * (parts / 30.0)).astype(np.int64)
+    # % size guards the 360.0 that mod() can round up to
+    return _FLAT[index % sizes + offsets]
+
+
+def varga_charts(lons, names, codes):
+    """
+    {code: {"name", "ascendant": sign, "planets": {name: sign}}} per chart.
+
+    lons: (charts, bodies) longitudes whose last column is the ascendant;
+    names: the names of the other columns. Houses are whole-sign from the
+    varga ascendant, so they are left to the caller.
+    """
+    # (charts, vargas, bodies) sign names, converted to Python lists in one go
+    signs = _SIGN_NAMES[varga_signs(lons, codes)].transpose(0, 2, 1).tolist()
+    titles = [VARGAS[code][0] for code in codes]
+    return [
+        {code: {"name": title, "ascendant": row[-1], "planets": dict(zip(names, row))}
+         for code, title, row in zip(codes, titles, chart)}
+        for chart in signs
+    ]
@@ -0,0 +1,52 @@
+"""
+Shared Vedic reference data and Julian-day helpers.
+"""
+import datetime
+
+import swisseph as swe
+
+ZODIAC_SIGNS = ["Aries", "Taurus", "Gemini", "Cancer", "Leo", "Virgo", "Libra", "Scorpio", "Sagittarius", "Capricorn", "Aquarius", "Pisces"]
+
+NAKSHATRAS = [
+    "Ashwini", "Bharani", "Krittika", "Rohini", "Mrigashira", "Ardra", "Punarvasu", "Pushya", "Ashlesha",
+    "Magha", "Purva Phalguni", "Uttara Phalguni", "Hasta", "Chitra", "Swati", "Vishakha", "Anuradha", "Jyeshtha",
+    "Mula", "Purva Ashadha", "Uttara Ashadha", "Shravana", "Dhanishta", "Shatabhisha", "Purva Bhadrapada", "Uttara Bhadrapada", "Revati",
+]
+
+SIGN_SPAN = 30.0
+NAKSHATRA_SPAN = 360.0 / 27  # 13°20'
+PADA_SPAN = NAKSHATRA_SPAN / 4  # 3°20'
+
+# The nine grahas; Ketu has no swisseph id and is derived from Rahu (mean node + 180°)
+GRAHAS = {
+    "Sun": swe.SUN, "Moon": swe.MOON, "Mars": swe.MARS, "Mercury": swe.MERCURY,
+    "Jupiter": swe.JUPITER, "Venus": swe.VENUS, "Saturn": swe.SATURN, "Rahu": swe.MEAN_NODE, "Ketu": None,
+}
+
+
+def sign_of(lon):
+    return ZODIAC_SIGNS[int(lon // SIGN_SPAN) % 12]
+
+
+def nakshatra_of(lon):
+    return NAKSHATRAS[int(lon // NAKSHATRA_SPAN) % 27]
+
+
+def datetime_to_jd(dt_utc):
+    return swe.julday(dt_utc.year, dt_utc.month, dt_utc.day, dt_utc.hour + dt_utc.minute/60.0 + dt_utc.second/3600.0)
+
+
+def date_to_jd(date):
+    """Julian day at 00:00 UTC of a datetime.date"""
+    return swe.julday(date.year, date.month, date.day, 0.0)
+
+
+def jd_to_datetime(jd):
+    """UTC datetime (second precision) for a UT Julian day"""
+    year, month, day, hours = swe.revjul(jd)
+    base = datetime.datetime(year, month, day, tzinfo=datetime.timezone.utc)
+    return base + datetime.timedelta(seconds=round(hours * 3600.0))
+
+
+def jd_to_iso(jd):
+    return jd_to_datetime(jd).isoformat().replace("+00:00", "Z")